@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import re
+import time
+import hashlib
+from typing import Any, List, Optional
+import numpy as np
+from langchain.schema.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from rag.rag_transcription import TranscriptionBackend
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic offline embeddings: hashed bag of words, L2-normalized"""
+
+    def __init__(self, size: int = 256):
+        self.size = size
+        self.model = f"hashing-{size}"
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for token in re.findall(r"[a-z0-9]+", text.lower()):
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.size
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+class StubChatModel(BaseChatModel):
+    """Offline chat model with a fixed answer and configurable latency"""
+
+    answer: str = "The catalog covers this in the admissions section. Thanks for asking!"
+    first_token_latency: float = 0.05
+    token_latency: float = 0.005
+    # Prompt processing time per prompt token, added to the first token latency
+    prompt_token_latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        prompt_tokens = sum(self.get_num_tokens(str(message.content)) for message in messages)
+        time.sleep(self.first_token_latency + self.prompt_token_latency * prompt_tokens)
+        for index, word in enumerate(self.answer.split(" ")):
+            if index:
+                time.sleep(self.token_latency)
+            if run_manager:
+                run_manager.on_llm_new_token(word + " ")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    def get_num_tokens(self, text: str) -> int:
+        return len(text.split())
+
+class FakeTranscriptionBackend(TranscriptionBackend):
+    """Offline transcription whose latency grows with the audio size, like a remote API"""
+
+    def __init__(self, latency: float = 0.05, seconds_per_mb: float = 0.1):
+        self.latency = latency
+        self.seconds_per_mb = seconds_per_mb
+
+    def transcribe(self, audio: bytes, filename: str) -> str:
+        time.sleep(self.latency + self.seconds_per_mb * len(audio) / (1024 * 1024))
+        return f"Transcript of {filename} with {len(audio)} bytes of audio."
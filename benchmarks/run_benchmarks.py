@@ -0,0 +1,596 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Offline performance benchmarks for ingestion, retrieval and answering
+
+Uses the real files in data/sources with deterministic hashing embeddings
+and a stub LLM, so no network access or API key is needed. URL and
+YouTube sources need the network and are skipped.
+
+    python -m benchmarks.run_benchmarks --output benchmarks/results/latest.json \
+        --baseline benchmarks/results/baseline.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+from typing import Dict, List
+import numpy as np
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rag import RAGLoader, RAGVectorStore, RAGChain, RAGService
+from rag.rag_transcription import SegmentedTranscriber
+from rag.rag_context import ContextBuilder
+from rag.rag_search import SEARCH_TYPES, mmr_select
+from rag.rag_filters import build_where
+from rag.rag_session import SessionRegistry
+from rag.rag_metrics import metrics
+from benchmarks.fakes import HashingEmbeddings, StubChatModel, FakeTranscriptionBackend
+
+QUERIES = [
+    "How do I apply for student health insurance?",
+    "What are the admission requirements for graduate programs?",
+    "What is the tuition for the MBA program?",
+    "Which courses are required for the computer science degree?",
+    "What is the refund policy if I withdraw from a course?",
+    "How many units do international students need each term?",
+    "What are the prerequisites for CS 570?",
+    "How do I request an I-20 form?",
+    "What is the academic probation policy?",
+    "When is the deadline to add or drop a class?",
+]
+
+def percentile(values: List[float], pct: float) -> float:
+    """Linear interpolation percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * pct / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def latency_summary(samples: List[float]) -> Dict:
+    """p50/p95/p99 and mean of latency samples, in milliseconds"""
+    return {
+        "count": len(samples),
+        "mean_ms": round(1000 * sum(samples) / len(samples), 3) if samples else 0.0,
+        "p50_ms": round(1000 * percentile(samples, 50), 3),
+        "p95_ms": round(1000 * percentile(samples, 95), 3),
+        "p99_ms": round(1000 * percentile(samples, 99), 3),
+    }
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def bench_ingestion(source_dir: str, workdir: str, backend: str, embedding, sources) -> Dict:
+    """Load, split, embed and persist the PDF sources"""
+    loader = RAGLoader(source_dir=source_dir, temp_dir=os.path.join(workdir, "temp"))
+    vectorstore = RAGVectorStore(
+        persist_directory=os.path.join(workdir, backend),
+        backend=backend,
+        embedding_cache_path=os.path.join(workdir, f"{backend}-cache.sqlite3"),
+        embedding=embedding
+    )
+
+    started = time.perf_counter()
+    documents = loader.load_from_sources(sources)
+    load_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    splits = vectorstore.text_splitter.split_documents(documents)
+    split_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    chunks = vectorstore.add_documents(documents)
+    vectorstore.flush()
+    index_seconds = time.perf_counter() - started
+
+    return {
+        "vectorstore": vectorstore,
+        "result": {
+            "sources": len(sources),
+            "pages": len(documents),
+            "chunks": chunks,
+            "duplicate_chunks": len(splits) - chunks,
+            "duplicate_tokens_saved": vectorstore.last_dedup_report.get("tokens_saved", 0),
+            "load_seconds": round(load_seconds, 3),
+            "split_seconds": round(split_seconds, 3),
+            "index_seconds": round(index_seconds, 3),
+            "pages_per_second": round(len(documents) / load_seconds, 1) if load_seconds else 0.0,
+            "chunks_per_second": round(len(splits) / index_seconds, 1) if index_seconds else 0.0,
+        }
+    }
+
+def bench_streaming(workdir: str, backend: str, embedding, sources) -> Dict:
+    """Stream PDF pages into a fresh index: time to first persisted vector and total"""
+    loader = RAGLoader(source_dir=workdir, temp_dir=os.path.join(workdir, "temp"))
+    vectorstore = RAGVectorStore(
+        persist_directory=os.path.join(workdir, f"{backend}-streamed"),
+        backend=backend,
+        embedding_cache_path=os.path.join(workdir, f"{backend}-streamed-cache.sqlite3"),
+        embedding=embedding
+    )
+    started = time.perf_counter()
+    first_write = []
+    write_batch = vectorstore._write_batch
+    
+    def timed_write_batch(*args):
+        if not first_write:
+            first_write.append(time.perf_counter() - started)
+        write_batch(*args)
+        
+    vectorstore._write_batch = timed_write_batch
+    chunks = sum(vectorstore.add_documents(loader.stream_source(source)) for source in sources)
+    vectorstore.flush()
+    return {
+        "chunks": chunks,
+        "pdf_workers": loader.pdf_workers,
+        "first_vector_seconds": round(first_write[0], 3) if first_write else None,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+def bench_retrieval(vectorstore: RAGVectorStore, iterations: int) -> Dict:
+    """Retrieval latency per retrieval mode"""
+    results = {}
+    for mode in ("vector", "hybrid", "lexical"):
+        chain = RAGChain(vectorstore.open(), lexical_index=vectorstore.open_lexical(),
+                         retrieval_mode=mode, llm=StubChatModel())
+        retriever = chain.get_retriever()
+        for query in QUERIES:  # warm up caches and page cache
+            retriever.get_relevant_documents(query)
+        samples = []
+        for _ in range(iterations):
+            for query in QUERIES:
+                started = time.perf_counter()
+                retriever.get_relevant_documents(query)
+                samples.append(time.perf_counter() - started)
+        results[mode] = latency_summary(samples)
+    return results
+
+def diversity(vectors: np.ndarray) -> float:
+    """Mean pairwise cosine distance of result vectors, 0 when all are identical"""
+    if len(vectors) < 2:
+        return 0.0
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    similarity = vectors @ vectors.T
+    pairs = len(vectors) * (len(vectors) - 1)
+    return float(1.0 - (similarity.sum() - np.trace(similarity)) / pairs)
+
+def bench_search_modes(vectorstore: RAGVectorStore, iterations: int, score_threshold: float = 0.6) -> Dict:
+    """Latency and result diversity per retrieval and search mode, and MMR selection cost"""
+    results = {}
+    for mode in ("vector", "hybrid"):
+        for search_type in SEARCH_TYPES:
+            chain = RAGChain(vectorstore.open(), lexical_index=vectorstore.open_lexical(), retrieval_mode=mode,
+                             llm=StubChatModel(), context_tokens=None, search_type=search_type,
+                             search_kwargs={"score_threshold": score_threshold}
+                             if search_type == "similarity_score_threshold" else None)
+            retriever = chain.get_retriever()
+            samples, diversities, pages, counts = [], [], [], []
+            for iteration in range(iterations):
+                for query in QUERIES:
+                    started = time.perf_counter()
+                    docs = retriever.get_relevant_documents(query)
+                    samples.append(time.perf_counter() - started)
+                    if iteration == 0:
+                        vectors = np.asarray(vectorstore.embedding.embed_documents([doc.page_content for doc in docs]))
+                        diversities.append(diversity(vectors))
+                        pages.append(len({(doc.metadata.get("source"), doc.metadata.get("page")) for doc in docs}))
+                        counts.append(len(docs))
+            results[f"{mode}_{search_type}"] = dict(
+                latency_summary(samples),
+                results_mean=round(sum(counts) / len(counts), 2),
+                diversity_mean=round(sum(diversities) / len(diversities), 4),
+                distinct_pages_mean=round(sum(pages) / len(pages), 2),
+            )
+
+    rng = np.random.default_rng(0)
+    for fetch_k in (20, 200):
+        candidates = rng.standard_normal((fetch_k, 1536)).astype(np.float32)
+        query = rng.standard_normal(1536).astype(np.float32)
+        timings = {}
+        for name, select in (("numpy", lambda: mmr_select(query, candidates, 10, 0.5)),
+                             ("langchain", lambda: maximal_marginal_relevance(query, candidates, 0.5, 10))):
+            started = time.perf_counter()
+            for _ in range(20):
+                select()
+            timings[f"{name}_ms"] = round(1000 * (time.perf_counter() - started) / 20, 3)
+        results[f"mmr_select_fetch_k_{fetch_k}"] = timings
+    return results
+
+# Metadata filters: where clause, and the same condition on chunk metadata for post-filtering
+FILTERS = {
+    "pages_10_20": (build_where(pages=(10, 20)), lambda metadata: 10 <= metadata.get("page", -1) <= 20),
+    "pages_0_3": (build_where(pages=(0, 3)), lambda metadata: 0 <= metadata.get("page", -1) <= 3),
+    "youtube": (build_where(source_type="YouTube"), lambda metadata: metadata.get("source_type") == "YouTube"),
+}
+
+def bench_filters(vectorstore: RAGVectorStore, iterations: int) -> Dict:
+    """Filtered vector retrieval: filtering before ranking vs dropping non-matching results of the top k"""
+    chain = RAGChain(vectorstore.open(), lexical_index=vectorstore.open_lexical(),
+                     retrieval_mode="vector", llm=StubChatModel(), context_tokens=None)
+    results = {}
+    for name, (where, matches) in [("unfiltered", (None, None))] + list(FILTERS.items()):
+        retriever = chain.get_retriever(where)
+        samples, prefiltered, postfiltered = [], [], []
+        for iteration in range(iterations):
+            for query in QUERIES:
+                started = time.perf_counter()
+                docs = retriever.get_relevant_documents(query)
+                samples.append(time.perf_counter() - started)
+                if iteration == 0:
+                    prefiltered.append(len(docs))
+                    if matches is not None:
+                        top_k = chain.get_retriever().get_relevant_documents(query)
+                        postfiltered.append(sum(1 for doc in top_k if matches(doc.metadata)))
+        results[name] = dict(latency_summary(samples), results_mean=round(sum(prefiltered) / len(prefiltered), 2))
+        if postfiltered:
+            results[name]["postfilter_results_mean"] = round(sum(postfiltered) / len(postfiltered), 2)
+            results[name]["postfilter_empty_queries"] = postfiltered.count(0)
+    return results
+
+def bench_answers(vectorstore: RAGVectorStore, llm_latency: float, iterations: int) -> Dict:
+    """End-to-end answer latency with a stub LLM"""
+    service = RAGService(vectorstore=vectorstore, llm=StubChatModel(first_token_latency=llm_latency))
+    service.initialize(load_documents=False)
+
+    cold, cached = [], []
+    for _ in range(iterations):
+        for query in QUERIES:
+            service.answer_cache.invalidate()
+            started = time.perf_counter()
+            result = service.get_answer(query, use_conversation=False, session_id="bench")
+            cold.append(time.perf_counter() - started)
+            if not result.get("source_documents"):
+                raise RuntimeError(f"Answering failed: {result.get('answer')}")
+
+            started = time.perf_counter()
+            service.get_answer(query, use_conversation=False, session_id="bench")
+            cached.append(time.perf_counter() - started)
+    service.clear_memory("bench")
+    return {"uncached": latency_summary(cold), "answer_cache_hit": latency_summary(cached)}
+
+def bench_chain_build(vectorstore: RAGVectorStore, iterations: int) -> Dict:
+    """Per-question chain setup: building the chains for every question vs reusing the cached ones"""
+    chain = RAGChain(vectorstore.open(), lexical_index=vectorstore.open_lexical(), llm=StubChatModel())
+    where = build_where(pages=(10, 20))
+    results = {}
+    for kind in ("qa", "conversational"):
+        create = getattr(chain, f"create_{kind}_chain")
+        get = getattr(chain, f"get_{kind}_chain")
+        for name, build in (("rebuilt", create), ("cached", get),
+                            ("filtered_rebuilt", lambda: create(where)), ("filtered_cached", lambda: get(where))):
+            build()
+            samples = []
+            for _ in range(iterations):
+                started = time.perf_counter()
+                build()
+                samples.append(time.perf_counter() - started)
+            results[f"{kind}_{name}"] = latency_summary(samples)
+    return results
+
+def bench_context(vectorstore: RAGVectorStore, llm_latency: float, iterations: int,
+                  prompt_token_latency: float = 0.0002) -> Dict:
+    """Context tokens and answer latency with and without the token-budgeted context builder"""
+    counter = ContextBuilder()
+    results = {}
+    for name, budget in (("plain", None), ("budgeted", ContextBuilder().max_tokens)):
+        llm = StubChatModel(first_token_latency=llm_latency, prompt_token_latency=prompt_token_latency)
+        chain = RAGChain(vectorstore.open(), lexical_index=vectorstore.open_lexical(),
+                         retrieval_mode="hybrid", llm=llm, context_tokens=budget).get_qa_chain()
+        tokens, samples = [], []
+        for _ in range(iterations):
+            for query in QUERIES:
+                started = time.perf_counter()
+                result = chain({"query": query})
+                samples.append(time.perf_counter() - started)
+                tokens.append(sum(counter.count_tokens(doc.page_content) for doc in result["source_documents"]))
+        results[name] = {
+            "context_tokens_mean": round(sum(tokens) / len(tokens), 1),
+            "context_tokens_max": max(tokens),
+            "latency": latency_summary(samples),
+        }
+    return results
+
+def counter_value(name: str) -> float:
+    """Total of a counter over all label sets"""
+    return sum(series["value"] for series in metrics.snapshot()["counters"].get(name, []))
+
+FOLLOW_UPS = ["And what about the deadline?", "Does that apply to international students?", "What does it cost?"]
+
+def bench_conversation(vectorstore: RAGVectorStore, llm_latency: float, turns: int = 40,
+                       prompt_token_latency: float = 0.0002) -> Dict:
+    """Per-turn latency over a long conversation, with unbounded and token-windowed history"""
+    answer = " ".join(["The catalog describes the requirements, fees and deadlines in detail."] * 8)
+    questions = [question for pair in zip(QUERIES, FOLLOW_UPS * len(QUERIES)) for question in pair]
+    results = {}
+    for name, history_tokens in (("unbounded", 10 ** 9), ("windowed", SessionRegistry().max_history_tokens)):
+        service = RAGService(vectorstore=vectorstore, llm=StubChatModel(
+            answer=answer, first_token_latency=llm_latency, token_latency=0.0,
+            prompt_token_latency=prompt_token_latency))
+        service.sessions = SessionRegistry(max_history_tokens=history_tokens)
+        service.initialize(load_documents=False)
+        skipped = counter_value("rag_condense_skipped_total")
+        samples = []
+        for turn in range(turns):
+            started = time.perf_counter()
+            service.get_answer(questions[turn % len(questions)], session_id="bench")
+            samples.append(time.perf_counter() - started)
+        window = max(1, turns // 8)
+        results[name] = {
+            "first_turns_mean_ms": round(1000 * sum(samples[:window]) / window, 3),
+            "last_turns_mean_ms": round(1000 * sum(samples[-window:]) / window, 3),
+            "history_tokens": service.sessions.get("bench").history_tokens,
+            "condense_skipped": counter_value("rag_condense_skipped_total") - skipped,
+        }
+    return results
+
+# Boots a service in a fresh interpreter and reports seconds until it can answer
+STARTUP_SCRIPT = """
+import sys, json, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+from rag import RAGLoader, RAGVectorStore, RAGService
+from benchmarks.fakes import HashingEmbeddings, StubChatModel
+imported = time.perf_counter()
+service = RAGService(
+    loader=RAGLoader(source_dir={source_dir!r}, temp_dir={temp_dir!r}),
+    vectorstore=RAGVectorStore(persist_directory={persist_directory!r}, backend={backend!r},
+                               embedding_cache_path={cache_path!r}, embedding=HashingEmbeddings()),
+    llm=StubChatModel(), jobs_path={jobs_path!r})
+if {mode!r} == "warm":
+    ok = service.warm_start(sync=False)
+else:
+    ok = service.sync_sources({sources!r}) and service.initialize(load_documents=False)
+ok = ok and service.ready
+answered = service.chain.get_retriever().get_relevant_documents("student health insurance") if ok else []
+print(json.dumps({{"ok": bool(ok and answered), "import_seconds": imported - started,
+                  "ready_seconds": time.perf_counter() - started}}))
+"""
+
+def bench_startup(source_dir: str, workdir: str, backend: str, sources) -> Dict:
+    """
+    Cold-to-ready time of a new process: warm start from the persisted
+    index, syncing the unchanged sources first, and ingesting into an empty index
+    """
+    persist_directory = os.path.join(workdir, f"{backend}-startup")
+    settings = dict(root=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), source_dir=source_dir,
+                    temp_dir=os.path.join(workdir, "temp"), persist_directory=persist_directory, backend=backend,
+                    cache_path=os.path.join(workdir, f"{backend}-startup-cache.sqlite3"),
+                    jobs_path=os.path.join(workdir, "startup-jobs.json"), sources=sources)
+    results = {}
+    for name, mode in (("empty_index", "sync"), ("sync_first", "sync"), ("warm", "warm")):
+        if name == "empty_index":
+            shutil.rmtree(persist_directory, ignore_errors=True)
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT.format(mode=mode, **settings)],
+                                capture_output=True, text=True, check=True).stdout
+        wall_seconds = time.perf_counter() - started
+        report = json.loads(output.strip().splitlines()[-1])
+        results[name] = {
+            "ok": report["ok"],
+            "import_seconds": round(report["import_seconds"], 3),
+            "ready_seconds": round(report["ready_seconds"], 3),
+            "process_seconds": round(wall_seconds, 3),
+        }
+    return results
+
+def synthetic_lecture(path: str, minutes: float, frame_rate: int = 8000):
+    """Write a WAV of noise bursts separated by one second pauses"""
+    from pydub import AudioSegment
+
+    rng = np.random.default_rng(0)
+    samples = (rng.standard_normal(int(minutes * 60 * frame_rate)) * 3000).astype(np.int16)
+    for start in range(0, len(samples), 37 * frame_rate):
+        samples[start:start + frame_rate] = 0
+    AudioSegment(samples.tobytes(), sample_width=2, frame_rate=frame_rate, channels=1).export(path, format="wav")
+
+def bench_transcription(workdir: str, minutes: float, workers: List[int]) -> Dict:
+    """Wall-clock time to transcribe a long recording per concurrency level"""
+    path = os.path.join(workdir, "lecture.wav")
+    synthetic_lecture(path, minutes)
+    results = {"audio_minutes": minutes}
+    for max_workers in workers:
+        transcriber = SegmentedTranscriber(FakeTranscriptionBackend(), max_workers=max_workers, export_format="wav")
+        started = time.perf_counter()
+        segments = transcriber.transcribe(path)
+        results[f"workers_{max_workers}"] = {
+            "seconds": round(time.perf_counter() - started, 3),
+            "segments": len(segments)
+        }
+    return results
+
+# Streams a PDF's pages in a fresh interpreter and reports the peak memory of it and its workers
+PDF_MEMORY_SCRIPT = """
+import os, sys, json, time, resource, threading
+sys.path.insert(0, {root!r})
+from rag.rag_pdf import iter_pdf_pages
+
+def descendants(pid):
+    children = {{}}
+    for name in filter(str.isdigit, os.listdir("/proc")):
+        try:
+            with open(f"/proc/{{name}}/stat") as f:
+                parent = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(name))
+    found, stack = [], [pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            found.append(child)
+            stack.append(child)
+    return found
+
+def peak_kb(pid):
+    try:
+        with open(f"/proc/{{pid}}/status") as f:
+            return max([int(line.split()[1]) for line in f if line.startswith("VmHWM:")] or [0])
+    except OSError:
+        return 0
+
+# Workers are children of the fork server, so sample their high-water marks while they run
+worker_kb, done = [0], threading.Event()
+def sample():
+    while not done.wait(0.05):
+        if os.path.isdir("/proc"):
+            worker_kb[0] = max([worker_kb[0]] + [peak_kb(pid) for pid in descendants(os.getpid())])
+threading.Thread(target=sample, daemon=True).start()
+
+started = time.perf_counter()
+pages = sum(1 for _ in iter_pdf_pages({path!r}, workers={workers!r}))
+seconds = time.perf_counter() - started
+done.set()
+scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+print(json.dumps({{"pages": pages, "seconds": seconds,
+                  "parent_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+                  "worker_mb": worker_kb[0] / 1024}}))
+"""
+
+def repeated_pdf(source: str, path: str, copies: int):
+    """Write a PDF made of copies of another one's pages"""
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(source)
+    writer = PdfWriter()
+    for _ in range(copies):
+        for page in reader.pages:
+            writer.add_page(page)
+    with open(path, "wb") as f:
+        writer.write(f)
+
+def bench_pdf_memory(workdir: str, source: str, copies: List[int], workers: List[int]) -> Dict:
+    """
+    Peak resident memory of streaming PDFs of growing size, per worker count
+    Each run is a fresh interpreter; worker_peak_mb is the largest worker
+    process (the fork server included), sampled from /proc on Linux.
+    """
+    results = {}
+    for count in copies:
+        path = os.path.join(workdir, f"pdf-x{count}.pdf")
+        repeated_pdf(source, path, count)
+        entry = results[f"x{count}"] = {"file_mb": round(os.path.getsize(path) / (1024 * 1024), 1)}
+        for max_workers in workers:
+            script = PDF_MEMORY_SCRIPT.format(root=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                              path=path, workers=max_workers)
+            output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+            report = json.loads(output.strip().splitlines()[-1])
+            entry[f"workers_{max_workers}"] = {
+                "pages": report["pages"],
+                "seconds": round(report["seconds"], 3),
+                "parent_peak_mb": round(report["parent_mb"], 1),
+                "worker_peak_mb": round(report["worker_mb"], 1),
+            }
+        os.remove(path)
+    return results
+
+def flatten(data: Dict, prefix: str = "") -> Dict[str, float]:
+    """Flatten nested results into dotted metric names"""
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+def compare(current: Dict, baseline: Dict):
+    """Print current results next to a baseline run"""
+    current_flat = flatten(current["results"])
+    baseline_flat = flatten(baseline["results"])
+    print(f"\n{'metric':60} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, value in current_flat.items():
+        if name not in baseline_flat:
+            continue
+        before = baseline_flat[name]
+        change = f"{100.0 * (value - before) / before:+.1f}%" if before else "n/a"
+        print(f"{name:60} {before:>12} {value:>12} {change:>9}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline RAG performance benchmarks")
+    parser.add_argument("--sources", default="data/sources", help="Source directory")
+    parser.add_argument("--backends", default="chroma,numpy", help="Comma separated vector store backends")
+    parser.add_argument("--iterations", type=int, default=20, help="Passes over the query set")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Stub LLM time to first token, seconds")
+    parser.add_argument("--transcription-minutes", type=float, default=60,
+                        help="Length of the synthetic recording to transcribe, 0 to skip")
+    parser.add_argument("--transcription-workers", default="1,4", help="Comma separated concurrency levels")
+    parser.add_argument("--pdf-copies", default="1,4",
+                        help="Comma separated sizes, in copies of the largest source PDF, for the PDF memory benchmark")
+    parser.add_argument("--pdf-workers", default="1,4", help="Comma separated PDF worker counts")
+    parser.add_argument("--output", default="benchmarks/results/latest.json", help="Where to write results")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    embedding = HashingEmbeddings()
+    sources = [source for source in RAGLoader(source_dir=args.sources, temp_dir=os.path.join(workdir, "temp")).scan_sources()
+               if "PDF" in source]
+
+    results = {}
+    try:
+        for backend in args.backends.split(","):
+            print(f"Benchmarking {backend} backend...")
+            ingestion = bench_ingestion(args.sources, workdir, backend, embedding, sources)
+            vectorstore = ingestion["vectorstore"]
+            results[backend] = {
+                "ingestion": ingestion["result"],
+                "streamed_ingestion": bench_streaming(workdir, backend, embedding, sources),
+                "retrieval": bench_retrieval(vectorstore, args.iterations),
+                "search_modes": bench_search_modes(vectorstore, max(1, args.iterations // 4)),
+                "filters": bench_filters(vectorstore, args.iterations),
+                "answer": bench_answers(vectorstore, args.llm_latency, max(1, args.iterations // 10)),
+                "chain_build": bench_chain_build(vectorstore, args.iterations * 10),
+                "context": bench_context(vectorstore, args.llm_latency, max(1, args.iterations // 4)),
+                "conversation": bench_conversation(vectorstore, args.llm_latency),
+                "startup": bench_startup(args.sources, workdir, backend, sources),
+            }
+        if args.transcription_minutes:
+            print("Benchmarking transcription...")
+            results["transcription"] = bench_transcription(
+                workdir, args.transcription_minutes,
+                [int(workers) for workers in args.transcription_workers.split(",")])
+        if args.pdf_copies and sources:
+            print("Benchmarking PDF memory...")
+            results["pdf_memory"] = bench_pdf_memory(
+                workdir, max(sources, key=lambda source: os.path.getsize(source["PDF"]))["PDF"],
+                [int(copies) for copies in args.pdf_copies.split(",")],
+                [int(workers) for workers in args.pdf_workers.split(",")])
+        results["peak_rss_mb"] = peak_rss_mb()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "settings": vars(args),
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(report, json.load(f))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Compact the persisted vector index
+
+Rewrites the live chunks into a new index generation, leaving out chunks
+of sources no longer in the manifest, repeated copies of the same chunk
+and deleted vectors, and reports the index size before and after. Stop
+the chat app first: the replaced generation is deleted on exit.
+
+    python compact_index.py --backend numpy
+"""
+
+import json
+import argparse
+from rag import RAGService, RAGVectorStore
+from rag.rag_metrics import configure_logging
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact the persisted vector index")
+    parser.add_argument("--backend", help="Vector store backend, defaults to RAG_VECTOR_BACKEND, then chroma")
+    parser.add_argument("--persist-directory", help="Index directory, defaults per backend")
+    args = parser.parse_args()
+    configure_logging()
+
+    service = RAGService(vectorstore=RAGVectorStore(persist_directory=args.persist_directory, backend=args.backend))
+    replaced = service.vectorstore
+    report = service.compact()
+    replaced.remove_index()
+    print(json.dumps(report, indent=2))
+    print(f"{report['bytes_before'] / 1e6:.1f} MB -> {report['bytes_after'] / 1e6:.1f} MB, "
+          f"{report['chunks_before']} -> {report['chunks_after']} chunks")
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
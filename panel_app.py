@@ -4,53 +4,119 @@
 import panel as pn
 import param
 from rag import RAGService
+from rag.rag_metrics import metrics, configure_logging
+from rag.rag_dedup import url_key
+from rag.rag_ingestion import ACTIVE_STATES
+from tornado.web import RequestHandler
 from utils.env_manager import init_environment
 import os
+import time
+import asyncio
+import logging
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+_rag_service = None
+_rag_service_lock = threading.Lock()
+
+def get_rag_service() -> RAGService:
+    """RAG service shared by all chat sessions, initialized on first use"""
+    global _rag_service
+    with _rag_service_lock:
+        if _rag_service is None:
+            init_environment()
+            # The app ranks with BM25 and vectors together; the service defaults to vector only
+            service = RAGService(retrieval_mode="hybrid")
+            # Serve from the persisted index right away; source changes are
+            # synced in the background
+            if not service.warm_start():
+                raise RuntimeError("Failed to initialize RAG service")
+            # Resume ingestion jobs left unfinished by a restart
+            service.ingestion.start()
+            _rag_service = service
+    return _rag_service
+
+def rag_service_ready() -> bool:
+    """Whether the shared RAG service can answer questions"""
+    return _rag_service is not None and _rag_service.ready
+
+def start_rag_service(started: Optional[float] = None) -> threading.Thread:
+    """
+    Initialize the shared RAG service in a background thread
+    Args:
+        started: time.perf_counter() at process start, to report the time to ready
+    """
+    def run():
+        try:
+            get_rag_service()
+        except Exception as e:
+            logger.error(f"Error starting RAG service: {e}")
+            return
+        if started is not None:
+            seconds = time.perf_counter() - started
+            metrics.observe("rag_startup_seconds", seconds)
+            logger.info(f"Ready to answer {seconds:.2f}s after start")
+            
+    thread = threading.Thread(target=run, name="rag-startup", daemon=True)
+    thread.start()
+    return thread
+
+def current_session_id():
+    """ID of the Panel session being served, if any"""
+    if pn.state.curdoc and pn.state.curdoc.session_context:
+        return pn.state.curdoc.session_context.id
+    return None
 
 class RAGChatBot(param.Parameterized):
-    chat_history = param.List([])
     answer = param.String("")
     db_query = param.String("")
     db_response = param.List([])
     
-    def __init__(self, **params):
+    def __init__(self, rag_service=None, session_id=None, **params):
         super(RAGChatBot, self).__init__(**params)
         self.panels = []
         
-        # Initialize RAG service
-        init_environment()
-        self.rag_service = RAGService()
-        if not self.rag_service.initialize():
-            raise RuntimeError("Failed to initialize RAG service")
-    
-    def convchain(self, query):
-        """Process a query and update chat"""
-        if not query:
-            return pn.WidgetBox(pn.Row('User:', pn.pane.Markdown("", width=600)), scroll=True)
+        # One bot per browser session, all sharing one RAG service
+        self.rag_service = rag_service or get_rag_service()
+        self.session_id = session_id or current_session_id()
         
-        result = self.rag_service.get_answer(query)
-        answer = result.get('answer', result.get('result', 'No answer found'))
-        sources = [doc.metadata.get("source", "") for doc in result.get("source_documents", [])]
-        
-        # Update chat history
-        self.chat_history.extend([(query, answer, sources)])
+    @property
+    def chat_history(self):
+        """Chat history of this bot's session"""
+        return self.rag_service.sessions.get(self.session_id).chat_history
+    
+    async def convchain(self, query):
+        """Process a query and stream the answer into the chat"""
+        if not query:
+            yield pn.WidgetBox(pn.Row('User:', pn.pane.Markdown("", width=600)), scroll=True)
+            return
         
-        # Update UI panels
+        answer_pane = pn.pane.Markdown("", width=600)
         self.panels.extend([
             pn.Row('User:', pn.pane.Markdown(query, width=600)),
-            pn.Row('Assistant:', pn.pane.Markdown(answer, width=600))
+            pn.Row('Assistant:', answer_pane)
         ])
+        yield pn.WidgetBox(*self.panels, scroll=True)
         
-        return pn.WidgetBox(*self.panels, scroll=True)
+        # Render tokens as they arrive
+        answer = ""
+        async for event in self.rag_service.astream_answer(query, session_id=self.session_id):
+            if event["type"] == "token":
+                answer += event["content"]
+                answer_pane.object = answer
+            else:
+                answer = event.get("answer") or answer or 'No answer found'
+                answer_pane.object = answer
     
     def clear_history(self, event=None):
         """Clear chat history"""
-        self.chat_history = []
         self.panels = []
-        self.rag_service.clear_memory()
+        self.rag_service.clear_memory(self.session_id)
         
-    def handle_file_upload(self, event):
-        """Handle PDF file upload"""
+    async def handle_file_upload(self, event):
+        """Handle PDF file upload; the file is indexed by the background ingestion queue"""
         if not event.new:
             return pn.Row(pn.pane.Markdown("❌ No file selected"))
             
@@ -63,29 +129,22 @@ class RAGChatBot(param.Parameterized):
             
             # Save uploaded file to sources directory
             file_path = os.path.join("data/sources", filename)
-            with open(file_path, "wb") as f:
-                if isinstance(event.new, bytes):
-                    f.write(event.new)
-                else:
-                    f.write(event.new.read())
+            content = event.new if isinstance(event.new, bytes) else event.new.read()
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._write_source, file_path, content)
                 
-            print(f"Saved file to: {file_path}")  # Debug log
-            
-            # Add file to sources
-            sources = [{"PDF": file_path}]
+            logger.info(f"Saved file to: {file_path}")
             
-            # Reinitialize RAG service with new document
-            if not self.rag_service.initialize(load_documents=True):
-                raise RuntimeError("Failed to reinitialize RAG service")
-                
-            return pn.Row(pn.pane.Markdown(f"✅ Successfully loaded: {filename}"))
+            # Chat keeps using the current index until the new one is swapped in
+            self.rag_service.submit_source("PDF", file_path, filename)
+            return pn.Row(pn.pane.Markdown(f"📥 Queued for indexing: {filename}"))
         except Exception as e:
             error_msg = f"❌ Error loading file: {str(e)}"
-            print(error_msg)  # Debug log
+            logger.error(error_msg)
             return pn.Row(pn.pane.Markdown(error_msg))
 
-    def handle_url_input(self, url: str, source_type: str, event=None) -> pn.Row:
-        """Handle URL input"""
+    async def handle_url_input(self, url: str, source_type: str, event=None) -> pn.Row:
+        """Handle URL input; the content is indexed by the background ingestion queue"""
         if not url:
             return pn.Row(pn.pane.Markdown("❌ Please enter a URL"))
             
@@ -93,35 +152,79 @@ class RAGChatBot(param.Parameterized):
             # Create sources directory if it doesn't exist
             os.makedirs("data/sources", exist_ok=True)
             
-            # Create unique filename
-            filename = f"{source_type}-{abs(hash(url))}.txt"
+            # Same name for the same normalized URL in every process,
+            # unlike hash(), which is seeded per process
+            filename = f"{source_type}-{url_key(url)}.txt"
             file_path = os.path.join("data/sources", filename)
+            if os.path.exists(file_path):
+                # A file whose last job failed is not indexed and may be queued again
+                latest = self.rag_service.ingestion.latest(file_path)
+                if latest and latest["status"] in ACTIVE_STATES:
+                    return pn.Row(pn.pane.Markdown(f"ℹ️ {source_type} content from {url} is already queued"))
+                if self.rag_service.manifest.get(file_path) is not None:
+                    return pn.Row(pn.pane.Markdown(f"ℹ️ {source_type} content from {url} was already added"))
+            else:
+                # Save URL to file
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(None, self._write_source, file_path, url.encode())
+                logger.info(f"Saved URL to: {file_path}")
             
-            # Save URL to file
-            with open(file_path, "w") as f:
-                f.write(url)
-                
-            print(f"Saved URL to: {file_path}")  # Debug log
-            
-            # Load documents immediately to verify URL works
-            if source_type.upper() == "YOUTUBE":
-                test_docs = self.rag_service.loader.load_youtube(url)
-                if not test_docs:
-                    raise ValueError("Failed to load YouTube content")
-            
-            # Reinitialize RAG service with new source
-            if not self.rag_service.initialize(load_documents=True):
-                raise RuntimeError("Failed to reinitialize RAG service")
-                
-            return pn.Row(pn.pane.Markdown(f"✅ Successfully added {source_type} content from: {url}"))
+            # A URL that yields no content shows up as a failed job
+            self.rag_service.submit_source(source_type, file_path, url)
+            return pn.Row(pn.pane.Markdown(f"📥 Queued {source_type} content from: {url}"))
         except Exception as e:
             error_msg = f"❌ Error adding {source_type} content: {str(e)}"
-            print(error_msg)  # Debug log
+            logger.error(error_msg)
             return pn.Row(pn.pane.Markdown(error_msg))
+            
+    def ingestion_status(self) -> str:
+        """Markdown table of recent ingestion jobs"""
+        jobs = self.rag_service.ingestion.jobs()
+        if not jobs:
+            return "No sources added yet"
+        icons = {"queued": "🕒", "loading": "⏳", "embedding": "⏳", "done": "✅", "failed": "❌"}
+        rows = ["| Source | Status | Detail | Updated |", "|---|---|---|---|"]
+        for job in jobs:
+            updated = time.strftime("%H:%M:%S", time.localtime(job["updated"]))
+            rows.append(f"| {job['label']} | {icons.get(job['status'], '')} {job['status']} "
+                        f"| {job['detail']} | {updated} |")
+        return "\n".join(rows)
+            
+    @staticmethod
+    def _write_source(file_path: str, content: bytes):
+        """Write a source file"""
+        with open(file_path, "wb") as f:
+            f.write(content)
 
 def create_dashboard():
-    """Create the Panel dashboard"""
-    cb = RAGChatBot()
+    """
+    Create the Panel dashboard for one browser session
+    Until the RAG service is ready the session shows a warming-up notice,
+    replaced by the dashboard once questions can be answered.
+    """
+    if rag_service_ready():
+        return build_dashboard(_rag_service, current_session_id())
+        
+    session_id = current_session_id()
+    page = pn.Column(
+        pn.Row(pn.pane.Markdown('# RAG Chat System')),
+        pn.Row(pn.pane.Markdown("⏳ Warming up: loading the document index, this page updates when it is ready"))
+    )
+    
+    def show_dashboard():
+        if rag_service_ready():
+            callback.stop()
+            page[:] = [build_dashboard(_rag_service, session_id)]
+            
+    callback = pn.state.add_periodic_callback(show_dashboard, period=500)
+    return page
+
+def build_dashboard(rag_service: RAGService, session_id: Optional[str]):
+    """Dashboard of one browser session over a ready RAG service"""
+    cb = RAGChatBot(rag_service=rag_service, session_id=session_id)
+    if cb.session_id:
+        # Free the session's conversation as soon as its tab is closed
+        pn.state.on_session_destroyed(lambda context: cb.rag_service.sessions.drop(context.id))
     
     # Create input widgets
     text_input = pn.widgets.TextInput(placeholder='Enter text here…')
@@ -132,8 +235,8 @@ def create_dashboard():
     file_input = pn.widgets.FileInput(accept='.pdf')
     file_status = pn.pane.Markdown("")
     
-    def update_file_status(event):
-        status = cb.handle_file_upload(event)
+    async def update_file_status(event):
+        status = await cb.handle_file_upload(event)
         if isinstance(status, pn.Row):
             file_status.object = status[0].object
     
@@ -144,12 +247,12 @@ def create_dashboard():
     youtube_status = pn.pane.Markdown("")
     youtube_button = pn.widgets.Button(name="Add YouTube", button_type='primary')
     
-    def update_youtube_status(event):
+    async def update_youtube_status(event):
         if not youtube_input.value:
             youtube_status.object = "❌ Please enter a URL"
             return
             
-        status = cb.handle_url_input(youtube_input.value, 'YouTube')
+        status = await cb.handle_url_input(youtube_input.value, 'YouTube')
         if isinstance(status, pn.Row):
             youtube_status.object = status[0].object
             youtube_input.value = ""  # Clear input after successful addition
@@ -161,18 +264,42 @@ def create_dashboard():
     url_status = pn.pane.Markdown("")
     url_button = pn.widgets.Button(name="Add Webpage", button_type='primary')
     
-    def update_url_status(event):
+    async def update_url_status(event):
         if not url_input.value:
             url_status.object = "❌ Please enter a URL"
             return
             
-        status = cb.handle_url_input(url_input.value, 'URL')
+        status = await cb.handle_url_input(url_input.value, 'URL')
         if isinstance(status, pn.Row):
             url_status.object = status[0].object
             url_input.value = ""
     
     url_button.on_click(update_url_status)
     
+    # Re-index webpages whose content changed, checked with conditional requests
+    revalidate_button = pn.widgets.Button(name="Check Webpages for Updates", button_type='default')
+    
+    async def revalidate_urls(event):
+        url_status.object = "⏳ Checking webpages for updates..."
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, lambda: cb.rag_service.refresh(revalidate_urls=True))
+            url_status.object = "✅ Webpages are up to date"
+        except Exception as e:
+            logger.error(f"Error revalidating webpages: {e}")
+            url_status.object = f"❌ Error checking webpages: {str(e)}"
+    
+    revalidate_button.on_click(revalidate_urls)
+    
+    # Ingestion job progress, polled while the session is open
+    jobs_status = pn.pane.Markdown(cb.ingestion_status())
+    
+    def update_jobs_status():
+        jobs_status.object = cb.ingestion_status()
+        
+    if cb.session_id:
+        pn.state.add_periodic_callback(update_jobs_status, period=1000)
+    
     # Bind conversation to input
     conversation = pn.bind(cb.convchain, text_input)
     
@@ -196,7 +323,11 @@ def create_dashboard():
         pn.layout.Divider(),
         pn.Row(pn.pane.Markdown('## Add Webpage')),
         pn.Row(url_input, url_button),
-        pn.Row(url_status)
+        pn.Row(revalidate_button),
+        pn.Row(url_status),
+        pn.layout.Divider(),
+        pn.Row(pn.pane.Markdown('## Ingestion Jobs')),
+        pn.Row(jobs_status)
     )
     
     # Create main dashboard
@@ -210,11 +341,39 @@ def create_dashboard():
     
     return dashboard
 
-def main():
-    """Main entry point"""
+class MetricsHandler(RequestHandler):
+    """Serves pipeline metrics for Prometheus, or as JSON with ?format=json"""
+
+    def get(self):
+        if self.get_argument("format", "") == "json":
+            self.set_header("Content-Type", "application/json")
+            self.write(metrics.to_json())
+        else:
+            self.set_header("Content-Type", "text/plain; version=0.0.4")
+            self.write(metrics.to_prometheus())
+
+class ReadyHandler(RequestHandler):
+    """Readiness probe: 200 once questions can be answered, 503 before"""
+
+    def get(self):
+        ready = _rag_service is not None and _rag_service.ready
+        self.set_status(200 if ready else 503)
+        self.write({"ready": ready})
+
+def main(started: Optional[float] = None):
+    """
+    Main entry point
+    Args:
+        started: time.perf_counter() at process start, to report the time to ready
+    """
+    configure_logging()
     pn.extension()
-    dashboard = create_dashboard()
-    dashboard.show()
+    # The server starts at once; sessions opened before the index is
+    # loaded see a warming-up notice and /ready answers 503
+    start_rag_service(started)
+    # Serve the factory so every browser session gets its own dashboard
+    pn.serve(create_dashboard, show=True,
+             extra_patterns=[(r"/metrics", MetricsHandler), (r"/ready", ReadyHandler)])
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
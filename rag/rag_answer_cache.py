@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import numpy as np
+from langchain.schema.embeddings import Embeddings
+from .rag_metrics import metrics
+
+class SemanticAnswerCache:
+    """
+    Answer cache looked up by question embedding similarity
+    Answers are kept per scope, a string naming everything besides the
+    question that shaped the answer, e.g. the chain and retrieval settings;
+    a question only matches answers of its own scope.
+    """
+
+    def __init__(self, embedding: Embeddings, threshold: float = 0.95, max_entries: int = 2000):
+        """
+        Initialize answer cache
+        Args:
+            embedding: Embedding model for questions
+            threshold: Minimum cosine similarity for a cached answer to be reused
+            max_entries: Least recently used answers are evicted beyond this size
+        """
+        self.embedding = embedding
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.index_version = None
+        self._entries: "OrderedDict[Tuple[str, str], Dict]" = OrderedDict()  # by (scope, question)
+        self._matrix = None  # normalized question vectors, rows in entry order
+        self._keys = []
+        self._scopes = None  # scope of each matrix row
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+
+    def _embed(self, question: str) -> np.ndarray:
+        """Normalized question vector"""
+        vector = np.asarray(self.embedding.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version(self, index_version: int) -> bool:
+        """
+        Drop all answers computed against an older index; caller holds the lock
+        Returns:
+            False if index_version is older than the cached answers, which
+            then stay untouched
+        """
+        if self.index_version is not None and index_version < self.index_version:
+            return False
+        if index_version != self.index_version:
+            self._entries.clear()
+            self._matrix = None
+            self._keys = []
+            self.index_version = index_version
+        return True
+
+    def lookup(self, question: str, index_version: int, scope: str = "") -> Optional[Dict]:
+        """
+        Find the answer of a sufficiently similar cached question
+        Args:
+            question: Question to answer
+            index_version: Index version the answer would be computed against
+            scope: Only answers stored under this scope match
+        Returns:
+            Dict with "answer", "source_documents", "cached_question" and
+            "similarity", or None on a miss
+        """
+        vector = self._embed(question)
+        with self._lock:
+            if self._check_version(index_version) and self._entries:
+                if self._matrix is None:
+                    self._keys = list(self._entries)
+                    self._scopes = np.array([key[0] for key in self._keys], dtype=object)
+                    self._matrix = np.stack([self._entries[key]["vector"] for key in self._keys])
+                similarities = np.where(self._scopes == scope, self._matrix @ vector, -np.inf)
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    key = self._keys[best]
+                    entry = self._entries[key]
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    self.latency_saved += entry["seconds"]
+                    metrics.increment("rag_cache_hits_total", cache="answer")
+                    metrics.increment("rag_answer_cache_saved_seconds_total", entry["seconds"])
+                    return {
+                        "answer": entry["answer"],
+                        "source_documents": list(entry["source_documents"]),
+                        "cached_question": key[1],
+                        "similarity": float(similarities[best])
+                    }
+            self.misses += 1
+            metrics.increment("rag_cache_misses_total", cache="answer")
+            return None
+
+    def store(self, question: str, index_version: int, result: Dict, seconds: float, scope: str = ""):
+        """
+        Cache an answer
+        Answers computed against an index older than the cached ones are
+        dropped.
+        Args:
+            question: Question that was answered
+            index_version: Index version the answer was computed against
+            result: Chain result with "answer" or "result" and "source_documents"
+            seconds: Time it took to compute the answer
+            scope: Scope the answer is valid in, see lookup
+        """
+        vector = self._embed(question)
+        with self._lock:
+            if not self._check_version(index_version):
+                return
+            key = (scope, question)
+            self._entries[key] = {
+                "vector": vector,
+                "answer": result.get("answer", result.get("result", "")),
+                "source_documents": list(result.get("source_documents", [])),
+                "seconds": seconds
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def invalidate(self):
+        """Drop all cached answers"""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self._keys = []
+
+    def stats(self) -> Dict:
+        """Hit rate and latency saved"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "latency_saved_seconds": round(self.latency_saved, 3),
+                "entries": len(self._entries)
+            }
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import re
+import json
+import math
+import heapq
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+from langchain.schema import Document
+from langchain.schema.retriever import BaseRetriever
+from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+from .rag_filters import MetadataIndex
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens; keeps codes like "cs-101" or "i-20" together"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+class BM25Index:
+    """In-process BM25 inverted index over the chunks in the vector store"""
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        """
+        Initialize BM25 index
+        Args:
+            path: JSON file the index is persisted to
+            k1: Term frequency saturation
+            b: Document length normalization
+        """
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.docs: Dict[str, Dict] = {}  # chunk id -> {"text", "metadata", "length"}
+        self.postings: Dict[str, Dict[str, int]] = {}  # term -> {chunk id: term frequency}
+        self.total_length = 0
+        self.metadata_index = MetadataIndex()
+        self.dirty = False
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def exists(self) -> bool:
+        """Whether the index has been persisted before"""
+        return os.path.exists(self.path)
+
+    def load(self):
+        """Load the persisted index"""
+        with self._lock:
+            self.clear()
+            if not os.path.exists(self.path):
+                return
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            for chunk_id, doc in data.get("docs", {}).items():
+                self._add(chunk_id, doc["text"], doc["metadata"])
+            self.dirty = False
+
+    def save(self):
+        """Persist the index if it changed"""
+        with self._lock:
+            if not self.dirty:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({"docs": {
+                    chunk_id: {"text": doc["text"], "metadata": doc["metadata"]}
+                    for chunk_id, doc in self.docs.items()
+                }}, f)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+
+    def _add(self, chunk_id: str, text: str, metadata: Dict):
+        """Index one chunk; caller holds the lock"""
+        if chunk_id in self.docs:
+            self._remove(chunk_id)
+        terms = Counter(tokenize(text))
+        length = sum(terms.values())
+        self.docs[chunk_id] = {"text": text, "metadata": metadata, "length": length, "terms": list(terms)}
+        self.total_length += length
+        self.metadata_index.add(chunk_id, metadata)
+        for term, frequency in terms.items():
+            self.postings.setdefault(term, {})[chunk_id] = frequency
+
+    def _remove(self, chunk_id: str):
+        """Unindex one chunk; caller holds the lock"""
+        doc = self.docs.pop(chunk_id)
+        self.total_length -= doc["length"]
+        self.metadata_index.remove(chunk_id, doc["metadata"])
+        for term in doc["terms"]:
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self.postings[term]
+
+    def add(self, ids: List[str], chunks: List[Document]):
+        """Index chunks under their chunk IDs"""
+        with self._lock:
+            for chunk_id, chunk in zip(ids, chunks):
+                self._add(chunk_id, chunk.page_content, dict(chunk.metadata))
+            self.dirty = True
+
+    def delete(self, ids: List[str]):
+        """Remove chunks by ID"""
+        with self._lock:
+            for chunk_id in ids:
+                if chunk_id in self.docs:
+                    self._remove(chunk_id)
+            self.dirty = True
+
+    def delete_where(self, key: str, value: Any):
+        """Remove all chunks whose metadata[key] equals value"""
+        with self._lock:
+            self.delete([chunk_id for chunk_id, doc in self.docs.items()
+                         if doc["metadata"].get(key) == value])
+
+    def clear(self):
+        """Remove all chunks"""
+        with self._lock:
+            self.docs = {}
+            self.postings = {}
+            self.total_length = 0
+            self.metadata_index.clear()
+            self.dirty = True
+
+    def search(self, query: str, k: int = 4, where: Optional[Dict] = None) -> List[Tuple[str, Document, float]]:
+        """
+        Rank chunks by BM25 score
+        Args:
+            query: Query text
+            k: Number of chunks to return
+            where: Optional Chroma-style metadata filter; only matching
+                chunks are scored
+        Returns:
+            Up to k (chunk id, document, score) tuples, best first
+        """
+        with self._lock:
+            if not self.docs:
+                return []
+            n_docs = len(self.docs)
+            avg_length = self.total_length / n_docs
+            allowed = self.metadata_index.match(where) if where else None
+            scores: Dict[str, float] = {}
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                if allowed is None:
+                    matching = postings.items()
+                elif len(allowed) < len(postings):
+                    matching = [(chunk_id, postings[chunk_id]) for chunk_id in allowed if chunk_id in postings]
+                else:
+                    matching = [(chunk_id, frequency) for chunk_id, frequency in postings.items()
+                                if chunk_id in allowed]
+                for chunk_id, frequency in matching:
+                    length_norm = 1 - self.b + self.b * self.docs[chunk_id]["length"] / avg_length
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * frequency * (self.k1 + 1) / (
+                        frequency + self.k1 * length_norm)
+
+            best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            return [
+                (chunk_id, Document(page_content=self.docs[chunk_id]["text"],
+                                    metadata=dict(self.docs[chunk_id]["metadata"])), score)
+                for chunk_id, score in best
+            ]
+
+def chunk_key(doc: Document) -> Tuple:
+    """Identity of a chunk across retrievers"""
+    return (doc.metadata.get("source_file", doc.metadata.get("source")), doc.page_content)
+
+class HybridRetriever(BaseRetriever):
+    """Fuses BM25 and vector search results with reciprocal rank fusion"""
+
+    vectorstore: Any
+    lexical_index: Any
+    mode: str = "hybrid"  # "hybrid", "lexical" (no embedding call) or "vector"
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = 60
+    # Vector search mode, see rag_search.SEARCH_TYPES
+    search_type: str = "similarity"
+    score_threshold: float = 0.5
+    lambda_mult: float = 0.5
+    # Chroma-style metadata filter applied before ranking, see rag_filters
+    filter: Optional[Dict] = None
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        """Retrieve the top k chunks for a query"""
+        if self.mode == "lexical" or (self.mode == "hybrid" and self.vectorstore is None):
+            return [doc for _, doc, _ in self.lexical_index.search(query, self.k, where=self.filter)]
+        if self.mode == "vector" or not len(self.lexical_index):
+            return self._vector_search(query, self.k)
+
+        ranked_lists = [
+            self._vector_search(query, self.fetch_k),
+            [doc for _, doc, _ in self.lexical_index.search(query, self.fetch_k, where=self.filter)]
+        ]
+        scores: Dict[Tuple, float] = {}
+        docs: Dict[Tuple, Document] = {}
+        for ranked in ranked_lists:
+            for rank, doc in enumerate(ranked):
+                key = chunk_key(doc)
+                docs.setdefault(key, doc)
+                scores[key] = scores.get(key, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+
+        best = sorted(scores, key=scores.get, reverse=True)[:self.k]
+        return [docs[key] for key in best]
+
+    def _vector_search(self, query: str, k: int) -> List[Document]:
+        """Top k chunks of the vector store in the configured search mode"""
+        if self.search_type == "mmr":
+            return self.vectorstore.max_marginal_relevance_search(
+                query, k=k, fetch_k=max(self.fetch_k, 2 * k), lambda_mult=self.lambda_mult, filter=self.filter)
+        if self.search_type == "similarity_score_threshold":
+            return [doc for doc, _ in self.vectorstore.similarity_search_with_relevance_scores(
+                query, k=k, score_threshold=self.score_threshold, filter=self.filter)]
+        return self.vectorstore.similarity_search(query, k=k, filter=self.filter)
@@ -1,32 +1,141 @@
 #!/usr/bin/env python
 # coding: utf-8
 
-from typing import Dict, Any
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Optional
 from langchain_community.chat_models.openai import ChatOpenAI
-from langchain.chains import RetrievalQA, ConversationalRetrievalChain
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain.chains import RetrievalQA, ConversationalRetrievalChain, LLMChain
+from langchain.callbacks.manager import AsyncCallbackManagerForChainRun, CallbackManagerForChainRun
 from langchain.prompts import PromptTemplate
-from langchain.memory import ConversationBufferMemory
+from .rag_bm25 import HybridRetriever
+from .rag_context import ContextBuilder, BudgetedRetriever
+from .rag_search import search_settings
+from .rag_filters import where_key
+from .rag_metrics import metrics
+
+# Tag of the LLM that writes the final answer, the only one whose tokens are streamed
+ANSWER_TAG = "rag-answer"
+
+class TokenStreamHandler(BaseCallbackHandler):
+    """Forwards streamed answer tokens to a callback"""
+    
+    def __init__(self, on_token: Callable[[str], None]):
+        self.on_token = on_token
+        
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        """Handle a newly generated token"""
+        if token and ANSWER_TAG in (kwargs.get("tags") or []):
+            self.on_token(token)
+
+# Words that refer back to earlier turns
+REFERRING_WORDS = {
+    "it", "its", "they", "them", "their", "theirs", "this", "that", "these", "those",
+    "he", "him", "his", "she", "her", "hers", "there", "one", "ones", "former", "latter",
+    "above", "previous", "earlier", "same", "such", "also", "else", "another", "more"
+}
+# Openings of follow-up questions, e.g. "and the deadline?"
+FOLLOW_UP_OPENINGS = ("and", "but", "or", "so", "then", "what about", "how about")
+
+def is_standalone(question: str, min_words: int = 4) -> bool:
+    """
+    Cheap check whether a question can be answered without the conversation
+    Errs towards False: a needless rewrite costs one LLM call, a missed one
+    retrieves for the wrong question.
+    """
+    words = re.findall(r"[a-z0-9']+", question.lower())
+    if len(words) < min_words:
+        return False
+    if " ".join(words[:2]) in FOLLOW_UP_OPENINGS or words[0] in FOLLOW_UP_OPENINGS:
+        return False
+    return not any(word in REFERRING_WORDS or word.split("'")[0] in REFERRING_WORDS for word in words)
+
+class CondenseQuestionChain(LLMChain):
+    """Question rewriting chain that skips the LLM for questions that are already standalone"""
+
+    def _call(self, inputs: Dict[str, Any],
+              run_manager: Optional[CallbackManagerForChainRun] = None) -> Dict[str, str]:
+        if is_standalone(inputs["question"]):
+            metrics.increment("rag_condense_skipped_total")
+            return {self.output_key: inputs["question"]}
+        return super()._call(inputs, run_manager)
+
+    async def _acall(self, inputs: Dict[str, Any],
+                     run_manager: Optional[AsyncCallbackManagerForChainRun] = None) -> Dict[str, str]:
+        if is_standalone(inputs["question"]):
+            metrics.increment("rag_condense_skipped_total")
+            return {self.output_key: inputs["question"]}
+        return await super()._acall(inputs, run_manager)
 
 class RAGChain:
     """Manages RAG chains"""
     
-    def __init__(self, vectorstore, model_name: str = "gpt-3.5-turbo"):
-        """Initialize RAG chain"""
+    def __init__(self, vectorstore, model_name: str = "gpt-3.5-turbo",
+                 lexical_index=None, retrieval_mode: str = "vector", llm=None,
+                 context_tokens: Optional[int] = 800, search_type: str = "similarity",
+                 search_kwargs: Optional[Dict] = None, max_filtered_chains: int = 32):
+        """
+        Initialize RAG chain
+        Args:
+            vectorstore: Vector store to retrieve from
+            model_name: OpenAI chat model
+            lexical_index: Optional BM25Index over the same chunks
+            retrieval_mode: "vector", "hybrid" (BM25 + vector fused with RRF)
+                or "lexical" (BM25 only, no embedding call); the last two
+                need a lexical_index
+            llm: Chat model to use instead of OpenAI, e.g. a local stub
+            context_tokens: Token budget of the retrieved context; overlapping
+                chunks are merged and repeated text dropped first. None sends
+                the retrieved chunks unchanged
+            search_type: Vector search mode: "similarity", "similarity_score_threshold"
+                or "mmr" (maximal marginal relevance, for diverse results);
+                in hybrid mode it applies to the vector side
+            search_kwargs: Settings of the search mode, see rag_search.SEARCH_DEFAULTS:
+                k, score_threshold (relevance in [0, 1]), fetch_k and lambda_mult
+            max_filtered_chains: Retrievers and chains built for metadata
+                filters that are kept for reuse, least recently used first out
+        """
         if not vectorstore:
             raise ValueError("Vector store cannot be None")
+        if retrieval_mode not in ("vector", "hybrid", "lexical"):
+            raise ValueError(f"Unknown retrieval mode: {retrieval_mode}")
+        if retrieval_mode != "vector" and lexical_index is None:
+            raise ValueError(f"Retrieval mode {retrieval_mode} needs a lexical index")
             
         self.vectorstore = vectorstore
+        self.lexical_index = lexical_index
+        self.retrieval_mode = retrieval_mode
+        self.context_tokens = context_tokens
+        self.search_type = search_type
+        self.search_kwargs = search_settings(search_type, search_kwargs)
+        self.max_filtered_chains = max_filtered_chains
         
-        # Initialize OpenAI
-        from utils.env_manager import init_environment
-        init_environment()  # Ensure API key is loaded
+        if llm is not None:
+            self.llm = llm
+            # Rebuilt rather than copied: pydantic copies drop excluded fields like callbacks
+            self.streaming_llm = type(llm)(**dict(dict(llm), tags=[ANSWER_TAG]))
+        else:
+            # Initialize OpenAI
+            from utils.env_manager import init_environment
+            init_environment()  # Ensure API key is loaded
+            
+            self.llm = ChatOpenAI(model=model_name, temperature=0)
+            # Answers are generated by a streaming model so tokens can be forwarded
+            # as they arrive; question condensing stays on the non-streaming one
+            self.streaming_llm = ChatOpenAI(model=model_name, temperature=0, streaming=True, tags=[ANSWER_TAG])
         
-        self.llm = ChatOpenAI(model=model_name, temperature=0)
-        self.memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            output_key="answer",
-            return_messages=True
-        )
+        # Chains are built on first use and reused for every question and
+        # session; a new RAGChain is created whenever the vector store is
+        # swapped. Conversation memory lives in the caller's RAGSession.
+        self._retriever = None
+        self._qa_chain = None
+        self._conversational_chain = None
+        # Retrievers and chains per metadata filter, keyed by (kind, where_key)
+        self._filtered: "OrderedDict[tuple, Any]" = OrderedDict()
+        # Re-entrant: building a filtered chain fetches its filtered retriever
+        self._filtered_lock = threading.RLock()
         
     def get_qa_prompt(self) -> PromptTemplate:
         """Get QA prompt template"""
@@ -45,22 +154,95 @@ class RAGChain:
             template=template
         )
         
-    def create_qa_chain(self) -> RetrievalQA:
+    def get_retriever(self, where: Optional[Dict] = None):
+        """
+        Get the retriever for the configured retrieval mode, within the context budget
+        Args:
+            where: Optional Chroma-style metadata filter (see rag_filters.build_where);
+                the stores apply it before ranking, so k chunks are returned
+                whenever k chunks match
+        """
+        if where:
+            return self._get_filtered("retriever", where, lambda: self.create_retriever(where))
+        if self._retriever is None:
+            self._retriever = self.create_retriever()
+        return self._retriever
+        
+    def create_retriever(self, where: Optional[Dict] = None):
+        """Create a retriever for the configured retrieval mode, optionally filtered"""
+        if self.retrieval_mode == "vector":
+            search_kwargs = dict(self.search_kwargs, filter=where) if where else self.search_kwargs
+            retriever = self.vectorstore.as_retriever(
+                search_type=self.search_type,
+                search_kwargs=search_kwargs
+            )
+        else:
+            retriever = HybridRetriever(
+                vectorstore=self.vectorstore,
+                lexical_index=self.lexical_index,
+                mode=self.retrieval_mode,
+                search_type=self.search_type,
+                filter=where,
+                **self.search_kwargs
+            )
+        if self.context_tokens:
+            retriever = BudgetedRetriever(
+                retriever=retriever,
+                builder=ContextBuilder(max_tokens=self.context_tokens)
+            )
+        return retriever
+        
+    def _get_filtered(self, kind: str, where: Dict, create: Callable[[], Any]):
+        """Cached retriever or chain of a kind for a metadata filter, created on first use"""
+        key = (kind, where_key(where))
+        with self._filtered_lock:
+            built = self._filtered.get(key)
+            if built is None:
+                built = self._filtered[key] = create()
+            self._filtered.move_to_end(key)
+            while len(self._filtered) > self.max_filtered_chains:
+                self._filtered.popitem(last=False)
+            return built
+        
+    def create_qa_chain(self, where: Optional[Dict] = None) -> RetrievalQA:
         """Create RetrievalQA chain"""
         return RetrievalQA.from_chain_type(
-            llm=self.llm,
+            llm=self.streaming_llm,
             chain_type="stuff",
-            retriever=self.vectorstore.as_retriever(),
+            retriever=self.get_retriever(where),
             chain_type_kwargs={"prompt": self.get_qa_prompt()},
             return_source_documents=True
         )
         
-    def create_conversational_chain(self) -> ConversationalRetrievalChain:
-        """Create ConversationalRetrievalChain"""
-        return ConversationalRetrievalChain.from_llm(
-            llm=self.llm,
-            retriever=self.vectorstore.as_retriever(),
-            memory=self.memory,
+    def create_conversational_chain(self, where: Optional[Dict] = None) -> ConversationalRetrievalChain:
+        """
+        Create ConversationalRetrievalChain
+        The chain holds no memory, callers pass "chat_history" with each
+        question. The question is rewritten only if there is history and
+        it does not look standalone already.
+        """
+        chain = ConversationalRetrievalChain.from_llm(
+            llm=self.streaming_llm,
+            condense_question_llm=self.llm,
+            retriever=self.get_retriever(where),
             return_source_documents=True,
             output_key="answer"
-        ) 
\ No newline at end of file
+        )
+        chain.question_generator = CondenseQuestionChain(llm=self.llm, prompt=chain.question_generator.prompt)
+        return chain
+        
+    def get_qa_chain(self, where: Optional[Dict] = None) -> RetrievalQA:
+        """Get the cached RetrievalQA chain for a metadata filter, building it on first use"""
+        if where:
+            return self._get_filtered("qa", where, lambda: self.create_qa_chain(where))
+        if self._qa_chain is None:
+            self._qa_chain = self.create_qa_chain()
+        return self._qa_chain
+        
+    def get_conversational_chain(self, where: Optional[Dict] = None) -> ConversationalRetrievalChain:
+        """Get the cached ConversationalRetrievalChain for a metadata filter, building it on first use"""
+        if where:
+            return self._get_filtered("conversational", where, lambda: self.create_conversational_chain(where))
+        if self._conversational_chain is None:
+            self._conversational_chain = self.create_conversational_chain()
+        return self._conversational_chain
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import re
+import logging
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional
+import tiktoken
+from langchain.schema import Document
+from langchain.schema.retriever import BaseRetriever
+from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+from .rag_metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name: str = "cl100k_base"):
+    """tiktoken encoding, loaded once; None if it cannot be downloaded"""
+    try:
+        return tiktoken.get_encoding(encoding_name)
+    except Exception as e:
+        # Encodings are downloaded on first use; estimate when offline
+        logger.warning(f"tiktoken encoding unavailable, estimating token counts: {e}")
+        return None
+
+def token_count(text: str, encoding_name: str = "cl100k_base") -> int:
+    """Number of tokens in a text, estimated at 4 characters per token when offline"""
+    encoding = get_encoding(encoding_name)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+def _overlap(first: str, second: str, min_chars: int = 20) -> int:
+    """Length of the longest suffix of first that is a prefix of second"""
+    probe = second[:min_chars]
+    if len(probe) < min_chars:
+        return 0
+    start = first.find(probe)
+    while start != -1:
+        if second.startswith(first[start:]):
+            return len(first) - start
+        start = first.find(probe, start + 1)
+    return 0
+
+class ContextBuilder:
+    """
+    Fits retrieved chunks into a token budget
+    Chunks from the same source and page that overlap (the splitter repeats
+    up to chunk_overlap characters between neighbours) or contain each other
+    are merged into one passage, text already included elsewhere is
+    dropped, runs of whitespace left by PDF extraction are collapsed, and
+    passages are kept best first until the budget is spent.
+    """
+
+    def __init__(self, max_tokens: int = 800, min_tokens: int = 64,
+                 count_tokens: Optional[Callable[[str], int]] = None,
+                 encoding_name: str = "cl100k_base"):
+        """
+        Initialize context builder
+        Args:
+            max_tokens: Token budget of the assembled context
+            min_tokens: A passage that does not fit is truncated to the
+                remaining budget only if at least this many tokens remain
+            count_tokens: Token counter, defaults to tiktoken
+            encoding_name: tiktoken encoding used by the default counter
+        """
+        self.max_tokens = max_tokens
+        self.min_tokens = min_tokens
+        self.encoding = get_encoding(encoding_name) if count_tokens is None else None
+        self.count_tokens = count_tokens or (lambda text: token_count(text, encoding_name))
+
+    def _truncate(self, text: str, tokens: int) -> str:
+        """Leading part of a text of at most tokens tokens, cut at a word boundary"""
+        if self.encoding is not None:
+            text = self.encoding.decode(self.encoding.encode(text, disallowed_special=())[:tokens])
+        else:
+            text = text[:tokens * 4]
+        cut = text.rfind(" ")
+        text = text[:cut] if cut > 0 else text
+        # A custom counter or the cut may still leave the text over budget
+        while self.count_tokens(text) > tokens and " " in text:
+            text = text[:text.rfind(" ")]
+        return text
+
+    @staticmethod
+    def _group(doc: Document) -> tuple:
+        return (doc.metadata.get("source_file", doc.metadata.get("source")), doc.metadata.get("page"))
+
+    def merge(self, docs: List[Document]) -> List[Document]:
+        """
+        Merge overlapping chunks and drop repeated ones
+        Args:
+            docs: Chunks, best first
+        Returns:
+            Passages, best first, each ranked by its best chunk
+        """
+        passages: List[Dict[str, Any]] = []
+        for rank, doc in enumerate(docs):
+            text = re.sub(r"[ \t]+", " ", re.sub(r"\s*\n\s*", "\n", doc.page_content)).strip()
+            if not text or any(text in passage["text"] for passage in passages):
+                continue
+            current = {"rank": rank, "group": self._group(doc), "text": text, "metadata": dict(doc.metadata)}
+            # A chunk may bridge two passages, so merge until nothing changes
+            merged = True
+            while merged:
+                merged = False
+                for passage in passages:
+                    if passage["group"] != current["group"]:
+                        continue
+                    overlap = _overlap(passage["text"], current["text"])
+                    if passage["text"] in current["text"]:
+                        combined = current["text"]
+                    elif overlap:
+                        combined = passage["text"] + current["text"][overlap:]
+                    else:
+                        overlap = _overlap(current["text"], passage["text"])
+                        if not overlap:
+                            continue
+                        combined = current["text"] + passage["text"][overlap:]
+                    passages.remove(passage)
+                    better = passage if passage["rank"] < current["rank"] else current
+                    current = dict(better, text=combined)
+                    merged = True
+                    break
+            passages.append(current)
+
+        passages.sort(key=lambda passage: passage["rank"])
+        return [Document(page_content=passage["text"], metadata=passage["metadata"]) for passage in passages]
+
+    def build(self, docs: List[Document]) -> Dict:
+        """
+        Assemble the context for one request
+        Args:
+            docs: Retrieved chunks, best first
+        Returns:
+            Dict with "documents" (passages within the budget, best first),
+            "tokens" (their total) and "candidate_tokens" (of the chunks as retrieved)
+        """
+        candidate_tokens = sum(self.count_tokens(doc.page_content) for doc in docs)
+        selected, total = [], 0
+        for passage in self.merge(docs):
+            tokens = self.count_tokens(passage.page_content)
+            remaining = self.max_tokens - total
+            if tokens > remaining:
+                if remaining < self.min_tokens:
+                    continue
+                passage = Document(page_content=self._truncate(passage.page_content, remaining),
+                                   metadata=passage.metadata)
+                tokens = self.count_tokens(passage.page_content)
+            selected.append(passage)
+            total += tokens
+        return {"documents": selected, "tokens": total, "candidate_tokens": candidate_tokens}
+
+class BudgetedRetriever(BaseRetriever):
+    """Retrieves with another retriever and returns the context assembled by a ContextBuilder"""
+
+    retriever: Any
+    builder: Any
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        """Passages for a query within the token budget"""
+        # Not traced separately: this retriever's run already times the retrieval
+        docs = self.retriever.get_relevant_documents(query)
+        with metrics.span("context") as span:
+            context = self.builder.build(docs)
+            span.update(chunks=len(docs), passages=len(context["documents"]),
+                        tokens=context["tokens"], candidate_tokens=context["candidate_tokens"])
+        metrics.increment("rag_tokens_total", context["tokens"], kind="context")
+        return context["documents"]
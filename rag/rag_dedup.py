@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import re
+import hashlib
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from .rag_transcript_cache import youtube_video_id
+
+# Query parameters that only track where a visitor came from
+TRACKING_PARAMS = re.compile(r"^(utm_\w+|fbclid|gclid|mc_cid|mc_eid|ref|si)$")
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+def normalize_url(url: str) -> str:
+    """
+    Canonical form of a URL for duplicate detection
+    YouTube links become https://www.youtube.com/watch?v=<id>. Otherwise
+    scheme and host are lowercased, default ports, fragments, tracking
+    parameters and trailing slashes dropped, and query parameters sorted.
+    """
+    url = url.strip()
+    video_id = youtube_video_id(url)
+    if video_id:
+        return f"https://www.youtube.com/watch?v={video_id}"
+    parts = urlsplit(url if "//" in url else f"https://{url}")
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = urlencode(sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                             if not TRACKING_PARAMS.match(key)))
+    return urlunsplit((scheme, host, parts.path.rstrip("/") or "/", query, ""))
+
+def url_key(url: str) -> str:
+    """Short stable digest of a normalized URL, e.g. for source file names"""
+    return hashlib.sha256(normalize_url(url).encode("utf-8")).hexdigest()[:16]
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+def simhash(text: str, shingle: int = 3) -> int:
+    """64-bit SimHash over word shingles of a text"""
+    words = re.findall(r"\w+", text.lower())
+    shingles = [" ".join(words[i:i + shingle]) for i in range(max(1, len(words) - shingle + 1))]
+    weights = [0] * 64
+    for value in shingles:
+        hashed = _hash64(value)
+        for bit in range(64):
+            weights[bit] += 1 if hashed >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+class ChunkDeduplicator:
+    """
+    Drops exact and near-duplicate chunks
+    Exact duplicates match on normalized text. Near duplicates are chunks
+    whose SimHash differs in at most max_distance bits; fingerprints are
+    indexed by max_distance + 1 bands, so a near duplicate always shares
+    at least one band with a kept chunk.
+    """
+
+    def __init__(self, max_distance: int = 3, count_tokens: Optional[Callable[[str], int]] = None):
+        """
+        Initialize deduplicator
+        Args:
+            max_distance: Maximum SimHash Hamming distance of near duplicates
+            count_tokens: Token counter for the savings report, defaults to len / 4
+        """
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self.band_bits = 64 // self.bands
+        self.count_tokens = count_tokens or (lambda text: len(text) // 4 + 1)
+        self._exact = set()
+        self._bands: List[Dict[int, List[int]]] = [{} for _ in range(self.bands)]
+        self.kept = 0
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+        self.tokens_saved = 0
+
+    def _band_keys(self, fingerprint: int) -> List[int]:
+        mask = (1 << self.band_bits) - 1
+        return [fingerprint >> (band * self.band_bits) & mask for band in range(self.bands)]
+
+    def is_duplicate(self, text: str) -> bool:
+        """Whether a text duplicates one seen before; new texts are remembered"""
+        normalized = " ".join(text.lower().split())
+        digest = hashlib.sha256(normalized.encode("utf-8")).digest()
+        if digest in self._exact:
+            self.exact_duplicates += 1
+            self.tokens_saved += self.count_tokens(text)
+            return True
+
+        fingerprint = simhash(normalized)
+        keys = self._band_keys(fingerprint)
+        for band, key in enumerate(keys):
+            for other in self._bands[band].get(key, ()):
+                if bin(fingerprint ^ other).count("1") <= self.max_distance:
+                    self.near_duplicates += 1
+                    self.tokens_saved += self.count_tokens(text)
+                    return True
+
+        self._exact.add(digest)
+        for band, key in enumerate(keys):
+            self._bands[band].setdefault(key, []).append(fingerprint)
+        self.kept += 1
+        return False
+
+    def stats(self) -> Dict:
+        """Chunks kept and dropped, and tokens not embedded"""
+        return {
+            "kept": self.kept,
+            "exact_duplicates": self.exact_duplicates,
+            "near_duplicates": self.near_duplicates,
+            "tokens_saved": self.tokens_saved
+        }
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from typing import Dict, List, Optional
+from langchain.schema.embeddings import Embeddings
+from .rag_metrics import metrics
+
+class CachedEmbeddings(Embeddings):
+    """Persistent SQLite cache in front of an embedding model"""
+
+    def __init__(self, embedding: Embeddings, cache_path: str = "data/embedding_cache.sqlite3",
+                 model_name: Optional[str] = None, max_entries: int = 200000):
+        """
+        Initialize embedding cache
+        Args:
+            embedding: Embedding model to wrap
+            cache_path: SQLite file holding cached vectors
+            model_name: Cache namespace, defaults to the wrapped model's name
+            max_entries: Least recently used vectors are evicted beyond this size
+        """
+        self.embedding = embedding
+        self.cache_path = cache_path
+        self.model_name = model_name or getattr(embedding, "model", type(embedding).__name__)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+            "last_used REAL NOT NULL, PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        """Cache key for a piece of text"""
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _lookup(self, hashes: List[str]) -> Dict[str, List[float]]:
+        """Fetch cached vectors for the given text hashes"""
+        found = {}
+        for start in range(0, len(hashes), 500):
+            batch = hashes[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                [self.model_name] + batch
+            ).fetchall()
+            for text_hash, blob in rows:
+                vector = array("f")
+                vector.frombytes(blob)
+                found[text_hash] = vector.tolist()
+        if found:
+            now = time.time()
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                [(now, self.model_name, text_hash) for text_hash in found]
+            )
+        return found
+
+    def _store(self, hashes: List[str], vectors: List[List[float]]):
+        """Insert new vectors and evict the least recently used beyond the size limit"""
+        now = time.time()
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+            [(self.model_name, text_hash, array("f", vector).tobytes(), now)
+             for text_hash, vector in zip(hashes, vectors)]
+        )
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN "
+                "(SELECT rowid FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def missing(self, texts: List[str]) -> List[str]:
+        """Texts that are not cached yet, without touching hit/miss counts"""
+        hashes = [self.text_hash(text) for text in texts]
+        with self._lock:
+            cached = set()
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                cached.update(row[0] for row in self._conn.execute(
+                    f"SELECT text_hash FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [self.model_name] + batch
+                ))
+        return [text for text, text_hash in zip(texts, hashes) if text_hash not in cached]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, calling the wrapped model only for cache misses"""
+        hashes = [self.text_hash(text) for text in texts]
+        with self._lock:
+            cached = self._lookup(list(set(hashes)))
+            self._conn.commit()
+
+        missing = {}
+        for text_hash, text in zip(hashes, texts):
+            if text_hash not in cached and text_hash not in missing:
+                missing[text_hash] = text
+
+        if missing:
+            vectors = self.embedding.embed_documents(list(missing.values()))
+            with self._lock:
+                self._store(list(missing.keys()), vectors)
+                self._conn.commit()
+            cached.update(zip(missing.keys(), vectors))
+
+        with self._lock:
+            self.misses += len(missing)
+            self.hits += len(texts) - len(missing)
+        metrics.increment("rag_cache_hits_total", len(texts) - len(missing), cache="embedding")
+        metrics.increment("rag_cache_misses_total", len(missing), cache="embedding")
+        return [cached[text_hash] for text_hash in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query, served from the cache when seen before"""
+        text_hash = self.text_hash(text)
+        with self._lock:
+            cached = self._lookup([text_hash])
+            self._conn.commit()
+        if text_hash in cached:
+            with self._lock:
+                self.hits += 1
+            metrics.increment("rag_cache_hits_total", cache="embedding")
+            return cached[text_hash]
+
+        vector = self.embedding.embed_query(text)
+        with self._lock:
+            self._store([text_hash], [vector])
+            self._conn.commit()
+            self.misses += 1
+        metrics.increment("rag_cache_misses_total", cache="embedding")
+        return vector
+
+    def stats(self) -> Dict:
+        """Cache hit/miss counts and current size"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries
+        }
+
+    def clear(self):
+        """Drop all cached vectors for this model"""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings WHERE model = ?", (self.model_name,))
+            self._conn.commit()
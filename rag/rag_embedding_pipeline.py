@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import logging
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from langchain.schema import Document
+from langchain.schema.embeddings import Embeddings
+from .rag_context import get_encoding
+from .rag_metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class RateLimiter:
+    """Sliding one-minute window limiter on requests and tokens"""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._window = deque()  # (timestamp, tokens)
+        self._tokens_in_window = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int):
+        """Block until a request of the given size fits in both budgets"""
+        # A single oversized request must still be let through eventually
+        tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._window and now - self._window[0][0] >= 60:
+                    self._tokens_in_window -= self._window.popleft()[1]
+                if (len(self._window) < self.requests_per_minute
+                        and self._tokens_in_window + tokens <= self.tokens_per_minute):
+                    self._window.append((now, tokens))
+                    self._tokens_in_window += tokens
+                    return
+                wait_for = 60 - (now - self._window[0][0])
+            time.sleep(max(0.05, min(wait_for, 1.0)))
+
+class EmbeddingPipeline:
+    """Embeds chunks in token-budgeted batches, concurrently and rate limited"""
+
+    def __init__(self, embedding: Embeddings, batch_tokens: int = 8000, max_batch_size: int = 256,
+                 max_workers: int = 4, requests_per_minute: int = 3000, tokens_per_minute: int = 1000000,
+                 max_retries: int = 6, encoding_name: str = "cl100k_base"):
+        """
+        Initialize embedding pipeline
+        Args:
+            embedding: Embedding model
+            batch_tokens: Token budget of one embedding request
+            max_batch_size: Maximum number of chunks in one request
+            max_workers: Number of requests in flight at once
+            requests_per_minute: Request rate limit
+            tokens_per_minute: Token rate limit
+            max_retries: Attempts per batch before the run fails
+            encoding_name: tiktoken encoding used for token counts
+        """
+        self.embedding = embedding
+        self.batch_tokens = batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.encoding_name = encoding_name
+
+    @property
+    def encoding(self):
+        """tiktoken encoding, loaded on first use and shared; None when offline"""
+        return get_encoding(self.encoding_name)
+
+    def count_tokens(self, text: str) -> int:
+        """Number of tokens in a text"""
+        if self.encoding is None:
+            return len(text) // 4 + 1
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def make_batches(self, chunks: List[Document], ids: List[str]) -> List[Dict]:
+        """
+        Greedily pack chunks into batches under the token budget
+        Returns:
+            List of batches, each {"ids", "chunks", "tokens"}
+        """
+        return list(self.iter_batches(zip(ids, chunks)))
+
+    def iter_batches(self, pairs: Iterable[Tuple[str, Document]]) -> Iterator[Dict]:
+        """Streaming make_batches over (id, chunk) pairs"""
+        current = {"ids": [], "chunks": [], "tokens": 0}
+        for chunk_id, chunk in pairs:
+            tokens = self.count_tokens(chunk.page_content)
+            if current["chunks"] and (current["tokens"] + tokens > self.batch_tokens
+                                      or len(current["chunks"]) >= self.max_batch_size):
+                yield current
+                current = {"ids": [], "chunks": [], "tokens": 0}
+            current["ids"].append(chunk_id)
+            current["chunks"].append(chunk)
+            current["tokens"] += tokens
+        if current["chunks"]:
+            yield current
+
+    def _embed_batch(self, batch: Dict) -> List[List[float]]:
+        """Embed one batch, waiting on the rate limiter and retrying with backoff"""
+        texts = [chunk.page_content for chunk in batch["chunks"]]
+
+        # Cached texts cost nothing, only charge the limiter for misses
+        missing = getattr(self.embedding, "missing", None)
+        uncached = missing(texts) if missing else texts
+        tokens = sum(self.count_tokens(text) for text in uncached)
+
+        for attempt in range(self.max_retries):
+            try:
+                if uncached:
+                    self.limiter.acquire(tokens)
+                with metrics.span("embed") as span:
+                    span.update(chunks=len(texts), tokens=tokens, attempt=attempt)
+                    vectors = self.embedding.embed_documents(texts)
+                metrics.increment("rag_tokens_total", tokens, kind="embedding")
+                return vectors
+            except Exception as e:
+                if attempt == self.max_retries - 1:
+                    raise
+                delay = min(60.0, 2 ** attempt) + random.uniform(0, 1)
+                logger.warning(f"Embedding batch failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def run(self, chunks: List[Document], ids: List[str],
+            write_batch: Callable[[List[str], List[Document], List[List[float]]], None],
+            existing_ids: Optional[Callable[[List[str]], Set[str]]] = None) -> int:
+        """
+        Embed chunks and hand each finished batch to write_batch right away
+        Chunks whose IDs are reported by existing_ids were persisted by an
+        earlier, interrupted run and are skipped, which makes runs resumable.
+        Args:
+            chunks: Chunks to embed
+            ids: Stable chunk IDs, one per chunk
+            write_batch: Persists (ids, chunks, vectors) of a finished batch
+            existing_ids: Returns the subset of IDs already persisted
+        Returns:
+            int: Number of chunks embedded in this run
+        """
+        return self.run_stream(zip(ids, chunks), write_batch, existing_ids)
+
+    def run_stream(self, pairs: Iterable[Tuple[str, Document]],
+                   write_batch: Callable[[List[str], List[Document], List[List[float]]], None],
+                   existing_ids: Optional[Callable[[List[str]], Set[str]]] = None) -> int:
+        """
+        Embed a stream of (id, chunk) pairs, see run
+        Batches are packed as chunks arrive and at most max_workers * 2 are
+        in flight. The stream is only advanced when a slot frees up, so it
+        is consumed no faster than chunks are embedded and written.
+        Returns:
+            int: Number of chunks embedded in this run
+        """
+        batches = self.iter_batches(pairs)
+        embedded = skipped = 0
+        exhausted = False
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="embed") as pool:
+            pending = {}
+            while not exhausted or pending:
+                while not exhausted and len(pending) < self.max_workers * 2:
+                    batch = next(batches, None)
+                    if batch is None:
+                        exhausted = True
+                        break
+                    if existing_ids:
+                        done = existing_ids(batch["ids"])
+                        if done:
+                            skipped += len(done)
+                            keep = [index for index, chunk_id in enumerate(batch["ids"]) if chunk_id not in done]
+                            if not keep:
+                                continue
+                            batch = dict(batch, ids=[batch["ids"][index] for index in keep],
+                                         chunks=[batch["chunks"][index] for index in keep])
+                    pending[pool.submit(self._embed_batch, batch)] = batch
+                    # Write finished batches before packing the next one,
+                    # so the first vectors land while the stream is still young
+                    if any(future.done() for future in pending):
+                        break
+                if not pending:
+                    continue
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch = pending.pop(future)
+                    write_batch(batch["ids"], batch["chunks"], future.result())
+                    embedded += len(batch["chunks"])
+        if skipped:
+            logger.info(f"Resumed: {skipped} chunks were already persisted")
+        return embedded
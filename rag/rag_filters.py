@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import json
+from typing import Any, Dict, Hashable, Iterable, Optional, Set
+
+# Chunk metadata fields that can be filtered on
+FILTER_FIELDS = ("source_file", "source_type", "page")
+# Comparison operators of Chroma's where clauses that MetadataIndex evaluates
+RANGE_OPERATORS = {
+    "$gt": lambda value, bound: value > bound,
+    "$gte": lambda value, bound: value >= bound,
+    "$lt": lambda value, bound: value < bound,
+    "$lte": lambda value, bound: value <= bound,
+}
+
+def _compare(compare, value: Any, operand: Any) -> bool:
+    """Range comparison that is False for values of another type, e.g. str to int"""
+    try:
+        return compare(value, operand)
+    except TypeError:
+        return False
+
+def build_where(source_file: Any = None, source_type: Any = None,
+                pages: Optional[tuple] = None) -> Optional[Dict]:
+    """
+    Metadata filter as a Chroma where clause
+    Args:
+        source_file: Source file path, or a list of them
+        source_type: "PDF", "URL" or "YouTube", or a list of them
+        pages: (first, last) page numbers as stored in the chunk metadata
+            (0-based PDF page index), inclusive; either end may be None.
+            Chunks without a page, e.g. of URLs and videos, never match
+    Returns:
+        Where clause, or None if nothing is filtered
+    """
+    clauses = []
+    for field, values in (("source_file", source_file), ("source_type", source_type)):
+        if values is None:
+            continue
+        values = [values] if isinstance(values, str) else sorted(set(values))
+        clauses.append({field: values[0]} if len(values) == 1 else {field: {"$in": values}})
+    if pages is not None:
+        first, last = pages
+        if first is not None:
+            clauses.append({"page": {"$gte": int(first)}})
+        if last is not None:
+            clauses.append({"page": {"$lte": int(last)}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def where_key(where: Optional[Dict]) -> str:
+    """Canonical string of a where clause, for caching per filter"""
+    return json.dumps(where, sort_keys=True) if where else ""
+
+class MetadataIndex:
+    """
+    Inverted index from metadata values to record keys
+    Lets stores resolve a where clause to the matching records before
+    ranking, so a search runs over the filtered subset only. Resolved
+    clauses are cached until the index changes. Not thread-safe; callers
+    hold their store's lock.
+    """
+
+    def __init__(self, fields: Iterable[str] = FILTER_FIELDS):
+        self.fields = tuple(fields)
+        self.postings: Dict[str, Dict[Any, Set[Hashable]]] = {field: {} for field in self.fields}
+        self._cache: Dict[str, frozenset] = {}
+
+    def add(self, key: Hashable, metadata: Dict):
+        """Index a record's metadata"""
+        for field in self.fields:
+            value = metadata.get(field)
+            if value is not None:
+                self.postings[field].setdefault(value, set()).add(key)
+        self._cache.clear()
+
+    def remove(self, key: Hashable, metadata: Dict):
+        """Unindex a record's metadata"""
+        for field in self.fields:
+            keys = self.postings[field].get(metadata.get(field))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.postings[field][metadata.get(field)]
+        self._cache.clear()
+
+    def clear(self):
+        """Remove all records"""
+        self.postings = {field: {} for field in self.fields}
+        self._cache.clear()
+
+    def match(self, where: Dict) -> frozenset:
+        """
+        Keys of the records matching a where clause
+        Supports $and, $or, equality, $in and the range operators on the
+        indexed fields.
+        Raises:
+            ValueError: For other fields or operators
+        """
+        cache_key = where_key(where)
+        keys = self._cache.get(cache_key)
+        if keys is None:
+            keys = self._cache[cache_key] = frozenset(self._match(where))
+        return keys
+
+    def _match(self, where: Dict) -> Set[Hashable]:
+        if "$and" in where or "$or" in where:
+            operator = "$and" if "$and" in where else "$or"
+            matches = [self._match(clause) for clause in where[operator]]
+            if not matches:
+                return set()
+            return set.intersection(*matches) if operator == "$and" else set.union(*matches)
+        if len(where) != 1:
+            return self._match({"$and": [{field: condition} for field, condition in where.items()]})
+
+        field, condition = next(iter(where.items()))
+        if field not in self.postings:
+            raise ValueError(f"Metadata field {field} is not indexed")
+        postings = self.postings[field]
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+
+        matches = None
+        for operator, operand in condition.items():
+            if operator == "$eq":
+                keys = set(postings.get(operand, ()))
+            elif operator == "$in":
+                keys = set().union(*(postings.get(value, ()) for value in operand))
+            elif operator in RANGE_OPERATORS:
+                keys = set().union(*(found for value, found in postings.items()
+                                     if _compare(RANGE_OPERATORS[operator], value, operand)))
+            else:
+                raise ValueError(f"Unsupported filter operator: {operator}")
+            matches = keys if matches is None else matches & keys
+        return matches or set()
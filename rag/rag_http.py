@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup
+from .rag_metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class HTTPFetcher:
+    """
+    Pooled, conditional fetching of web pages
+    One requests.Session keeps connections alive across pages. ETag and
+    Last-Modified validators are stored with the extracted text, so an
+    unchanged page costs one 304 response and is not parsed again.
+    Between begin and commit, fetched pages are held back from the cache
+    and a page fetched again is served from memory, so an index build
+    reuses the bodies its change check fetched and a failed build leaves
+    the cache as it was.
+    """
+
+    def __init__(self, cache_dir: str = "data/http_cache", max_connections: int = 16,
+                 per_host: int = 4, timeout: float = 30, user_agent: Optional[str] = None):
+        """
+        Initialize fetcher
+        Args:
+            cache_dir: Directory holding validators and extracted text per URL
+            max_connections: Pooled connections, also the fetch_many concurrency
+            per_host: Concurrent requests to any single host
+            timeout: Seconds to wait for a response
+            user_agent: User-Agent header, defaults to the USER_AGENT environment variable
+        """
+        self.cache_dir = cache_dir
+        self.max_connections = max_connections
+        self.per_host = per_host
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections, max_retries=2)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["User-Agent"] = user_agent or os.getenv("USER_AGENT", "rag-chatbot/1.0")
+        self._host_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        # Pages fetched since begin, by URL; None outside a transaction
+        self._pending: Optional[Dict[str, Dict]] = None
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+    def cached(self, url: str) -> Optional[Dict]:
+        """Previously fetched page, or None"""
+        try:
+            with open(self._path(url), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"Discarding unreadable HTTP cache entry for {url}: {e}")
+            return None
+
+    def _store(self, page: Dict):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(page["url"])
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(page, f)
+        os.replace(tmp_path, path)
+
+    def _keep(self, page: Dict):
+        """Cache a fetched page, or hold it back until commit"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending[page["url"]] = page
+                return
+        self._store(page)
+
+    def begin(self):
+        """Hold pages fetched from now on back from the cache until commit"""
+        with self._lock:
+            if self._pending is None:
+                self._pending = {}
+
+    def commit(self):
+        """Cache the pages held back since begin"""
+        with self._lock:
+            pending, self._pending = self._pending, None
+        for page in (pending or {}).values():
+            self._store(page)
+
+    def rollback(self):
+        """Drop the pages held back since begin, a no-op after commit"""
+        with self._lock:
+            self._pending = None
+
+    def latest(self, url: str) -> Optional[Dict]:
+        """
+        Page as last fetched, without a request
+        Returns:
+            The page fetched since begin during a transaction, else the
+            cached page; None if there is none
+        """
+        with self._lock:
+            if self._pending is not None:
+                return self._pending.get(url)
+        return self.cached(url)
+
+    def _slot(self, url: str) -> threading.BoundedSemaphore:
+        """Semaphore limiting concurrent requests to the URL's host"""
+        host = (urlparse(url).hostname or "").lower()
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_slots[host]
+
+    @staticmethod
+    def extract(html: str, url: str) -> Dict:
+        """Visible text and metadata of an HTML page, like WebBaseLoader"""
+        soup = BeautifulSoup(html, "html.parser")
+        description = soup.find("meta", attrs={"name": "description"})
+        html_tag = soup.find("html")
+        return {
+            "text": soup.get_text(),
+            "metadata": {
+                "source": url,
+                "title": soup.title.get_text() if soup.title else "No title found.",
+                "description": description.get("content", "No description found.") if description
+                else "No description found.",
+                "language": html_tag.get("lang", "No language found.") if html_tag else "No language found."
+            }
+        }
+
+    def fetch(self, url: str) -> Dict:
+        """
+        Fetch a page, revalidating a cached copy
+        During a transaction a page already fetched is returned as it was.
+        Returns:
+            Dict with "url", "text", "metadata", "etag", "last_modified",
+            "content_sha256", "fetched" and "status": "fetched" (new or
+            changed text), "unchanged" (200 with identical text) or
+            "not_modified" (304, cached text reused)
+        Raises:
+            requests.RequestException on network errors and HTTP error statuses
+        """
+        with self._lock:
+            held = self._pending.get(url) if self._pending is not None else None
+        if held is not None:
+            return held
+        previous = self.cached(url)
+        headers = {}
+        if previous and previous.get("etag"):
+            headers["If-None-Match"] = previous["etag"]
+        if previous and previous.get("last_modified"):
+            headers["If-Modified-Since"] = previous["last_modified"]
+
+        with self._slot(url), metrics.span("fetch") as span:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+            span["http_status"] = response.status_code
+
+        if response.status_code == 304 and previous:
+            metrics.increment("rag_cache_hits_total", cache="http")
+            page = dict(previous, fetched=time.time(), status="not_modified")
+            # Servers may rotate validators on 304 responses
+            page["etag"] = response.headers.get("ETag", previous.get("etag"))
+            page["last_modified"] = response.headers.get("Last-Modified", previous.get("last_modified"))
+            self._keep(page)
+            return page
+
+        response.raise_for_status()
+        metrics.increment("rag_cache_misses_total", cache="http")
+        if previous and previous.get("etag") and response.headers.get("ETag") == previous["etag"]:
+            # Server ignored the conditional request but the validator matches
+            extracted = {"text": previous["text"], "metadata": previous["metadata"]}
+        else:
+            extracted = self.extract(response.text, url)
+        content_hash = hashlib.sha256(extracted["text"].encode("utf-8")).hexdigest()
+        page = {
+            "url": url,
+            "text": extracted["text"],
+            "metadata": extracted["metadata"],
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_sha256": content_hash,
+            "fetched": time.time(),
+            "status": "unchanged" if previous and previous.get("content_sha256") == content_hash else "fetched"
+        }
+        self._keep(page)
+        return page
+
+    def fetch_many(self, urls: List[str]) -> List[Optional[Dict]]:
+        """
+        Fetch pages concurrently, at most per_host at a time per host
+        Returns:
+            One page per URL in input order, None where the fetch failed
+        """
+        def fetch_or_none(url: str) -> Optional[Dict]:
+            try:
+                return self.fetch(url)
+            except Exception as e:
+                logger.error(f"Error fetching {url}: {e}")
+                return None
+
+        if len(urls) == 1:
+            return [fetch_or_none(urls[0])]
+        with ThreadPoolExecutor(max_workers=min(self.max_connections, len(urls) or 1),
+                                thread_name_prefix="fetch") as pool:
+            return list(pool.map(fetch_or_none, urls))
+
+    def invalidate(self, url: Optional[str] = None):
+        """Forget the cached copy of one URL, or of all URLs"""
+        if url:
+            paths = [self._path(url)]
+        elif os.path.isdir(self.cache_dir):
+            paths = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)]
+        else:
+            paths = []
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
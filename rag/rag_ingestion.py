@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Job states, in the order a successful job passes through them
+QUEUED, LOADING, EMBEDDING, DONE, FAILED = "queued", "loading", "embedding", "done", "failed"
+ACTIVE_STATES = (QUEUED, LOADING, EMBEDDING)
+
+class IngestionQueue:
+    """Persistent queue of source ingestion jobs processed by one background worker"""
+
+    def __init__(self, ingest: Callable[[List[Dict], Callable[[str, str], None]], Dict[str, str]],
+                 path: str = "data/ingestion_jobs.json", max_finished: int = 100):
+        """
+        Initialize ingestion queue
+        Args:
+            ingest: Called with a batch of jobs and a progress(status, detail)
+                callback; returns an error message per failed job ID
+            path: JSON file holding the jobs, so queued work survives restarts
+            max_finished: Done and failed jobs kept for display
+        """
+        self.ingest = ingest
+        self.path = path
+        self.max_finished = max_finished
+        self._jobs: List[Dict] = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._worker: Optional[threading.Thread] = None
+        self.load()
+
+    def load(self):
+        """Load jobs from disk; jobs interrupted by a restart are queued again"""
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    self._jobs = json.load(f).get("jobs", [])
+        except Exception as e:
+            logger.error(f"Error loading ingestion jobs, starting empty: {e}")
+            self._jobs = []
+        for job in self._jobs:
+            if job["status"] in ACTIVE_STATES and job["status"] != QUEUED:
+                job.update(status=QUEUED, detail="Restarted")
+
+    def _save(self):
+        """Persist jobs atomically; caller holds the lock"""
+        finished = [job for job in self._jobs if job["status"] not in ACTIVE_STATES]
+        for job in finished[:max(0, len(finished) - self.max_finished)]:
+            self._jobs.remove(job)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"jobs": self._jobs}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def submit(self, source_type: str, file_path: str, label: Optional[str] = None) -> str:
+        """
+        Queue a source for ingestion
+        Args:
+            source_type: "PDF", "YouTube" or "URL"
+            file_path: Source file in the sources directory
+            label: Name shown in the job list, defaults to the file name
+        Returns:
+            str: Job ID
+        """
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "source_type": source_type,
+            "file_path": file_path,
+            "label": label or os.path.basename(file_path),
+            "status": QUEUED,
+            "detail": "",
+            "created": now,
+            "updated": now
+        }
+        with self._lock:
+            self._jobs.append(job)
+            self._save()
+            self._wakeup.notify()
+        self.start()
+        logger.info(f"Queued ingestion of {job['label']}")
+        return job["id"]
+
+    def start(self):
+        """Start the background worker if it is not running"""
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="rag-ingestion", daemon=True)
+                self._worker.start()
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Copy of a job"""
+        with self._lock:
+            for job in self._jobs:
+                if job["id"] == job_id:
+                    return dict(job)
+        return None
+
+    def jobs(self, limit: int = 20) -> List[Dict]:
+        """Copies of the most recent jobs, newest first"""
+        with self._lock:
+            return [dict(job) for job in reversed(self._jobs[-limit:])]
+
+    def latest(self, file_path: str) -> Optional[Dict]:
+        """Copy of the most recent job for a source file, or None"""
+        with self._lock:
+            for job in reversed(self._jobs):
+                if job["file_path"] == file_path:
+                    return dict(job)
+        return None
+
+    def pending(self) -> int:
+        """Number of jobs not yet done or failed"""
+        with self._lock:
+            return sum(job["status"] in ACTIVE_STATES for job in self._jobs)
+
+    def _update(self, batch: List[Dict], status: str, detail: str = ""):
+        """Move a batch of jobs to a new state"""
+        with self._lock:
+            for job in batch:
+                job.update(status=status, detail=detail, updated=time.time())
+            self._save()
+
+    def _run(self):
+        """Worker loop: take all queued jobs and ingest them as one batch"""
+        while True:
+            with self._lock:
+                while not any(job["status"] == QUEUED for job in self._jobs):
+                    self._wakeup.wait()
+                # Sources are synced together, so everything queued so far
+                # lands in the same shadow index and swap
+                batch = [job for job in self._jobs if job["status"] == QUEUED]
+
+            self._update(batch, LOADING)
+            try:
+                errors = self.ingest(batch, lambda status, detail="": self._update(batch, status, detail))
+            except Exception as e:
+                logger.exception("Ingestion failed")
+                errors = {job["id"]: str(e) for job in batch}
+
+            with self._lock:
+                for job in batch:
+                    error = errors.get(job["id"])
+                    job.update(status=FAILED if error else DONE, detail=error or "", updated=time.time())
+                self._save()
+            logger.info(f"Ingested {len(batch) - len(errors)} of {len(batch)} queued sources")
@@ -1,28 +1,123 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+import logging
 import os
-from typing import List, Dict, Optional
+import shutil
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import TYPE_CHECKING, Iterator, List, Dict, Optional
 from langchain.schema import Document
-from langchain_community.document_loaders import PyPDFLoader, WebBaseLoader
-from langchain_community.document_loaders.generic import GenericLoader
-from langchain_community.document_loaders.parsers.audio import OpenAIWhisperParser
-from langchain_community.document_loaders import YoutubeAudioLoader
+from .rag_metrics import metrics
+from .rag_transcript_cache import TranscriptCache, youtube_video_id
+
+# The PDF parser, HTTP client, YouTube downloader and transcriber are
+# imported on first use, so opening an existing index does not pay for them
+if TYPE_CHECKING:
+    from .rag_http import HTTPFetcher
+    from .rag_transcription import SegmentedTranscriber
+
+logger = logging.getLogger(__name__)
 
 class RAGLoader:
     """Handles document loading for RAG"""
     
-    def __init__(self, source_dir: str = "data/sources", temp_dir: str = "data/temp"):
+    # Default number of sources of each type loaded at the same time
+    DEFAULT_CONCURRENCY = {"PDF": 4, "YouTube": 2, "URL": 8}
+    
+    def __init__(self, source_dir: str = "data/sources", temp_dir: str = "data/temp",
+                 concurrency: Optional[Dict[str, int]] = None, source_timeout: Optional[float] = 900,
+                 transcript_cache: Optional[TranscriptCache] = None,
+                 max_temp_bytes: int = 2 * 1024 * 1024 * 1024,
+                 transcriber: Optional["SegmentedTranscriber"] = None,
+                 fetcher: Optional["HTTPFetcher"] = None, pdf_workers: Optional[int] = None):
         """
         Initialize RAG loader
         Args:
             source_dir: Directory containing source files
             temp_dir: Directory for temporary files
+            concurrency: Per source type concurrency limits for concurrent loading
+            source_timeout: Seconds before a source is abandoned during concurrent loading
+            transcript_cache: YouTube transcript cache, defaults to data/transcripts,
+                created on first use
+            max_temp_bytes: Oldest downloaded audio in temp_dir is deleted beyond this size
+            transcriber: Splits and transcribes downloaded audio, defaults to
+                OpenAI Whisper with 4 concurrent segments, created on first use
+            fetcher: Pooled conditional HTTP fetcher for URL sources, created
+                on first use by default
+            pdf_workers: Processes parsing page ranges of large PDFs, defaults
+                to the CPU count up to 4; 1 parses in this process
         """
         self.source_dir = source_dir
         self.temp_dir = temp_dir
+        self.concurrency = dict(self.DEFAULT_CONCURRENCY, **(concurrency or {}))
+        self.source_timeout = source_timeout
+        self._transcript_cache = transcript_cache
+        self.max_temp_bytes = max_temp_bytes
+        self._transcriber = transcriber
+        self._youtube_lock = threading.Lock()
+        self._fetcher = fetcher
+        self._fetcher_lock = threading.Lock()
+        self._holding_pages = False
+        self.pdf_workers = pdf_workers or min(4, os.cpu_count() or 1)
+        self.last_load_report: List[Dict] = []
         os.makedirs(source_dir, exist_ok=True)
         os.makedirs(temp_dir, exist_ok=True)
+        
+    @property
+    def fetcher(self) -> "HTTPFetcher":
+        """Shared HTTP fetcher, created on first use"""
+        with self._fetcher_lock:
+            if self._fetcher is None:
+                from .rag_http import HTTPFetcher
+                self._fetcher = HTTPFetcher()
+                if self._holding_pages:
+                    self._fetcher.begin()
+            return self._fetcher
+            
+    @property
+    def transcript_cache(self) -> TranscriptCache:
+        """YouTube transcript cache, created on first use"""
+        with self._youtube_lock:
+            if self._transcript_cache is None:
+                self._transcript_cache = TranscriptCache()
+            return self._transcript_cache
+            
+    @property
+    def transcriber(self) -> "SegmentedTranscriber":
+        """Audio transcriber, created on first use"""
+        with self._youtube_lock:
+            if self._transcriber is None:
+                from .rag_transcription import SegmentedTranscriber
+                self._transcriber = SegmentedTranscriber()
+            return self._transcriber
+            
+    def hold_fetched_pages(self):
+        """
+        Keep web pages fetched from now on out of the HTTP cache until
+        commit_fetched_pages; pages fetched meanwhile are fetched only once
+        """
+        with self._fetcher_lock:
+            self._holding_pages = True
+            if self._fetcher is not None:
+                self._fetcher.begin()
+                
+    def commit_fetched_pages(self):
+        """Write the held back pages to the HTTP cache, once they are indexed"""
+        with self._fetcher_lock:
+            self._holding_pages = False
+            fetcher = self._fetcher
+        if fetcher is not None:
+            fetcher.commit()
+            
+    def discard_fetched_pages(self):
+        """Drop the held back pages, a no-op after commit_fetched_pages"""
+        with self._fetcher_lock:
+            self._holding_pages = False
+            fetcher = self._fetcher
+        if fetcher is not None:
+            fetcher.rollback()
     
     def load_pdf(self, file_path: str) -> List[Document]:
         """Load PDF document"""
@@ -30,74 +125,184 @@ class RAGLoader:
             if not os.path.exists(file_path):
                 raise FileNotFoundError(f"PDF file not found: {file_path}")
                 
-            print(f"Loading PDF from: {file_path}")  # Debug log
-            
-            loader = PyPDFLoader(file_path)
-            documents = loader.load()
+            logger.info(f"Loading PDF from: {file_path}")
             
-            print(f"Loaded {len(documents)} pages from PDF")  # Debug log
+            documents = list(self.iter_pdf(file_path))
             
-            # Add source metadata
-            for doc in documents:
-                doc.metadata["source"] = file_path
-                doc.metadata["source_type"] = "PDF"
-                
+            logger.info(f"Loaded {len(documents)} pages from PDF")
             return documents
         except Exception as e:
-            print(f"Error loading PDF: {e}")  # Debug log
+            logger.error(f"Error loading PDF: {e}")
             return []
             
+    def iter_pdf(self, file_path: str) -> Iterator[Document]:
+        """Stream PDF pages in order, parsing large PDFs in worker processes"""
+        from .rag_pdf import iter_pdf_pages
+        for doc in iter_pdf_pages(file_path, workers=self.pdf_workers):
+            doc.metadata["source_type"] = "PDF"
+            yield doc
+            
     def load_youtube(self, url: str) -> List[Document]:
-        """Load YouTube content"""
+        """
+        Load YouTube content
+        Videos are downloaded and transcribed once; later loads read the
+        transcript cache by video ID and never touch yt-dlp or Whisper.
+        """
         try:
-            print(f"Loading YouTube content from: {url}")  # Debug log
-            
-            # Clean up the URL to get video ID
-            if "youtu.be" in url:
-                video_id = url.split("/")[-1].split("?")[0]
-                url = f"https://www.youtube.com/watch?v={video_id}"
-            
-            print(f"Processed YouTube URL: {url}")  # Debug log
+            logger.info(f"Loading YouTube content from: {url}")
             
-            # Create temp directory if it doesn't exist
-            os.makedirs(self.temp_dir, exist_ok=True)
+            video_id = youtube_video_id(url)
+            if video_id is None:
+                raise ValueError(f"Not a YouTube video URL: {url}")
+            url = f"https://www.youtube.com/watch?v={video_id}"
             
-            # Initialize loaders
-            audio_loader = YoutubeAudioLoader([url], self.temp_dir)
-            whisper_parser = OpenAIWhisperParser()
-            loader = GenericLoader(audio_loader, whisper_parser)
-            
-            # Load and parse content
-            print("Downloading and transcribing YouTube content...")  # Debug log
-            documents = loader.load()
-            
-            if not documents:
-                print("Warning: No content extracted from YouTube video")
-                return []
+            transcript = self.transcript_cache.get(video_id)
+            if transcript:
+                logger.info(f"Using cached transcript of {video_id}")
+                metrics.increment("rag_cache_hits_total", cache="transcript")
+            else:
+                metrics.increment("rag_cache_misses_total", cache="transcript")
+                segments = self.transcribe_youtube(url)
+                if not segments:
+                    logger.warning("No content extracted from YouTube video")
+                    return []
+                transcript = self.transcript_cache.put(video_id, url, segments)
                 
-            # Add metadata
-            for doc in documents:
-                doc.metadata["source"] = url
-                doc.metadata["source_type"] = "YouTube"
-                print(f"Added document with content length: {len(doc.page_content)}")  # Debug log
-                
-            print(f"Successfully loaded YouTube content: {len(documents)} documents")  # Debug log
+            # One document per transcript segment, cached or fresh alike
+            documents = [
+                Document(page_content=segment["text"], metadata={
+                    "source": url,
+                    "source_type": "YouTube",
+                    "video_id": video_id,
+                    "start": segment["start"],
+                    "end": segment["end"]
+                })
+                for segment in transcript["segments"]
+            ]
+            logger.info(f"Successfully loaded YouTube content: {len(documents)} documents")
             return documents
         
         except Exception as e:
-            print(f"Error loading YouTube content: {e}")  # Debug log
-            import traceback
-            traceback.print_exc()  # Print full error trace
+            logger.exception(f"Error loading YouTube content: {e}")  # Includes full error trace
             return []
             
-    def load_url(self, url: str) -> List[Document]:
-        """Load URL content"""
+    def transcribe_youtube(self, url: str) -> List[Dict]:
+        """
+        Download and transcribe a YouTube video
+        The audio is downloaded into its own directory under temp_dir, so
+        concurrent loads never pick up each other's files, and removed
+        once transcribed.
+        Returns:
+            Segments as [{"start", "end", "text"}], times in seconds
+        """
+        from langchain_community.document_loaders import YoutubeAudioLoader
+        video_id = youtube_video_id(url)
+        if video_id is None:
+            raise ValueError(f"Not a YouTube video URL: {url}")
+        download_dir = os.path.join(self.temp_dir, video_id)
+        shutil.rmtree(download_dir, ignore_errors=True)  # Leftovers of an interrupted download
+        os.makedirs(download_dir, exist_ok=True)
+        logger.info("Downloading and transcribing YouTube content...")
+        segments = []
+        offset = 0.0
+        try:
+            # Long videos may arrive in several files; times continue across them
+            for blob in YoutubeAudioLoader([url], download_dir).yield_blobs():
+                blob_segments, duration = self.transcriber.transcribe_file(str(blob.path), offset)
+                segments.extend(blob_segments)
+                offset += duration
+        finally:
+            shutil.rmtree(download_dir, ignore_errors=True)
+            self.trim_temp_dir()
+        return segments
+        
+    def invalidate_transcript(self, url: Optional[str] = None):
+        """Forget the cached transcript of a YouTube URL, or all transcripts"""
+        video_id = youtube_video_id(url) if url else None
+        if url and video_id is None:
+            raise ValueError(f"Not a YouTube video URL: {url}")
+        self.transcript_cache.invalidate(video_id)
+        
+    def trim_temp_dir(self):
+        """Delete the oldest downloaded files until temp_dir fits max_temp_bytes"""
         try:
-            loader = WebBaseLoader(url)
-            return loader.load()
+            files = []
+            for name in os.listdir(self.temp_dir):
+                path = os.path.join(self.temp_dir, name)
+                if os.path.isfile(path):
+                    stat = os.stat(path)
+                    files.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_temp_bytes:
+                    break
+                logger.info(f"Removing downloaded audio {path}")
+                os.remove(path)
+                total -= size
         except Exception as e:
-            print(f"Error loading URL: {e}")
-            return []
+            logger.error(f"Error trimming temporary files: {e}")
+            
+    def load_url(self, url: str) -> List[Document]:
+        """Load URL content"""
+        return self.load_urls([url])
+        
+    def load_urls(self, urls: List[str]) -> List[Document]:
+        """
+        Load web pages concurrently through the shared HTTP fetcher
+        Unchanged pages are revalidated with a conditional request and
+        their previously extracted text is reused.
+        """
+        documents = []
+        for url, page in zip(urls, self.fetcher.fetch_many(urls)):
+            if page is None:
+                continue
+            metadata = dict(page["metadata"], source=url, source_type="URL")
+            documents.append(Document(page_content=page["text"], metadata=metadata))
+        return documents
+        
+    def stale_url_sources(self, sources: List[Dict[str, str]], indexed: Dict[str, Dict]) -> List[str]:
+        """
+        Revalidate the pages of indexed URL sources
+        Args:
+            sources: Source configurations
+            indexed: Manifest entries by file path, holding the content hash
+                of each page as it was indexed under "pages"
+        Returns:
+            File paths of URL sources with at least one page whose text
+            differs from the indexed text
+        """
+        stale = []
+        for source in sources:
+            file_path = source.get("URL")
+            entry = indexed.get(file_path) if file_path else None
+            if entry is None:
+                continue
+            urls = self.read_urls(file_path)
+            pages = self.fetcher.fetch_many(urls)
+            hashes = entry.get("pages")
+            if hashes is None:
+                # Indexed before page hashes were recorded
+                changed = any(page and page["status"] == "fetched" for page in pages)
+            else:
+                changed = any(page and hashes.get(url) != page["content_sha256"] for url, page in zip(urls, pages))
+            if changed:
+                stale.append(file_path)
+        logger.info(f"{len(stale)} URL sources changed since they were indexed")
+        return stale
+        
+    def page_hashes(self, file_path: str) -> Dict[str, str]:
+        """Content hash of each page of a URL source as last fetched"""
+        hashes = {}
+        for url in self.read_urls(file_path):
+            page = self.fetcher.latest(url)
+            if page:
+                hashes[url] = page["content_sha256"]
+        return hashes
+        
+    def read_urls(self, file_path: str) -> List[str]:
+        """URLs in a URL source file, one per line"""
+        content = self.read_source_file(file_path) or ""
+        return [line.strip() for line in content.splitlines() if line.strip()]
             
     def read_source_file(self, file_path: str) -> Optional[str]:
         """Read content from source file"""
@@ -108,56 +313,206 @@ class RAGLoader:
             with open(file_path, 'r') as f:
                 return f.read().strip()
         except Exception as e:
-            print(f"Error reading source file: {e}")
+            logger.error(f"Error reading source file: {e}")
             return None
             
-    def load_from_sources(self, sources: List[Dict[str, str]]) -> List[Document]:
+    def load_source(self, source: Dict[str, str]) -> List[Document]:
+        """
+        Load documents from a single source
+        Args:
+            source: Source configuration, e.g. {"PDF": "data/sources/a.pdf"}
+        Returns:
+            List[Document]: Loaded documents
+        """
+        source_type = list(source.keys())[0]
+        source_path = source[source_type]
+        
+        logger.info(f"Loading {source_type} from: {source_path}")
+        
+        with metrics.span("load", source_type=source_type) as span:
+            if source_type == "PDF":
+                docs = self.load_pdf(source_path)
+            elif source_type == "YouTube":
+                url = self.read_source_file(source_path)
+                docs = self.load_youtube(url) if url else []
+            elif source_type == "URL":
+                urls = self.read_urls(source_path)
+                docs = self.load_urls(urls) if urls else []
+            else:
+                logger.warning(f"Unsupported source type: {source_type}")
+                return []
+            span.update(source_file=source_path, documents=len(docs))
+            
+        # Remember which source file produced each document
+        for doc in docs:
+            doc.metadata["source_file"] = source_path
+        return docs
+        
+    def stream_source(self, source: Dict[str, str]) -> Iterator[Document]:
+        """
+        Documents of a single source as they are parsed
+        PDFs are streamed page by page; other source types are loaded whole.
+        Unlike load_source, errors are raised rather than logged, so a
+        partially streamed source is never mistaken for a complete one.
+        A finished stream appends its entry to last_load_report.
+        """
+        source_type = list(source.keys())[0]
+        source_path = source[source_type]
+        if source_type != "PDF":
+            yield from self.load_source(source)
+            return
+            
+        logger.info(f"Streaming PDF from: {source_path}")
+        started = time.perf_counter()
+        pages = 0
+        for doc in self.iter_pdf(source_path):
+            doc.metadata["source_file"] = source_path
+            pages += 1
+            yield doc
+        # Parse time overlaps with downstream splitting and embedding
+        seconds = time.perf_counter() - started
+        metrics.observe("rag_stage_seconds", seconds, stage="load", source_type="PDF")
+        self.last_load_report.append(self._report_entry(source, "ok" if pages else "empty", pages, seconds))
+        logger.info(f"Streamed {pages} pages from {source_path}")
+        
+    def load_from_sources(self, sources: List[Dict[str, str]], concurrent: bool = False) -> List[Document]:
         """
         Load documents from multiple sources
         Args:
             sources: List of source configurations
+            concurrent: Load sources in parallel, see load_concurrently
         Returns:
-            List[Document]: Loaded documents
+            List[Document]: Loaded documents, in source order
         """
+        if concurrent:
+            return self.load_concurrently(sources)
+            
         documents = []
+        self.last_load_report = []
         
         for source in sources:
             source_type = list(source.keys())[0]
             source_path = source[source_type]
+            started = time.perf_counter()
             
             try:
-                print(f"Loading {source_type} from: {source_path}")  # Debug log
-                
-                if source_type == "PDF":
-                    docs = self.load_pdf(source_path)
-                elif source_type == "YouTube":
-                    url = self.read_source_file(source_path)
-                    if url:
-                        docs = self.load_youtube(url)
-                    else:
-                        continue
-                elif source_type == "URL":
-                    url = self.read_source_file(source_path)
-                    if url:
-                        docs = self.load_url(url)
-                    else:
-                        continue
-                else:
-                    print(f"Unsupported source type: {source_type}")
-                    continue
-                
-                if docs:
-                    documents.extend(docs)
-                    print(f"Successfully loaded {len(docs)} documents from {source_type}")  # Debug log
-                else:
-                    print(f"No documents loaded from {source_path}")
-                
+                docs = self.load_source(source)
+                status = "ok" if docs else "empty"
             except Exception as e:
-                print(f"Error loading {source_type} from {source_path}: {e}")
-                continue
+                logger.error(f"Error loading {source_type} from {source_path}: {e}")
+                docs, status = [], "error"
+                
+            self.last_load_report.append(self._report_entry(source, status, len(docs), time.perf_counter() - started))
+            if docs:
+                documents.extend(docs)
+                logger.info(f"Successfully loaded {len(docs)} documents from {source_type}")
+            else:
+                logger.warning(f"No documents loaded from {source_path}")
                 
         return documents
     
+    def load_concurrently(self, sources: List[Dict[str, str]]) -> List[Document]:
+        """
+        Load sources in parallel, one thread pool per source type
+        Each source type has its own concurrency limit, so slow Whisper
+        transcriptions never hold up PDF parsing. A source that runs longer
+        than source_timeout is abandoned and reported as "timeout". Results
+        are concatenated in source order, so the index stays reproducible.
+        Args:
+            sources: List of source configurations
+        Returns:
+            List[Document]: Loaded documents, in source order
+        """
+        pools = {
+            source_type: ThreadPoolExecutor(max_workers=limit, thread_name_prefix=f"load-{source_type}")
+            for source_type, limit in self.concurrency.items()
+        }
+        fallback_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="load-other")
+        started: Dict[int, float] = {}
+        finished: Dict[int, float] = {}
+        
+        def run(index: int, source: Dict[str, str]) -> List[Document]:
+            started[index] = time.perf_counter()
+            try:
+                return self.load_source(source)
+            finally:
+                finished[index] = time.perf_counter()
+        
+        futures = {}
+        for index, source in enumerate(sources):
+            source_type = list(source.keys())[0]
+            pool = pools.get(source_type, fallback_pool)
+            futures[pool.submit(run, index, source)] = index
+            
+        results: Dict[int, List[Document]] = {}
+        statuses: Dict[int, str] = {}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = futures[future]
+                try:
+                    results[index] = future.result()
+                    statuses[index] = "ok" if results[index] else "empty"
+                except Exception as e:
+                    logger.error(f"Error loading {sources[index]}: {e}")
+                    results[index], statuses[index] = [], "error"
+            if self.source_timeout:
+                now = time.perf_counter()
+                for future in list(pending):
+                    index = futures[future]
+                    if index in started and now - started[index] > self.source_timeout:
+                        # Threads cannot be killed; stop waiting and drop the result
+                        logger.warning(f"Timed out loading {sources[index]} after {self.source_timeout}s")
+                        pending.discard(future)
+                        results[index], statuses[index] = [], "timeout"
+                        
+        for pool in list(pools.values()) + [fallback_pool]:
+            pool.shutdown(wait=False, cancel_futures=True)
+            
+        documents = []
+        self.last_load_report = []
+        now = time.perf_counter()
+        for index, source in enumerate(sources):
+            seconds = finished.get(index, now) - started.get(index, now)
+            self.last_load_report.append(self._report_entry(source, statuses[index], len(results[index]), seconds))
+            documents.extend(results[index])
+            
+        logger.info(f"Loaded {len(documents)} documents from {len(sources)} sources concurrently")
+        return documents
+    
+    @staticmethod
+    def _report_entry(source: Dict[str, str], status: str, documents: int, seconds: float) -> Dict:
+        """Per-source entry of the load report"""
+        source_type = list(source.keys())[0]
+        return {
+            "source_type": source_type,
+            "source_file": source[source_type],
+            "status": status,
+            "documents": documents,
+            "seconds": round(seconds, 3)
+        }
+    
+    def scan_sources(self) -> List[Dict[str, str]]:
+        """
+        Scan sources directory for all source files
+        Returns:
+            List[Dict[str, str]]: Source configurations
+        """
+        sources = []
+        for filename in sorted(os.listdir(self.source_dir)):
+            file_path = os.path.join(self.source_dir, filename)
+            if filename.endswith('.pdf'):
+                sources.append({"PDF": file_path})
+            elif filename.endswith('.txt'):
+                if 'youtube' in filename.lower():
+                    sources.append({"YouTube": file_path})
+                else:
+                    sources.append({"URL": file_path})
+                    
+        logger.info(f"Found {len(sources)} source files in {self.source_dir}")
+        return sources
+    
     def load_documents(self, sources: Optional[List[Dict[str, str]]] = None) -> List[Document]:
         """
         Load all documents
@@ -167,19 +522,7 @@ class RAGLoader:
             List[Document]: All loaded documents
         """
         if sources is None:
-            # Scan sources directory for all files
-            sources = []
-            for filename in os.listdir(self.source_dir):
-                file_path = os.path.join(self.source_dir, filename)
-                if filename.endswith('.pdf'):
-                    sources.append({"PDF": file_path})
-                elif filename.endswith('.txt'):
-                    if 'youtube' in filename.lower():
-                        sources.append({"YouTube": file_path})
-                    else:
-                        sources.append({"URL": file_path})
-                        
-            print(f"Found {len(sources)} source files in {self.source_dir}")  # Debug log
+            sources = self.scan_sources()
             
         return self.load_from_sources(sources)
     
@@ -192,4 +535,4 @@ class RAGLoader:
                     if os.path.isfile(file_path):
                         os.remove(file_path)
         except Exception as e:
-            print(f"Error cleaning up temporary files: {e}")
\ No newline at end of file
+            logger.error(f"Error cleaning up temporary files: {e}")
\ No newline at end of file
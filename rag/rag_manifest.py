@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import logging
+import os
+import json
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class RAGManifest:
+    """Tracks ingested sources so only new or changed ones are re-embedded"""
+
+    def __init__(self, path: str):
+        """
+        Initialize ingestion manifest
+        Args:
+            path: JSON file holding one entry per ingested source file
+        """
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        self.load()
+
+    def exists(self) -> bool:
+        """Whether a manifest has been persisted before"""
+        return os.path.exists(self.path)
+
+    def load(self):
+        """Load manifest entries from disk"""
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    self.entries = json.load(f).get("sources", {})
+        except Exception as e:
+            logger.error(f"Error loading manifest, starting empty: {e}")
+            self.entries = {}
+
+    def save(self):
+        """Persist manifest entries atomically"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"sources": self.entries}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def file_hash(file_path: str) -> str:
+        """SHA-256 of a file's content"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def fingerprint(self, file_path: str) -> Dict:
+        """
+        Fingerprint a source file
+        Reuses the stored hash when size and mtime are unchanged, so
+        unchanged files are never re-read.
+        """
+        stat = os.stat(file_path)
+        previous = self.entries.get(file_path)
+        if previous and previous.get("mtime") == stat.st_mtime and previous.get("size") == stat.st_size:
+            content_hash = previous["sha256"]
+        else:
+            content_hash = self.file_hash(file_path)
+        return {"sha256": content_hash, "mtime": stat.st_mtime, "size": stat.st_size}
+
+    def diff(self, sources: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], List[Dict[str, str]], List[str]]:
+        """
+        Compare current sources against the manifest
+        Args:
+            sources: Source configurations, e.g. [{"PDF": "data/sources/a.pdf"}]
+        Returns:
+            (added, changed, removed): new and changed source configurations,
+            and file paths of sources that no longer exist
+        """
+        added, changed = [], []
+        seen = set()
+
+        for source in sources:
+            source_type = list(source.keys())[0]
+            file_path = source[source_type]
+            seen.add(file_path)
+
+            previous = self.entries.get(file_path)
+            if previous is None:
+                added.append(source)
+                continue
+
+            current = self.fingerprint(file_path)
+            if previous.get("sha256") != current["sha256"]:
+                changed.append(source)
+            elif previous.get("mtime") != current["mtime"]:
+                # Touched but identical content, refresh mtime only
+                previous.update(current)
+
+        removed = [path for path in self.entries if path not in seen]
+        return added, changed, removed
+
+    def record(self, source_type: str, file_path: str, chunks: int):
+        """Record a successfully ingested source"""
+        entry = self.fingerprint(file_path)
+        entry["source_type"] = source_type
+        entry["chunks"] = chunks
+        self.entries[file_path] = entry
+
+    def remove(self, file_path: str):
+        """Forget a source"""
+        self.entries.pop(file_path, None)
+
+    def clear(self):
+        """Forget all sources"""
+        self.entries = {}
+
+    def get(self, file_path: str) -> Optional[Dict]:
+        """Get manifest entry for a source file"""
+        return self.entries.get(file_path)
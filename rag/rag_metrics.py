@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+from langchain.callbacks.base import BaseCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets in seconds, from cache hits to slow transcriptions
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+def _label_key(labels: Dict[str, Any]) -> Tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format_labels(key: Tuple, extra: Optional[Tuple] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+class Metrics:
+    """Registry of counters, histograms and timed spans"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._counters: Dict[str, Dict[Tuple, float]] = {}
+        self._histograms: Dict[str, Dict[Tuple, Dict]] = {}
+        self._help: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, help_text: str):
+        """Set the help text of a metric"""
+        self._help[name] = help_text
+
+    def increment(self, name: str, value: float = 1, **labels: Any):
+        """Add to a counter"""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: Any):
+        """Record a histogram sample"""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = {"count": 0, "sum": 0.0, "max": 0.0,
+                                           "buckets": [0] * len(self.buckets)}
+            histogram["count"] += 1
+            histogram["sum"] += value
+            histogram["max"] = max(histogram["max"], value)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["buckets"][index] += 1
+
+    @contextmanager
+    def span(self, stage: str, **labels: Any) -> Iterator[Dict]:
+        """
+        Time a pipeline stage
+        Records rag_stage_seconds{stage=...} and emits one structured log
+        record. Fields added to the yielded dict are included in the log.
+        """
+        fields: Dict[str, Any] = {}
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            yield fields
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            self.observe("rag_stage_seconds", seconds, stage=stage, **labels)
+            if status == "error":
+                self.increment("rag_stage_errors_total", stage=stage, **labels)
+            logger.info("span", extra={"rag_event": dict(
+                fields, event="span", stage=stage, status=status, seconds=round(seconds, 6), **labels)})
+
+    def snapshot(self) -> Dict:
+        """All metrics as plain data"""
+        with self._lock:
+            return {
+                "counters": {
+                    name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                    for name, series in self._counters.items()
+                },
+                "histograms": {
+                    name: [{"labels": dict(key), "count": h["count"], "sum": round(h["sum"], 6),
+                            "max": round(h["max"], 6)} for key, h in series.items()]
+                    for name, series in self._histograms.items()
+                }
+            }
+
+    def to_json(self) -> str:
+        """All metrics as a JSON document"""
+        return json.dumps(self.snapshot())
+
+    def to_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    for bound, count in zip(self.buckets, histogram["buckets"]):
+                        lines.append(f"{name}_bucket{_format_labels(key, ('le', bound))} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {histogram['count']}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram['sum']}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Drop all recorded values"""
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+
+# Process-wide registry used by all RAG components
+metrics = Metrics()
+metrics.describe("rag_stage_seconds", "Duration of RAG pipeline stages")
+metrics.describe("rag_stage_errors_total", "RAG pipeline stages that raised")
+metrics.describe("rag_tokens_total", "Tokens processed, by kind")
+metrics.describe("rag_chunks_total", "Chunks split and indexed")
+metrics.describe("rag_dedup_chunks_total", "Duplicate chunks dropped before embedding, by kind")
+metrics.describe("rag_dedup_tokens_total", "Tokens of duplicate chunks not embedded")
+metrics.describe("rag_cache_hits_total", "Cache hits, by cache")
+metrics.describe("rag_cache_misses_total", "Cache misses, by cache")
+metrics.describe("rag_condense_skipped_total", "Follow-up questions answered without the question rewrite call")
+metrics.describe("rag_time_to_first_token_seconds", "Time from question to first streamed answer token")
+metrics.describe("rag_answer_cache_saved_seconds_total", "Answer latency avoided by answer cache hits")
+metrics.describe("rag_startup_seconds", "Time from process start until questions can be answered")
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """Times retrieval, question condensing and answer generation inside chains"""
+
+    def __init__(self, answer_tag: str):
+        self.answer_tag = answer_tag
+        self._started: Dict[UUID, Tuple[str, float]] = {}
+        self._streamed: Dict[UUID, int] = {}
+
+    def _start(self, run_id: UUID, stage: str):
+        self._started[run_id] = (stage, time.perf_counter())
+
+    def _end(self, run_id: UUID, status: str = "ok"):
+        stage, started = self._started.pop(run_id, (None, None))
+        if stage is None:
+            return
+        seconds = time.perf_counter() - started
+        metrics.observe("rag_stage_seconds", seconds, stage=stage)
+        if status == "error":
+            metrics.increment("rag_stage_errors_total", stage=stage)
+        logger.info("span", extra={"rag_event": {
+            "event": "span", "stage": stage, "status": status, "seconds": round(seconds, 6)}})
+
+    def on_retriever_start(self, serialized: Dict[str, Any], query: str, *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(run_id, "retrieve")
+
+    def on_retriever_end(self, documents: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_retriever_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, "error")
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: Any, *, run_id: UUID,
+                            tags: Optional[List[str]] = None, **kwargs: Any) -> None:
+        self._start(run_id, "generate" if self.answer_tag in (tags or []) else "condense")
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID,
+                     tags: Optional[List[str]] = None, **kwargs: Any) -> None:
+        self._start(run_id, "generate" if self.answer_tag in (tags or []) else "condense")
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        self._streamed[run_id] = self._streamed.get(run_id, 0) + 1
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        usage = (getattr(response, "llm_output", None) or {}).get("token_usage") or {}
+        streamed = self._streamed.pop(run_id, 0)
+        if usage:
+            metrics.increment("rag_tokens_total", usage.get("prompt_tokens", 0), kind="prompt")
+            metrics.increment("rag_tokens_total", usage.get("completion_tokens", 0), kind="completion")
+        elif streamed:
+            # Streaming responses carry no usage; count streamed tokens instead
+            metrics.increment("rag_tokens_total", streamed, kind="completion")
+        self._end(run_id)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._streamed.pop(run_id, None)
+        self._end(run_id, "error")
+
+class JSONLogFormatter(logging.Formatter):
+    """One JSON object per log record, including structured span fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        payload.update(getattr(record, "rag_event", {}))
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+def configure_logging(level: Optional[str] = None, json_logs: Optional[bool] = None):
+    """
+    Configure logging for the application
+    Args:
+        level: Log level, defaults to RAG_LOG_LEVEL or INFO
+        json_logs: Structured JSON lines, defaults to RAG_JSON_LOGS=1
+    """
+    level = level or os.getenv("RAG_LOG_LEVEL", "INFO")
+    if json_logs is None:
+        json_logs = os.getenv("RAG_JSON_LOGS", "0") == "1"
+
+    handler = logging.StreamHandler()
+    if json_logs:
+        handler.setFormatter(JSONLogFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level.upper())
+    if not json_logs:
+        # Span records are only useful as structured logs
+        logging.getLogger(__name__).setLevel(logging.WARNING)
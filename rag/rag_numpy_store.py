@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import json
+import uuid
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from langchain.schema import Document
+from langchain.schema.embeddings import Embeddings
+from langchain.schema.vectorstore import VectorStore
+from .rag_search import mmr_select
+from .rag_filters import MetadataIndex, where_key
+
+class NumpyVectorStore(VectorStore):
+    """
+    Exact vector search over a memory-mapped float32 matrix
+    Vectors are normalized and appended to vectors.f32; IDs, texts and
+    metadata go to an append-only JSONL sidecar. Queries are one matrix
+    product plus argpartition, served from the OS page cache. A metadata
+    index resolves filters to candidate rows, so filtered searches score
+    only the matching rows.
+    """
+
+    VECTORS_FILE = "vectors.f32"
+    SIDECAR_FILE = "vectors_meta.jsonl"
+
+    def __init__(self, persist_directory: str, embedding_function: Embeddings, block_rows: int = 65536):
+        """
+        Open or create a store
+        Args:
+            persist_directory: Directory holding the vector file and sidecar
+            embedding_function: Embedding model for queries and add_texts
+            block_rows: Rows scored per block, bounds memory for large stores
+        """
+        self.persist_directory = persist_directory
+        self.embedding_function = embedding_function
+        self.block_rows = block_rows
+        self.vectors_path = os.path.join(persist_directory, self.VECTORS_FILE)
+        self.sidecar_path = os.path.join(persist_directory, self.SIDECAR_FILE)
+        os.makedirs(persist_directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        """
+        Replay the sidecar and map the vector file
+        A crash can leave the two files out of step: vectors are written
+        first, so the vector file may hold rows the sidecar never recorded,
+        or end in a partly written row; the sidecar may end in a torn line.
+        Only rows present in both are kept, and both files are cut back to
+        them, so new rows are appended where their vectors will be read.
+        """
+        self.dim: Optional[int] = None
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[Dict] = []
+        self.row_of: Dict[str, int] = {}
+        self.deleted = set()
+        self.metadata_index = MetadataIndex()
+        self._matrix = None
+        self._live_rows = None
+        self._filter_rows: Dict[str, np.ndarray] = {}
+
+        records, torn = [], False
+        if os.path.exists(self.sidecar_path):
+            with open(self.sidecar_path, 'r') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        torn = True  # torn final line from an interrupted write
+                        break
+        self.dim = next((record["dim"] for record in records if record["op"] == "init"), None)
+        added = sum(1 for record in records if record["op"] == "add")
+        file_rows = self._vector_file_rows()
+        rows = min(added, file_rows) if self.dim else 0
+
+        kept = []
+        for record in records:
+            if record["op"] == "add":
+                if len(self.ids) == rows:
+                    continue
+                self._append_row(record["id"], record["text"], record["metadata"])
+            elif record["op"] == "delete":
+                if record["row"] >= rows:
+                    continue
+                self._delete_row(record["row"])
+            kept.append(record)
+
+        self._truncate_vectors(rows)
+        if torn or len(kept) != len(records):
+            # Rewrite the sidecar without the rows that have no vector
+            tmp_path = f"{self.sidecar_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                for record in kept:
+                    f.write(json.dumps(record) + "\n")
+            os.replace(tmp_path, self.sidecar_path)
+
+    def _vector_file_rows(self) -> int:
+        """Number of complete rows in the vector file"""
+        if not self.dim or not os.path.exists(self.vectors_path):
+            return 0
+        return os.path.getsize(self.vectors_path) // (4 * self.dim)
+
+    def _truncate_vectors(self, rows: int):
+        """Cut the vector file back to its first rows, dropping orphaned and partly written rows"""
+        if os.path.exists(self.vectors_path) and os.path.getsize(self.vectors_path) > 4 * (self.dim or 0) * rows:
+            with open(self.vectors_path, 'r+b') as f:
+                f.truncate(4 * (self.dim or 0) * rows)
+            self._matrix = None
+
+    def _append_row(self, chunk_id: str, text: str, metadata: Dict):
+        """Register a row in memory"""
+        self._live_rows = None
+        self._filter_rows = {}
+        previous = self.row_of.get(chunk_id)
+        if previous is not None:
+            self.deleted.add(previous)
+            self.metadata_index.remove(previous, self.metadatas[previous])
+        self.row_of[chunk_id] = len(self.ids)
+        self.metadata_index.add(len(self.ids), metadata)
+        self.ids.append(chunk_id)
+        self.texts.append(text)
+        self.metadatas.append(metadata)
+
+    def _delete_row(self, row: int):
+        """Tombstone a row in memory"""
+        self._live_rows = None
+        self._filter_rows = {}
+        self.deleted.add(row)
+        chunk_id = self.ids[row] if row < len(self.ids) else None
+        if chunk_id is not None and self.row_of.get(chunk_id) == row:
+            del self.row_of[chunk_id]
+            self.metadata_index.remove(row, self.metadatas[row])
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding_function
+
+    def matrix(self) -> np.ndarray:
+        """Memory-mapped (rows, dim) view of all stored vectors"""
+        with self._lock:
+            rows = len(self.ids)
+            if self._matrix is None or self._matrix.shape[0] != rows:
+                if not rows or not self.dim:
+                    return np.zeros((0, self.dim or 0), dtype=np.float32)
+                self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(rows, self.dim))
+            return self._matrix
+
+    def live_rows(self) -> np.ndarray:
+        """Sorted rows that are not deleted"""
+        with self._lock:
+            if self._live_rows is None:
+                self._live_rows = np.fromiter(sorted(self.row_of.values()), dtype=np.int64, count=len(self.row_of))
+            return self._live_rows
+
+    def filter_rows(self, where: Dict) -> np.ndarray:
+        """
+        Sorted live rows whose metadata matches a where clause
+        Args:
+            where: Chroma-style where clause, see rag_filters.MetadataIndex.match
+        """
+        key = where_key(where)
+        with self._lock:
+            rows = self._filter_rows.get(key)
+            if rows is None:
+                rows = self._filter_rows[key] = np.array(sorted(self.metadata_index.match(where)), dtype=np.int64)
+            return rows
+
+    def _candidate_rows(self, kwargs: Dict) -> Optional[np.ndarray]:
+        """Rows a search is restricted to by its "rows" and "filter" arguments"""
+        rows = kwargs.get("rows")
+        if kwargs.get("filter"):
+            matching = self.filter_rows(kwargs["filter"])
+            rows = matching if rows is None else np.intersect1d(np.asarray(rows, dtype=np.int64), matching)
+        return rows
+
+    def count(self) -> int:
+        """Number of live vectors"""
+        return len(self.row_of)
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], texts: List[str], metadatas: List[Dict]):
+        """Insert or replace vectors by ID"""
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or not len(vectors):
+            return
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        with self._lock:
+            records = []
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                records.append({"op": "init", "dim": self.dim})
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Vector dimension {vectors.shape[1]} does not match store dimension {self.dim}")
+
+            # Rows are numbered by position in the vector file, so drop any
+            # tail left by a write whose sidecar records were lost
+            self._truncate_vectors(len(self.ids))
+            # Vectors first: a sidecar row without its vector is discarded on load
+            with open(self.vectors_path, 'ab') as f:
+                f.write(vectors.tobytes())
+            for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                self._append_row(chunk_id, text, dict(metadata or {}))
+                records.append({"op": "add", "id": chunk_id, "text": text, "metadata": dict(metadata or {})})
+            self._write_sidecar(records)
+            self._matrix = None
+
+    def _write_sidecar(self, records: List[Dict]):
+        """Append records to the sidecar"""
+        with open(self.sidecar_path, 'a') as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+
+    def get_ids(self, ids: List[str]) -> set:
+        """The subset of IDs that are stored"""
+        with self._lock:
+            return {chunk_id for chunk_id in ids if chunk_id in self.row_of}
+
+    def get(self, include_vectors: bool = False) -> Dict:
+        """All live records, in row order"""
+        with self._lock:
+            rows = [row for row in range(len(self.ids)) if row not in self.deleted]
+            records = {
+                "ids": [self.ids[row] for row in rows],
+                "documents": [self.texts[row] for row in rows],
+                "metadatas": [self.metadatas[row] for row in rows]
+            }
+            if include_vectors:
+                records["embeddings"] = np.asarray(self.matrix()[rows]) if rows else np.zeros((0, self.dim or 0))
+            return records
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """Delete vectors by ID"""
+        with self._lock:
+            rows = [self.row_of[chunk_id] for chunk_id in ids or [] if chunk_id in self.row_of]
+            for row in rows:
+                self._delete_row(row)
+            self._write_sidecar([{"op": "delete", "row": row} for row in rows])
+        return True
+
+    def ids_where(self, key: str, value: Any) -> List[str]:
+        """IDs of all vectors whose metadata[key] equals value"""
+        with self._lock:
+            if key in self.metadata_index.fields:
+                rows = sorted(self.metadata_index.match({key: value}))
+            else:
+                rows = [row for row in self.row_of.values() if self.metadatas[row].get(key) == value]
+            return [self.ids[row] for row in rows]
+
+    def delete_where(self, key: str, value: Any):
+        """Delete all vectors whose metadata[key] equals value"""
+        with self._lock:
+            self.delete(self.ids_where(key, value))
+
+    def delete_collection(self):
+        """Remove all vectors and metadata from disk"""
+        with self._lock:
+            self._matrix = None
+            for path in (self.vectors_path, self.sidecar_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._load()
+
+    def search_by_vectors(self, queries: np.ndarray, k: int = 4,
+                          rows: Optional[np.ndarray] = None) -> List[List[Tuple[int, float]]]:
+        """
+        Exact top-k cosine search for a batch of query vectors
+        Args:
+            queries: (q, dim) query vectors
+            k: Results per query
+            rows: Optional distinct candidate rows to restrict the search to
+        Returns:
+            Per query, up to k (row, similarity) pairs, best first
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1, norms)
+
+        with self._lock:
+            matrix = self.matrix()
+            live = self.live_rows()
+        if not len(matrix):
+            return [[] for _ in range(len(queries))]
+
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        contiguous = rows is None and len(live) == len(matrix)
+        candidates = live if rows is None else np.intersect1d(np.asarray(rows, dtype=np.int64), live,
+                                                              assume_unique=True)
+        if not len(candidates):
+            return [[] for _ in range(len(queries))]
+
+        for start in range(0, len(candidates), self.block_rows):
+            block = candidates[start:start + self.block_rows]
+            if contiguous:
+                scores = matrix[block[0]:block[-1] + 1] @ queries.T
+            else:
+                scores = matrix[block] @ queries.T
+            scores = scores.T  # (q, block)
+            take = min(k, scores.shape[1])
+            top = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+            best_rows = np.concatenate([best_rows, block[top]], axis=1)
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+
+        results = []
+        for query_rows, query_scores in zip(best_rows, best_scores):
+            order = np.argsort(-query_scores)[:k]
+            results.append([(int(query_rows[i]), float(query_scores[i])) for i in order])
+        return results
+
+    def _document(self, row: int) -> Document:
+        return Document(page_content=self.texts[row], metadata=dict(self.metadatas[row]))
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, **kwargs)]
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        """Top-k documents and cosine similarities for a query vector, optionally within a filter"""
+        hits = self.search_by_vectors(np.asarray([embedding]), k, rows=self._candidate_rows(kwargs))[0]
+        return [(self._document(row), score) for row, score in hits]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self.embedding_function.embed_query(query), k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def max_marginal_relevance_search_by_vector(self, embedding: List[float], k: int = 4, fetch_k: int = 20,
+                                                lambda_mult: float = 0.5, **kwargs: Any) -> List[Document]:
+        """Diverse top-k: MMR over the vectors of the fetch_k nearest rows"""
+        hits = self.search_by_vectors(np.asarray([embedding]), fetch_k, rows=self._candidate_rows(kwargs))[0]
+        if not hits:
+            return []
+        rows = np.fromiter((row for row, _ in hits), dtype=np.int64, count=len(hits))
+        with self._lock:
+            vectors = np.asarray(self.matrix()[rows])
+        return [self._document(int(rows[index])) for index in mmr_select(embedding, vectors, k, lambda_mult)]
+
+    def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20,
+                                      lambda_mult: float = 0.5, **kwargs: Any) -> List[Document]:
+        return self.max_marginal_relevance_search_by_vector(
+            self.embedding_function.embed_query(query), k, fetch_k, lambda_mult, **kwargs)
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # Cosine similarity in [-1, 1] mapped to a relevance score in [0, 1]
+        return lambda score: min(1.0, max(0.0, (score + 1.0) / 2.0))
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[Dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        self.upsert(ids, self.embedding_function.embed_documents(texts), texts, metadatas)
+        return ids
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[Dict]] = None,
+                   persist_directory: str = "data/numpy_index/", **kwargs: Any) -> "NumpyVectorStore":
+        store = cls(persist_directory, embedding)
+        store.add_texts(texts, metadatas, ids=kwargs.get("ids"))
+        return store
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Tuple
+from pypdf import PdfReader
+from langchain.schema import Document
+from utils.pdf_worker import extract_pages
+
+logger = logging.getLogger(__name__)
+
+def _process_context():
+    """
+    Start method for page workers
+    Forking a process that runs other threads can deadlock the child, so
+    workers come from a fork server that has only imported the worker
+    module, not the rag package with Chroma, LangChain and OpenAI.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([extract_pages.__module__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+def iter_pdf_pages(file_path: str, workers: int = 4, pages_per_task: int = 8,
+                   parallel_min_pages: int = 64) -> Iterator[Document]:
+    """
+    Stream the pages of a PDF in page order
+    Small PDFs are parsed lazily in this process. Larger ones are parsed
+    by worker processes in page ranges, with at most two ranges per worker
+    in flight, so memory stays bounded however large the PDF is.
+    Args:
+        file_path: PDF file
+        workers: Worker processes for large PDFs
+        pages_per_task: Pages per range handed to a worker
+        parallel_min_pages: PDFs with fewer pages are parsed in this process
+    Yields:
+        One Document per page, with "source" and "page" metadata like PyPDFLoader
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"PDF file not found: {file_path}")
+    reader = PdfReader(file_path)
+    total = len(reader.pages)
+
+    def documents(pages: List[Tuple[int, str]]) -> Iterator[Document]:
+        for number, text in pages:
+            yield Document(page_content=text, metadata={"source": file_path, "page": number})
+
+    if workers <= 1 or total < parallel_min_pages:
+        for number in range(total):
+            yield from documents([(number, reader.pages[number].extract_text())])
+        return
+
+    del reader
+    logger.info(f"Parsing {total} pages of {file_path} with {workers} processes")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_process_context()) as pool:
+        pending = deque()
+        for start in range(0, total, pages_per_task):
+            pending.append(pool.submit(extract_pages, file_path, start, min(start + pages_per_task, total)))
+            if len(pending) >= workers * 2:
+                yield from documents(pending.popleft().result())
+        while pending:
+            yield from documents(pending.popleft().result())
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from typing import Dict, List, Optional
+import numpy as np
+
+# Vector search modes, named like LangChain's VectorStoreRetriever search types
+SEARCH_TYPES = ("similarity", "similarity_score_threshold", "mmr")
+# Settings each search mode uses, with their defaults
+SEARCH_DEFAULTS = {
+    "similarity": {"k": 4},
+    "similarity_score_threshold": {"k": 4, "score_threshold": 0.5},
+    "mmr": {"k": 4, "fetch_k": 20, "lambda_mult": 0.5},
+}
+
+def search_settings(search_type: str, search_kwargs: Optional[Dict] = None) -> Dict:
+    """
+    Settings of a search mode
+    Args:
+        search_type: One of SEARCH_TYPES
+        search_kwargs: Overrides of the mode's settings
+    Returns:
+        Keyword arguments for the vector store search of that mode
+    Raises:
+        ValueError: For an unknown search type, or a setting the mode does
+            not use, e.g. fetch_k in similarity mode
+    """
+    if search_type not in SEARCH_TYPES:
+        raise ValueError(f"Unknown search type: {search_type}")
+    settings = dict(SEARCH_DEFAULTS[search_type])
+    unknown = sorted(set(search_kwargs or {}) - set(settings))
+    if unknown:
+        raise ValueError(f"Search type {search_type} does not use {', '.join(unknown)}; "
+                         f"its settings are {', '.join(settings)}")
+    settings.update(search_kwargs or {})
+    return settings
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+def mmr_select(query: np.ndarray, candidates: np.ndarray, k: int = 4, lambda_mult: float = 0.5) -> List[int]:
+    """
+    Maximal marginal relevance selection over candidate vectors
+    Relevance to the query and pairwise similarities are computed once as
+    matrix products; each of the k steps updates every candidate's
+    redundancy with one vectorized maximum instead of looping over them.
+    Args:
+        query: (dim,) query vector
+        candidates: (n, dim) candidate vectors, e.g. the fetch_k nearest
+        k: Number of candidates to select
+        lambda_mult: 1 ranks by relevance only, 0 by diversity only
+    Returns:
+        Indices into candidates, in selection order
+    """
+    candidates = _normalize(np.asarray(candidates, dtype=np.float32))
+    if candidates.ndim != 2 or not len(candidates) or k <= 0:
+        return []
+    relevance = candidates @ _normalize(np.asarray(query, dtype=np.float32))
+    similarity = candidates @ candidates.T
+
+    first = int(np.argmax(relevance))
+    selected = [first]
+    redundancy = similarity[first].copy()
+    available = np.ones(len(candidates), dtype=bool)
+    available[first] = False
+    while len(selected) < min(k, len(candidates)):
+        scores = np.where(available, lambda_mult * relevance - (1 - lambda_mult) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return selected
@@ -1,74 +1,689 @@
 #!/usr/bin/env python
 # coding: utf-8
 
-from typing import Dict, Optional
+import json
+import logging
+import os
+import time
+import queue
+import asyncio
+import threading
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
 from .rag_loader import RAGLoader
 from .rag_vectorstore import RAGVectorStore
-from .rag_chain import RAGChain
+from .rag_chain import RAGChain, TokenStreamHandler, ANSWER_TAG
+from .rag_manifest import RAGManifest
+from .rag_session import RAGSession, SessionRegistry
+from .rag_answer_cache import SemanticAnswerCache
+from .rag_ingestion import IngestionQueue
+from .rag_dedup import normalize_url
+from .rag_filters import build_where
+from .rag_search import search_settings
+from .rag_metrics import metrics, MetricsCallbackHandler
+
+logger = logging.getLogger(__name__)
 
 class RAGService:
     """Main service for RAG operations"""
     
-    def __init__(self):
-        self.loader = RAGLoader()
-        self.vectorstore = RAGVectorStore()
+    def __init__(self, retrieval_mode: str = "vector", loader: Optional[RAGLoader] = None,
+                 vectorstore: Optional[RAGVectorStore] = None, llm=None,
+                 jobs_path: str = "data/ingestion_jobs.json", search_type: str = "similarity",
+                 search_kwargs: Optional[Dict] = None):
+        """
+        Initialize RAG service
+        Args:
+            retrieval_mode: "vector", "hybrid" (BM25 + vector), or "lexical" (no embedding call)
+            loader: Document loader, defaults to RAGLoader()
+            vectorstore: Vector store, defaults to RAGVectorStore()
+            llm: Chat model to use instead of OpenAI
+            jobs_path: File persisting the background ingestion queue
+            search_type: Vector search mode of the chains, see RAGChain
+            search_kwargs: Settings of the search mode, e.g. {"k": 6, "lambda_mult": 0.3}
+        """
+        self.retrieval_mode = retrieval_mode
+        # Fail here rather than when the first chain is built
+        search_settings(search_type, search_kwargs)
+        self.search_type = search_type
+        self.search_kwargs = search_kwargs
+        self.llm = llm
+        self.loader = loader or RAGLoader()
+        self.vectorstore = vectorstore or RAGVectorStore()
+        self.manifest = self._manifest_for(self.vectorstore)
         self.chain = None
+        self.sessions = SessionRegistry()
+        self.answer_cache = SemanticAnswerCache(self.vectorstore.embedding)
+        # Bumped whenever initialize swaps in a (re)built vector store
+        self.index_version = 0
+        # Serializes reindexing, which may be requested from several threads
+        self._index_lock = threading.Lock()
+        # Queries running against each generation, by id of its store;
+        # replaced generations are deleted once their last query finishes
+        self._generation_lock = threading.Lock()
+        self._generation_refs: Dict[int, int] = {}
+        self._retired: List[RAGVectorStore] = []
+        # Source files skipped by the last sync, mapped to the file they duplicate
+        self.duplicate_sources: Dict[str, str] = {}
+        self.ingestion = IngestionQueue(self.ingest, path=jobs_path)
+        # Set once a chain can answer questions
+        self._ready = threading.Event()
+        
+    @staticmethod
+    def _manifest_for(vectorstore: RAGVectorStore) -> RAGManifest:
+        """Manifest stored with an index generation"""
+        return RAGManifest(os.path.join(vectorstore.index_directory, "manifest.json"))
         
     def initialize(self, load_documents: bool = True) -> bool:
         """
         Initialize the RAG service
         Args:
-            load_documents: Whether to load new documents
+            load_documents: Whether to ingest new, changed and removed sources
+        Returns:
+            bool: Success status
+        """
+        with self._index_lock:
+            return self._initialize(load_documents)
+            
+    @property
+    def ready(self) -> bool:
+        """Whether questions can be answered"""
+        return self._ready.is_set()
+        
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Block until questions can be answered, returns False on timeout"""
+        return self._ready.wait(timeout)
+        
+    def warm_start(self, sync: bool = True) -> bool:
+        """
+        Initialize from the persisted index without ingesting first
+        Questions are answered from the index as it was last built; source
+        files added, changed or removed meanwhile are synced afterwards in
+        a background thread and swapped in like a refresh. Without a
+        persisted index this is a full initialize.
+        Args:
+            sync: Whether to sync source changes in the background
         Returns:
             bool: Success status
         """
+        with metrics.span("warm_start") as span:
+            warm = bool(self.manifest.entries)
+            span["warm"] = warm
+            if not warm:
+                logger.info("No persisted index found, ingesting sources")
+                return self.initialize()
+            if not self.initialize(load_documents=False):
+                return False
+        if sync:
+            threading.Thread(target=self._background_refresh, name="rag-warm-sync", daemon=True).start()
+        return True
+        
+    def _background_refresh(self):
+        """Sync source changes after a warm start"""
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error(f"Error syncing sources after warm start: {e}")
+            
+    async def ainitialize(self, load_documents: bool = True) -> bool:
+        """Async variant of initialize, run in an executor thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.initialize, load_documents)
+            
+    def _initialize(self, load_documents: bool) -> bool:
+        """Body of initialize, called with the index lock held"""
         try:
             if load_documents:
-                print("Loading documents...")  # Debug log
-                documents = self.loader.load_documents()
-                if not documents:
-                    print("No documents loaded")
+                logger.info("Syncing documents...")
+                self.loader.hold_fetched_pages()
+                try:
+                    indexed = self.sync_sources()
+                    self.loader.commit_fetched_pages()
+                finally:
+                    self.loader.discard_fetched_pages()
+                if not indexed:
+                    logger.warning("No documents loaded")
                     return False
                     
-                print(f"Creating vector store with {len(documents)} documents")  # Debug log
-                vectordb = self.vectorstore.create_or_load(documents)
-            else:
-                print("Loading existing vector store...")  # Debug log
-                vectordb = self.vectorstore.create_or_load()
+            logger.info("Loading existing vector store...")
+            vectordb = self.vectorstore.open()
                 
             if not vectordb:
-                print("Failed to create/load vector store")
+                logger.error("Failed to create/load vector store")
                 return False
                 
-            self.chain = RAGChain(vectordb)
-            print("RAG service initialized successfully")  # Debug log
+            # Swapping the chain drops all chains built for the previous index
+            chain = self._build_chain(self.vectorstore)
+            with self._generation_lock:
+                self.chain = chain
+                self.index_version += 1
+            self._ready.set()
+            logger.info("RAG service initialized successfully")
             return True
         except Exception as e:
-            print(f"Error initializing RAG service: {e}")
+            logger.error(f"Error initializing RAG service: {e}")
             return False
             
-    def get_answer(self, question: str, use_conversation: bool = True) -> Dict:
+    def _build_chain(self, vectorstore: RAGVectorStore) -> RAGChain:
+        """Chain factory over a vector store"""
+        return RAGChain(
+            vectorstore.open(),
+            lexical_index=vectorstore.open_lexical(),
+            retrieval_mode=self.retrieval_mode,
+            llm=self.llm,
+            search_type=self.search_type,
+            search_kwargs=self.search_kwargs
+        )
+        
+    def refresh(self, progress: Optional[Callable[[str, str], None]] = None,
+                revalidate_urls: bool = False) -> bool:
+        """
+        Sync source changes into a shadow index and swap it in
+        Queries keep being served from the live index until the new
+        generation is complete, then switch over atomically.
+        Args:
+            progress: Called with (status, detail) as ingestion proceeds
+            revalidate_urls: Also re-index URL sources whose pages changed,
+                checked with conditional requests
+        Returns:
+            bool: Whether the index holds any documents afterwards
+        """
+        with self._index_lock:
+            # Fetched pages reach the HTTP cache only once their index is live
+            self.loader.hold_fetched_pages()
+            try:
+                sources = self._distinct_sources(self.loader.scan_sources(), self.manifest)
+                stale = self.loader.stale_url_sources(sources, self.manifest.entries) if revalidate_urls else []
+                added, changed, removed = self.manifest.diff(sources)
+                if not (added or changed or removed or stale) and self.chain is not None:
+                    self.loader.commit_fetched_pages()
+                    return bool(self.manifest.entries)
+                    
+                shadow = self.vectorstore.shadow()
+                try:
+                    manifest = self._manifest_for(shadow)
+                    if not self.sync_sources(sources, shadow, manifest, progress, stale=stale):
+                        shadow.remove_index()
+                        return False
+                    chain = self._build_chain(shadow)
+                    shadow.promote()
+                except Exception:
+                    shadow.remove_index()
+                    raise
+                self._swap(shadow, manifest, chain)
+                self.loader.commit_fetched_pages()
+                return True
+            finally:
+                self.loader.discard_fetched_pages()
+            
+    def compact(self) -> Dict:
+        """
+        Rebuild the index without orphaned, duplicate and deleted vectors
+        The compacted generation is swapped in like a refresh, so queries
+        keep being served meanwhile.
+        Returns:
+            Report with chunk counts and index sizes before and after
+        """
+        with self._index_lock:
+            compacted, report = self.vectorstore.compacted(sources=self.manifest.entries.keys())
+            try:
+                manifest = self._manifest_for(compacted)
+                manifest.entries = dict(self.manifest.entries)
+                manifest.save()
+                chain = self._build_chain(compacted) if self.chain is not None else None
+                compacted.promote()
+            except Exception:
+                compacted.remove_index()
+                raise
+            self._swap(compacted, manifest, chain)
+            return report
+            
+    def _swap(self, vectorstore: RAGVectorStore, manifest: RAGManifest, chain: Optional[RAGChain]):
+        """Make a promoted generation live, called with the index lock held"""
+        with self._generation_lock:
+            previous = self.vectorstore
+            self.vectorstore, self.manifest, self.chain = vectorstore, manifest, chain
+            self.index_version += 1
+            # Queries already running keep the previous generation until they finish
+            in_use = id(previous) in self._generation_refs
+            if in_use:
+                self._retired.append(previous)
+        if chain is not None:
+            self._ready.set()
+        if not in_use:
+            previous.remove_index()
+        logger.info(f"Swapped in index generation {vectorstore.index_directory}")
+        
+    def _acquire_generation(self) -> Tuple[RAGVectorStore, Optional[RAGChain], int]:
+        """
+        Pin the live generation for one answer
+        Returns:
+            (store, chain, index_version) to answer with; pass the store to
+            _release_generation when done
+        """
+        with self._generation_lock:
+            vectorstore = self.vectorstore
+            self._generation_refs[id(vectorstore)] = self._generation_refs.get(id(vectorstore), 0) + 1
+            return vectorstore, self.chain, self.index_version
+            
+    def _release_generation(self, vectorstore: RAGVectorStore):
+        """Unpin a generation, deleting it if it was replaced and this was its last query"""
+        with self._generation_lock:
+            count = self._generation_refs.pop(id(vectorstore)) - 1
+            if count:
+                self._generation_refs[id(vectorstore)] = count
+                return
+            if not any(retired is vectorstore for retired in self._retired):
+                return
+            self._retired = [retired for retired in self._retired if retired is not vectorstore]
+        vectorstore.remove_index()
+        logger.info(f"Removed retired index generation {vectorstore.index_directory}")
+            
+    def ingest(self, jobs: List[Dict], progress: Callable[[str, str], None]) -> Dict[str, str]:
+        """
+        Ingest a batch of queued jobs, used by the ingestion queue
+        Returns:
+            Error message per failed job ID
+        """
+        self.refresh(progress)
+        errors = {}
+        for job in jobs:
+            if job["file_path"] in self.duplicate_sources:
+                original = os.path.basename(self.duplicate_sources[job["file_path"]])
+                errors[job["id"]] = f"Duplicate of {original}, not indexed again"
+            elif self.manifest.get(job["file_path"]) is None:
+                errors[job["id"]] = "No content could be loaded from this source"
+        return errors
+        
+    def _distinct_sources(self, sources: List[Dict[str, str]], manifest: RAGManifest) -> List[Dict[str, str]]:
+        """
+        Drop source files that duplicate another source
+        URL and YouTube files are compared by their normalized URLs, PDFs
+        by content hash. Of a group of duplicates the file already indexed
+        is kept, else the first one; the others are listed in
+        duplicate_sources and treated as absent.
+        """
+        keys = {}
+        for source in sources:
+            source_type = list(source.keys())[0]
+            file_path = source[source_type]
+            try:
+                if source_type == "PDF":
+                    keys[file_path] = "sha256:" + manifest.fingerprint(file_path)["sha256"]
+                else:
+                    urls = sorted({normalize_url(url) for url in self.loader.read_urls(file_path)})
+                    keys[file_path] = f"{source_type}:" + " ".join(urls) if urls else None
+            except Exception as e:
+                logger.error(f"Error fingerprinting {file_path}: {e}")
+                keys[file_path] = None
+                
+        kept: Dict[str, str] = {}
+        # Indexed files first, so a duplicate never displaces them
+        for source in sorted(sources, key=lambda source: manifest.get(list(source.values())[0]) is None):
+            file_path = list(source.values())[0]
+            if keys[file_path] is not None:
+                kept.setdefault(keys[file_path], file_path)
+        self.duplicate_sources = {
+            file_path: kept[key] for file_path, key in keys.items() if key is not None and kept[key] != file_path
+        }
+        for file_path, original in self.duplicate_sources.items():
+            logger.warning(f"Skipping {file_path}, a duplicate of {original}")
+        return [source for source in sources if list(source.values())[0] not in self.duplicate_sources]
+        
+    def submit_source(self, source_type: str, file_path: str, label: Optional[str] = None) -> str:
+        """Queue a source file for background ingestion, returns the job ID"""
+        return self.ingestion.submit(source_type, file_path, label)
+            
+    def sync_sources(self, sources: Optional[List[Dict[str, str]]] = None,
+                     vectorstore: Optional[RAGVectorStore] = None,
+                     manifest: Optional[RAGManifest] = None,
+                     progress: Optional[Callable[[str, str], None]] = None,
+                     stale: Optional[List[str]] = None) -> bool:
+        """
+        Bring the vector store in line with the source files
+        Only added or changed sources are loaded, split and embedded.
+        Chunks are upserted under stable IDs, so unchanged chunks of a
+        changed source are kept and only its stale chunks are deleted;
+        chunks of removed sources are deleted.
+        Args:
+            sources: Optional source configurations, scans the sources directory by default
+            vectorstore: Store to update, defaults to the live one
+            manifest: Manifest of that store, defaults to the live one
+            progress: Called with (status, detail) as ingestion proceeds
+            stale: Source file paths to re-index even though the files are unchanged
+        Returns:
+            bool: Whether the index holds any documents afterwards
+        """
+        with metrics.span("sync") as span:
+            indexed = self._sync_sources(sources, vectorstore or self.vectorstore,
+                                         manifest or self.manifest, progress, stale or [], span)
+        return indexed
+        
+    def _sync_sources(self, sources: Optional[List[Dict[str, str]]], vectorstore: RAGVectorStore,
+                      manifest: RAGManifest, progress: Optional[Callable[[str, str], None]],
+                      stale: List[str], span: Dict) -> bool:
+        """Body of sync_sources, recording counts on the sync span"""
+        progress = progress or (lambda status, detail="": None)
+        if sources is None:
+            sources = self.loader.scan_sources()
+        sources = self._distinct_sources(sources, manifest)
+            
+        if not manifest.exists():
+            # Vectors persisted without a manifest cannot be attributed to
+            # their sources, so start from an empty index once
+            logger.warning("No ingestion manifest found, rebuilding index")
+            vectorstore.reset()
+            manifest.clear()
+            
+        added, changed, removed = manifest.diff(sources)
+        changed += [source for source in sources
+                    if list(source.values())[0] in stale and source not in added + changed]
+        logger.info(f"Sources: {len(added)} added, {len(changed)} changed, {len(removed)} removed")
+        span.update(added=len(added), changed=len(changed), removed=len(removed),
+                    duplicates=len(self.duplicate_sources))
+        
+        # Chunks of changed sources stay until the new version is upserted,
+        # then only the chunks it no longer has are deleted
+        for file_path in removed:
+            vectorstore.delete_source(file_path)
+        for file_path in removed + [list(source.values())[0] for source in changed]:
+            manifest.remove(file_path)
+            
+        to_load = added + changed
+        # PDFs stream page by page into embedding; the other source types
+        # are loaded concurrently up front, since transcription dominates
+        streamed = [source for source in to_load if "PDF" in source]
+        loaded = [source for source in to_load if "PDF" not in source]
+        by_source: Dict[str, List] = {}
+        if loaded:
+            progress("loading", f"Loading {len(loaded)} sources")
+            for doc in self.loader.load_from_sources(loaded, concurrent=True):
+                by_source.setdefault(doc.metadata["source_file"], []).append(doc)
+                
+        for position, source in enumerate(streamed + loaded, 1):
+            source_type = list(source.keys())[0]
+            file_path = source[source_type]
+            progress("embedding", f"Embedding {os.path.basename(file_path)} ({position}/{len(to_load)})")
+            if source in streamed:
+                try:
+                    chunks = vectorstore.add_documents(self.loader.stream_source(source))
+                except Exception as e:
+                    # Drop the chunks of the partial stream; not recorded, so retried next time
+                    logger.error(f"Error streaming {source_type} from {file_path}: {e}")
+                    vectorstore.delete_source(file_path)
+                    continue
+                if not self.loader.last_load_report[-1]["documents"]:
+                    vectorstore.delete_source(file_path)
+                    continue
+            else:
+                docs = by_source.get(file_path)
+                if not docs:
+                    # Not recorded, so a failed load is retried next time
+                    vectorstore.delete_source(file_path)
+                    continue
+                try:
+                    chunks = vectorstore.add_documents(docs)
+                except Exception as e:
+                    # Drop the batches already written; not recorded, so retried next time
+                    logger.error(f"Error embedding {source_type} from {file_path}: {e}")
+                    vectorstore.delete_source(file_path)
+                    continue
+            vectorstore.delete_source(file_path, keep_ids=vectorstore.last_chunk_ids)
+            manifest.record(source_type, file_path, chunks)
+            if source_type == "URL":
+                # Later revalidations compare pages against the indexed text
+                manifest.entries[file_path]["pages"] = self.loader.page_hashes(file_path)
+            report = vectorstore.last_dedup_report
+            if report:
+                manifest.entries[file_path]["duplicate_chunks"] = report["exact_duplicates"] + report["near_duplicates"]
+                manifest.entries[file_path]["duplicate_tokens"] = report["tokens_saved"]
+            logger.info(f"Embedded {chunks} chunks from {file_path}")
+                
+        vectorstore.flush()
+        manifest.save()
+        return bool(manifest.entries)
+            
+    def metadata_filter(self, filters: Optional[Dict]) -> Optional[Dict]:
+        """
+        Where clause of answer filters
+        Args:
+            filters: Any of "source" (indexed source file path or name, or
+                part of a name like "catalog", or a list of them),
+                "source_type" ("PDF", "URL" or "YouTube", or a list) and
+                "pages" ((first, last) 0-based PDF pages, inclusive)
+        Returns:
+            Chroma-style where clause, or None without filters
+        Raises:
+            ValueError: For unknown filters or sources matching no indexed source
+        """
+        if not filters:
+            return None
+        unknown = set(filters) - {"source", "source_type", "pages"}
+        if unknown:
+            raise ValueError(f"Unknown filters: {', '.join(sorted(unknown))}")
+        source_files = None
+        if filters.get("source") is not None:
+            names = [filters["source"]] if isinstance(filters["source"], str) else filters["source"]
+            source_files = [file_path for name in names for file_path in self._matching_sources(name)]
+        return build_where(source_files, filters.get("source_type"), filters.get("pages"))
+        
+    def _matching_sources(self, name: str) -> List[str]:
+        """Indexed source files named by a path, a file name or part of one"""
+        indexed = list(self.manifest.entries)
+        matches = ([file_path for file_path in indexed if name in (file_path, os.path.basename(file_path))]
+                   or [file_path for file_path in indexed if name.lower() in os.path.basename(file_path).lower()])
+        if not matches:
+            raise ValueError(f"No indexed source matches {name}")
+        return matches
+            
+    def get_answer(self, question: str, use_conversation: bool = True,
+                   session_id: Optional[str] = None, filters: Optional[Dict] = None) -> Dict:
         """
         Get answer to a question
         Args:
             question: User's question
             use_conversation: Whether to use conversational chain
+            session_id: Chat session whose conversation the question belongs to
+            filters: Restrict retrieval to matching chunks, e.g. {"source": "catalog"},
+                {"source_type": "YouTube"} or {"pages": (10, 20)}; see metadata_filter
         """
         try:
-            if use_conversation:
-                chain = self.chain.create_conversational_chain()
-                return chain({"question": question})
-            else:
-                chain = self.chain.create_qa_chain()
-                return chain({"query": question})
+            return self._run_chain(question, use_conversation, self.sessions.get(session_id),
+                                   where=self.metadata_filter(filters))
+        except Exception as e:
+            logger.error(f"Error getting answer: {e}")
+            return {
+                "answer": "Sorry, I encountered an error processing your question.",
+                "source_documents": []
+            }
+            
+    async def aget_answer(self, question: str, use_conversation: bool = True,
+                          session_id: Optional[str] = None, filters: Optional[Dict] = None) -> Dict:
+        """Async variant of get_answer, invoking the chain asynchronously"""
+        try:
+            where = self.metadata_filter(filters)
+            with metrics.span("answer", mode="conversation" if use_conversation else "qa") as span:
+                result = await self._aanswer(question, use_conversation, self.sessions.get(session_id), where)
+                span["from_cache"] = bool(result.get("from_cache"))
+            return result
         except Exception as e:
-            print(f"Error getting answer: {e}")
+            logger.error(f"Error getting answer: {e}")
             return {
                 "answer": "Sorry, I encountered an error processing your question.",
                 "source_documents": []
             }
             
-    def clear_memory(self):
-        """Clear conversation memory"""
-        if self.chain:
-            self.chain.memory.clear() 
\ No newline at end of file
+    def _run_chain(self, question: str, use_conversation: bool, session: RAGSession,
+                   callbacks: Optional[List] = None, where: Optional[Dict] = None) -> Dict:
+        """Answer a question and record the turn in the session"""
+        with metrics.span("answer", mode="conversation" if use_conversation else "qa") as span:
+            result = self._answer(question, use_conversation, session, callbacks, where)
+            span["from_cache"] = bool(result.get("from_cache"))
+        return result
+        
+    def _answer(self, question: str, use_conversation: bool, session: RAGSession,
+                callbacks: Optional[List] = None, where: Optional[Dict] = None) -> Dict:
+        """Serve a question from the answer cache or run the chain"""
+        # The generation stays on disk until the answer is complete, even if
+        # newer ones are swapped in meanwhile
+        vectorstore, rag_chain, version = self._acquire_generation()
+        try:
+            index_version = version if self._cacheable(use_conversation, session, where) else None
+            scope = self._cache_scope(rag_chain, use_conversation)
+            cached = (self._cached_answer(question, session, index_version, scope)
+                      if index_version is not None else None)
+            if cached:
+                return cached
+                
+            started = time.perf_counter()
+            chain, inputs = self._chain_inputs(rag_chain, question, use_conversation, session, where)
+            result = chain(inputs, callbacks=list(callbacks or []) + [MetricsCallbackHandler(ANSWER_TAG)])
+            self._record(question, session, result, time.perf_counter() - started, index_version, scope)
+            return result
+        finally:
+            self._release_generation(vectorstore)
+        
+    async def _aanswer(self, question: str, use_conversation: bool, session: RAGSession,
+                       where: Optional[Dict] = None) -> Dict:
+        """Async variant of _answer; embedding calls for the answer cache run in the executor"""
+        loop = asyncio.get_running_loop()
+        vectorstore, rag_chain, version = self._acquire_generation()
+        try:
+            index_version = version if self._cacheable(use_conversation, session, where) else None
+            scope = self._cache_scope(rag_chain, use_conversation)
+            cached = (await loop.run_in_executor(None, self._cached_answer, question, session, index_version, scope)
+                      if index_version is not None else None)
+            if cached:
+                return cached
+                
+            started = time.perf_counter()
+            chain, inputs = self._chain_inputs(rag_chain, question, use_conversation, session, where)
+            result = await chain.acall(inputs, callbacks=[MetricsCallbackHandler(ANSWER_TAG)])
+            await loop.run_in_executor(None, self._record, question, session, result,
+                                       time.perf_counter() - started, index_version, scope)
+            return result
+        finally:
+            self._release_generation(vectorstore)
+        
+    @staticmethod
+    def _cacheable(use_conversation: bool, session: RAGSession, where: Optional[Dict] = None) -> bool:
+        """Whether an answer may be served from and stored in the answer cache"""
+        # Without history or filters the answer depends on the question alone
+        return where is None and (not use_conversation or not session.chat_history)
+        
+    @staticmethod
+    def _cache_scope(chain: RAGChain, use_conversation: bool) -> str:
+        """Answer cache scope: the chain and the retrieval settings it answers with"""
+        return json.dumps({
+            "conversation": use_conversation,
+            "retrieval_mode": chain.retrieval_mode,
+            "search_type": chain.search_type,
+            "search_kwargs": chain.search_kwargs,
+            "context_tokens": chain.context_tokens
+        }, sort_keys=True, default=str)
+        
+    def _cached_answer(self, question: str, session: RAGSession, index_version: int,
+                       scope: str = "") -> Optional[Dict]:
+        """Answer from the semantic answer cache, recorded in the session, or None"""
+        cached = self.answer_cache.lookup(question, index_version, scope)
+        if not cached:
+            return None
+        logger.info(f"Answer cache hit ({cached['similarity']:.3f}): {cached['cached_question']}")
+        session.record(question, cached["answer"],
+                       [doc.metadata.get("source", "") for doc in cached["source_documents"]])
+        return dict(cached, result=cached["answer"], from_cache=True)
+        
+    @staticmethod
+    def _chain_inputs(chain: RAGChain, question: str, use_conversation: bool, session: RAGSession,
+                      where: Optional[Dict] = None):
+        """Chain to run and its inputs"""
+        if use_conversation:
+            return (chain.get_conversational_chain(where),
+                    {"question": question, "chat_history": session.history_messages()})
+        return chain.get_qa_chain(where), {"query": question}
+        
+    def _record(self, question: str, session: RAGSession, result: Dict, seconds: float,
+                index_version: Optional[int], scope: str = ""):
+        """Record a generated answer in the session and the answer cache"""
+        answer = result.get("answer", result.get("result", ""))
+        sources = [doc.metadata.get("source", "") for doc in result.get("source_documents", [])]
+        session.record(question, answer, sources)
+        if index_version is not None:
+            self.answer_cache.store(question, index_version, result, seconds, scope)
+            
+    def _start_stream(self, question: str, use_conversation: bool, session_id: Optional[str],
+                      emit: Callable[[Dict], None], filters: Optional[Dict] = None):
+        """Run the chain in a worker thread, emitting token, result and error events"""
+        started = time.perf_counter()
+        first_token = []
+        session = self.sessions.get(session_id)
+        
+        def on_token(token: str):
+            if not first_token:
+                first_token.append(time.perf_counter() - started)
+                metrics.observe("rag_time_to_first_token_seconds", first_token[0])
+                logger.info(f"Time to first token: {first_token[0]:.3f}s")
+            emit({"type": "token", "content": token})
+            
+        def run():
+            try:
+                result = self._run_chain(question, use_conversation, session,
+                                         callbacks=[TokenStreamHandler(on_token)],
+                                         where=self.metadata_filter(filters))
+                if result.get("from_cache"):
+                    # Nothing was generated, send the cached answer in one piece
+                    on_token(result["answer"])
+                emit({
+                    "type": "sources",
+                    "answer": result.get("answer", result.get("result", "")),
+                    "source_documents": result.get("source_documents", []),
+                    "time_to_first_token": first_token[0] if first_token else None
+                })
+            except Exception as e:
+                logger.error(f"Error streaming answer: {e}")
+                emit({
+                    "type": "error",
+                    "answer": "Sorry, I encountered an error processing your question.",
+                    "source_documents": []
+                })
+                
+        threading.Thread(target=run, name="rag-stream", daemon=True).start()
+        
+    def stream_answer(self, question: str, use_conversation: bool = True,
+                      session_id: Optional[str] = None, filters: Optional[Dict] = None) -> Iterator[Dict]:
+        """
+        Stream an answer token by token
+        Args:
+            question: User's question
+            use_conversation: Whether to use conversational chain
+            session_id: Chat session whose conversation the question belongs to
+            filters: Restrict retrieval to matching chunks, see get_answer
+        Yields:
+            {"type": "token", "content": str} for each answer token, then one
+            {"type": "sources", "answer", "source_documents", "time_to_first_token"}
+            or {"type": "error", "answer", "source_documents"} event
+        """
+        events = queue.Queue()
+        self._start_stream(question, use_conversation, session_id, events.put, filters)
+        while True:
+            event = events.get()
+            yield event
+            if event["type"] != "token":
+                return
+                
+    async def astream_answer(self, question: str, use_conversation: bool = True,
+                             session_id: Optional[str] = None,
+                             filters: Optional[Dict] = None) -> AsyncIterator[Dict]:
+        """Async variant of stream_answer, yielding the same events"""
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        self._start_stream(question, use_conversation, session_id,
+                           lambda event: loop.call_soon_threadsafe(events.put_nowait, event), filters)
+        while True:
+            event = await events.get()
+            yield event
+            if event["type"] != "token":
+                return
+            
+    def clear_memory(self, session_id: Optional[str] = None):
+        """Clear conversation memory of a session"""
+        self.sessions.get(session_id).clear()
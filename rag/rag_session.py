@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import time
+import threading
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+from langchain.schema import AIMessage, HumanMessage
+from .rag_context import token_count
+
+# Session used when a caller does not identify itself
+DEFAULT_SESSION = "default"
+
+class RAGSession:
+    """Conversation state of one chat session"""
+
+    def __init__(self, session_id: str, max_history_tokens: int = 1000,
+                 max_display_bytes: int = 256 * 1024):
+        """
+        Initialize session
+        Args:
+            session_id: Session identifier
+            max_history_tokens: Token budget of the history passed to the
+                chain; the oldest turns are dropped beyond it, so the prompt
+                of a turn does not grow with the length of the conversation
+            max_display_bytes: Byte budget of the history kept for display;
+                the oldest turns are dropped beyond it, but the latest turn
+                is always kept
+        """
+        self.session_id = session_id
+        self.max_history_tokens = max_history_tokens
+        self.max_display_bytes = max_display_bytes
+        # (tokens, bytes, question message, answer message) per remembered turn
+        self._window: Deque[Tuple[int, int, HumanMessage, AIMessage]] = deque()
+        self.history_tokens = 0
+        # (question, answer, sources) per turn, for display, and the bytes of each
+        self.chat_history: Deque[Tuple[str, str, List[str]]] = deque()
+        self._display_sizes: Deque[int] = deque()
+        self.display_bytes = 0
+        self.size_bytes = 0
+        self.last_used = time.monotonic()
+
+    def touch(self):
+        """Mark the session as used now"""
+        self.last_used = time.monotonic()
+
+    def history_messages(self) -> List:
+        """Most recent turns within the token budget, as chat messages for the chain"""
+        return [message for _, _, question, answer in self._window for message in (question, answer)]
+
+    def record(self, question: str, answer: str, sources: Optional[List[str]] = None):
+        """Add a finished turn to memory and history"""
+        sources = sources or []
+        turn_bytes = len(question.encode("utf-8")) + len(answer.encode("utf-8"))
+        tokens = token_count(question) + token_count(answer)
+        self._window.append((tokens, turn_bytes, HumanMessage(content=question), AIMessage(content=answer)))
+        self.history_tokens += tokens
+        display_bytes = turn_bytes + sum(len(source.encode("utf-8")) for source in sources)
+        self.chat_history.append((question, answer, sources))
+        self._display_sizes.append(display_bytes)
+        self.display_bytes += display_bytes
+        # Remembered turns are held twice: once in the window, once in the display history
+        self.size_bytes += turn_bytes + display_bytes
+        while self._window and self.history_tokens > self.max_history_tokens:
+            dropped_tokens, dropped_bytes, _, _ = self._window.popleft()
+            self.history_tokens -= dropped_tokens
+            self.size_bytes -= dropped_bytes
+        while len(self.chat_history) > 1 and self.display_bytes > self.max_display_bytes:
+            self.chat_history.popleft()
+            dropped_bytes = self._display_sizes.popleft()
+            self.display_bytes -= dropped_bytes
+            self.size_bytes -= dropped_bytes
+
+    def clear(self):
+        """Forget the conversation"""
+        self._window.clear()
+        self.history_tokens = 0
+        self.chat_history.clear()
+        self._display_sizes.clear()
+        self.display_bytes = 0
+        self.size_bytes = 0
+
+class SessionRegistry:
+    """Per-session conversation state with LRU and idle-timeout eviction"""
+
+    def __init__(self, max_sessions: int = 500, idle_timeout: Optional[float] = 3600,
+                 max_bytes: int = 64 * 1024 * 1024, max_history_tokens: int = 1000,
+                 max_display_bytes: int = 256 * 1024):
+        """
+        Initialize session registry
+        Args:
+            max_sessions: Maximum number of live sessions
+            idle_timeout: Seconds of inactivity before a session is evicted
+            max_bytes: Cap on the conversation bytes held by all sessions
+            max_history_tokens: Token budget of each session's remembered history
+            max_display_bytes: Byte budget of each session's display history;
+                it bounds the session in use, which is never evicted
+        """
+        self.max_sessions = max_sessions
+        self.max_history_tokens = max_history_tokens
+        self.max_display_bytes = max_display_bytes
+        self.idle_timeout = idle_timeout
+        self.max_bytes = max_bytes
+        self._sessions: "OrderedDict[str, RAGSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def get(self, session_id: Optional[str] = None) -> RAGSession:
+        """Get a session, creating it on first use"""
+        session_id = session_id or DEFAULT_SESSION
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = RAGSession(session_id, self.max_history_tokens, self.max_display_bytes)
+                self._sessions[session_id] = session
+            else:
+                self._sessions.move_to_end(session_id)
+            session.touch()
+            self._evict(keep=session_id)
+            return session
+
+    def drop(self, session_id: str):
+        """Remove a session, e.g. when its browser tab is closed"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def evict(self):
+        """Evict idle sessions and enforce the size caps"""
+        with self._lock:
+            self._evict()
+
+    def _evict(self, keep: Optional[str] = None):
+        """Evict idle, then least recently used sessions; caller holds the lock"""
+        if self.idle_timeout:
+            now = time.monotonic()
+            for session_id in [sid for sid, session in self._sessions.items()
+                               if sid != keep and now - session.last_used > self.idle_timeout]:
+                del self._sessions[session_id]
+                self.evicted += 1
+
+        total = sum(session.size_bytes for session in self._sessions.values())
+        for session_id in list(self._sessions):
+            if len(self._sessions) <= self.max_sessions and total <= self.max_bytes:
+                break
+            if session_id == keep:
+                continue
+            total -= self._sessions.pop(session_id).size_bytes
+            self.evicted += 1
+
+    def stats(self) -> Dict:
+        """Number of live sessions and the conversation bytes they hold"""
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": sum(session.size_bytes for session in self._sessions.values()),
+                "evicted": self.evicted,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes
+            }
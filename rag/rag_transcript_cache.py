@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import re
+import json
+import time
+import logging
+from typing import Dict, List, Optional
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger(__name__)
+
+# YouTube video IDs are 11 characters of [A-Za-z0-9_-]
+VIDEO_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{11}$")
+
+def youtube_video_id(url: str) -> Optional[str]:
+    """
+    Normalized video ID of a YouTube URL
+    Handles youtu.be links, watch?v=, /shorts/, /embed/, /live/ and /v/
+    paths on any youtube.com subdomain, and bare video IDs.
+    Returns:
+        The video ID, or None if the URL is not a YouTube video URL
+    """
+    url = (url or "").strip()
+    if VIDEO_ID_PATTERN.match(url):
+        return url
+    parsed = urlparse(url if "//" in url else f"https://{url}")
+    host = (parsed.hostname or "").lower()
+    parts = [part for part in parsed.path.split("/") if part]
+
+    candidate = None
+    if host == "youtu.be" or host.endswith(".youtu.be"):
+        candidate = parts[0] if parts else None
+    elif host == "youtube.com" or host.endswith(".youtube.com") or host == "youtube-nocookie.com" \
+            or host.endswith(".youtube-nocookie.com"):
+        if parts[:1] == ["watch"]:
+            candidate = parse_qs(parsed.query).get("v", [None])[0]
+        elif len(parts) >= 2 and parts[0] in ("shorts", "embed", "live", "v"):
+            candidate = parts[1]
+    return candidate if candidate and VIDEO_ID_PATTERN.match(candidate) else None
+
+class TranscriptCache:
+    """Transcripts with segment timestamps persisted per YouTube video ID"""
+
+    def __init__(self, cache_dir: str = "data/transcripts", max_bytes: int = 200 * 1024 * 1024):
+        """
+        Initialize transcript cache
+        Args:
+            cache_dir: Directory holding one JSON file per video
+            max_bytes: Least recently used transcripts are evicted beyond this size
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def _path(self, video_id: str) -> str:
+        return os.path.join(self.cache_dir, f"{video_id}.json")
+
+    def get(self, video_id: str) -> Optional[Dict]:
+        """
+        Cached transcript of a video
+        Returns:
+            Dict with "video_id", "url", "segments" ([{"start", "end", "text"}])
+            and "created", or None if not cached
+        """
+        path = self._path(video_id)
+        try:
+            with open(path, 'r') as f:
+                transcript = json.load(f)
+            # mtime tracks last use for eviction
+            os.utime(path)
+            return transcript
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"Error reading cached transcript {path}, discarding it: {e}")
+            self.invalidate(video_id)
+            return None
+
+    def put(self, video_id: str, url: str, segments: List[Dict]) -> Dict:
+        """Persist a transcript atomically and enforce the size cap"""
+        transcript = {"video_id": video_id, "url": url, "segments": segments, "created": time.time()}
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(video_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(transcript, f)
+        os.replace(tmp_path, path)
+        self._evict(keep=path)
+        return transcript
+
+    def invalidate(self, video_id: Optional[str] = None):
+        """Drop the transcript of one video, or all transcripts"""
+        paths = [self._path(video_id)] if video_id else [
+            os.path.join(self.cache_dir, name) for name in self._names()]
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _names(self) -> List[str]:
+        if not os.path.isdir(self.cache_dir):
+            return []
+        return [name for name in os.listdir(self.cache_dir) if name.endswith(".json")]
+
+    def _evict(self, keep: Optional[str] = None):
+        """Remove least recently used transcripts until the cache fits max_bytes"""
+        entries = []
+        for name in self._names():
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue  # evicted by a concurrent load
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            logger.info(f"Evicting cached transcript {path}")
+            self.invalidate(os.path.basename(path)[:-len(".json")])
+            total -= size
+
+    def stats(self) -> Dict:
+        """Number and total size of cached transcripts"""
+        sizes = []
+        for name in self._names():
+            try:
+                sizes.append(os.path.getsize(os.path.join(self.cache_dir, name)))
+            except FileNotFoundError:
+                pass
+        return {"transcripts": len(sizes), "bytes": sum(sizes), "max_bytes": self.max_bytes}
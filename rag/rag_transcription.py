@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import io
+import os
+import time
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from .rag_metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class TranscriptionBackend(ABC):
+    """Speech-to-text for one bounded-length audio segment"""
+
+    @abstractmethod
+    def transcribe(self, audio: bytes, filename: str) -> str:
+        """
+        Transcribe an encoded audio segment
+        Args:
+            audio: Encoded audio, e.g. MP3 bytes
+            filename: Name with an extension matching the encoding
+        Returns:
+            str: Transcribed text
+        """
+
+class OpenAIWhisperBackend(TranscriptionBackend):
+    """OpenAI Whisper API transcription"""
+
+    def __init__(self, model: str = "whisper-1", api_key: Optional[str] = None,
+                 base_url: Optional[str] = None, max_retries: int = 3):
+        self.model = model
+        self.api_key = api_key
+        self.base_url = base_url or os.getenv("OPENAI_API_BASE")
+        self.max_retries = max_retries
+        self._client = None
+
+    def transcribe(self, audio: bytes, filename: str) -> str:
+        if self._client is None:
+            import openai
+            self._client = openai.OpenAI(api_key=self.api_key, base_url=self.base_url)
+        file_obj = io.BytesIO(audio)
+        file_obj.name = filename
+        for attempt in range(self.max_retries):
+            try:
+                file_obj.seek(0)
+                return self._client.audio.transcriptions.create(model=self.model, file=file_obj).text
+            except Exception as e:
+                if attempt == self.max_retries - 1:
+                    raise
+                delay = 2 ** attempt
+                logger.warning(f"Transcribing {filename} failed ({e}), retrying in {delay}s")
+                time.sleep(delay)
+
+def frame_energy(samples: np.ndarray, frame: int, block_frames: int = 6000) -> np.ndarray:
+    """
+    Mean squared amplitude per frame
+    Computed a block of frames at a time in float32, so long recordings
+    never need a full-length floating point copy.
+    Args:
+        samples: Mono samples
+        frame: Samples per frame; a trailing partial frame is ignored
+        block_frames: Frames converted at once
+    Returns:
+        One value per whole frame
+    """
+    frames = len(samples) // frame
+    energy = np.empty(frames, dtype=np.float32)
+    for first in range(0, frames, block_frames):
+        last = min(frames, first + block_frames)
+        block = samples[first * frame:last * frame].astype(np.float32).reshape(last - first, frame)
+        energy[first:last] = np.square(block).mean(axis=1)
+    return energy
+
+def split_on_silence(samples: np.ndarray, frame_rate: int, max_segment_seconds: float = 600,
+                     min_segment_seconds: float = 300, frame_seconds: float = 0.1) -> List[Tuple[float, float]]:
+    """
+    Bounded-length segments cut at the quietest point before each bound
+    Args:
+        samples: Mono samples
+        frame_rate: Samples per second
+        max_segment_seconds: No segment is longer than this
+        min_segment_seconds: Cuts are searched between this and the maximum
+        frame_seconds: Loudness is measured over frames of this length
+    Returns:
+        (start, end) pairs in seconds covering the whole audio
+    """
+    frame = max(1, int(frame_rate * frame_seconds))
+    frames = len(samples) // frame
+    duration = len(samples) / frame_rate if frame_rate else 0.0
+    if duration <= max_segment_seconds or not frames:
+        return [(0.0, duration)] if duration else []
+
+    energy = frame_energy(samples, frame)
+    segments = []
+    start = 0
+    max_frames = int(max_segment_seconds / frame_seconds)
+    min_frames = int(min(min_segment_seconds, max_segment_seconds) / frame_seconds)
+    while (frames - start) * frame_seconds > max_segment_seconds:
+        window = energy[start + min_frames:start + max_frames]
+        if len(window):
+            # Latest frame within 1 dB of the quietest, keeping segments long
+            quiet = np.flatnonzero(window <= window.min() * 1.26)
+            cut = start + min_frames + int(quiet[-1])
+        else:
+            cut = start + max_frames
+        segments.append((start * frame_seconds, cut * frame_seconds))
+        start = cut
+    segments.append((start * frame_seconds, duration))
+    return segments
+
+class SegmentedTranscriber:
+    """Splits long audio on silence and transcribes the segments concurrently"""
+
+    def __init__(self, backend: Optional[TranscriptionBackend] = None, max_workers: int = 4,
+                 max_segment_seconds: float = 600, min_segment_seconds: float = 300,
+                 export_format: str = "mp3", sample_rate: int = 16000):
+        """
+        Initialize transcriber
+        Args:
+            backend: Speech-to-text backend, defaults to the OpenAI Whisper API
+            max_workers: Segments transcribed at the same time
+            max_segment_seconds: Upper bound on segment length; 10 minutes of
+                mono MP3 stays well below the Whisper API's 25MB upload limit
+            min_segment_seconds: Segments are cut at the quietest point between
+                this and the upper bound
+            export_format: Encoding sent to the backend
+            sample_rate: Audio is downmixed to mono 16-bit at this rate before
+                splitting; 16 kHz is what Whisper works at
+        """
+        self.backend = backend or OpenAIWhisperBackend()
+        self.max_workers = max_workers
+        self.max_segment_seconds = max_segment_seconds
+        self.min_segment_seconds = min_segment_seconds
+        self.export_format = export_format
+        self.sample_rate = sample_rate
+
+    def transcribe(self, audio_path: str) -> List[Dict]:
+        """
+        Transcribe an audio file
+        Returns:
+            Segments as [{"start", "end", "text"}] in order, times in seconds
+        Raises:
+            Exception from the backend when a segment cannot be transcribed,
+            so a partial transcript is never cached
+        """
+        return self.transcribe_file(audio_path)[0]
+
+    def transcribe_file(self, audio_path: str, offset: float = 0.0) -> Tuple[List[Dict], float]:
+        """
+        Transcribe an audio file that is one part of a longer recording
+        Args:
+            audio_path: Audio file
+            offset: Seconds of the recording before this file, added to the
+                segment times
+        Returns:
+            Segments as in transcribe, and the duration of the file in seconds
+        """
+        from pydub import AudioSegment
+
+        audio = AudioSegment.from_file(audio_path)
+        duration = audio.duration_seconds
+        # Only the downmixed copy is kept: an hour of it is about 115 MB
+        mono = audio.set_channels(1).set_frame_rate(self.sample_rate).set_sample_width(2)
+        del audio
+        # A view of the PCM bytes, not a copy
+        samples = np.frombuffer(mono.raw_data, dtype="<i2")
+        bounds = split_on_silence(samples, mono.frame_rate, self.max_segment_seconds, self.min_segment_seconds)
+        del samples
+        logger.info(f"Transcribing {os.path.basename(audio_path)}: {duration:.0f}s "
+                    f"in {len(bounds)} segments, {self.max_workers} at a time")
+
+        def run(index: int, start: float, end: float) -> Dict:
+            with metrics.span("transcribe_segment") as span:
+                segment = mono[int(start * 1000):int(end * 1000)]
+                encoded = segment.export(format=self.export_format).read()
+                text = self.backend.transcribe(encoded, f"segment_{index}.{self.export_format}")
+                span.update(segment=index, audio_seconds=round(end - start, 1))
+            return {"start": round(offset + start, 3), "end": round(offset + end, 3), "text": text.strip()}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="transcribe") as pool:
+            futures = [pool.submit(run, index, start, end) for index, (start, end) in enumerate(bounds)]
+            # Stitched in audio order regardless of completion order
+            segments = [segment for segment in (future.result() for future in futures) if segment["text"]]
+        return segments, duration
@@ -1,56 +1,482 @@
 #!/usr/bin/env python
 # coding: utf-8
 
-from typing import List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 from langchain.schema import Document
+from langchain.schema.embeddings import Embeddings
 from langchain_openai import OpenAIEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores.chroma import Chroma
+from chromadb.api.client import SharedSystemClient
 import os
+import copy
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
 from utils.env_manager import init_environment
+from .rag_embedding_cache import CachedEmbeddings
+from .rag_embedding_pipeline import EmbeddingPipeline
+from .rag_bm25 import BM25Index
+from .rag_numpy_store import NumpyVectorStore
+from .rag_dedup import ChunkDeduplicator
+from .rag_search import mmr_select
+from .rag_metrics import metrics
 
+logger = logging.getLogger(__name__)
+
+def _copy_index_file(src: str, dst: str):
+    """Copy one index file; SQLite databases go through the backup API so an open one copies consistently"""
+    if src.endswith(".sqlite3"):
+        source = sqlite3.connect(src)
+        target = sqlite3.connect(dst)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        shutil.copystat(src, dst)
+    else:
+        shutil.copy2(src, dst)
+
+class MMRChroma(Chroma):
+    """Chroma whose MMR search selects with the vectorized mmr_select"""
+    
+    def max_marginal_relevance_search_by_vector(self, embedding: List[float], k: int = 4, fetch_k: int = 20,
+                                                lambda_mult: float = 0.5, filter: Optional[Dict] = None,
+                                                where_document: Optional[Dict] = None,
+                                                **kwargs: Any) -> List[Document]:
+        results = self._collection.query(
+            query_embeddings=[embedding],
+            n_results=fetch_k,
+            where=filter,
+            where_document=where_document,
+            include=["metadatas", "documents", "embeddings"]
+        )
+        if not results["ids"][0]:
+            return []
+        return [
+            Document(page_content=results["documents"][0][index], metadata=results["metadatas"][0][index] or {})
+            for index in mmr_select(embedding, results["embeddings"][0], k, lambda_mult)
+        ]
+        
 class RAGVectorStore:
     """Manages vector store for RAG"""
     
-    def __init__(self, persist_directory: str = 'data/chroma/'):
-        """Initialize vector store"""
+    # Default index directory per backend
+    DEFAULT_DIRECTORIES = {"chroma": 'data/chroma/', "numpy": 'data/numpy_index/'}
+    # Index generations live under GENERATIONS_DIR; POINTER_FILE names the live one
+    GENERATIONS_DIR = "generations"
+    POINTER_FILE = "CURRENT"
+    
+    def __init__(self, persist_directory: Optional[str] = None,
+                 backend: Optional[str] = None,
+                 embedding_cache_path: str = 'data/embedding_cache.sqlite3',
+                 embedding_cache_size: int = 200000,
+                 embedding_api_base: Optional[str] = None,
+                 pipeline_options: Optional[Dict] = None,
+                 embedding: Optional[Embeddings] = None,
+                 dedup_distance: Optional[int] = 3):
+        """
+        Initialize vector store
+        Args:
+            persist_directory: Directory of the persisted index, defaults per backend
+            backend: "chroma" or "numpy" (memory-mapped exact search), defaults
+                to the RAG_VECTOR_BACKEND environment variable, then "chroma"
+            embedding_cache_path: SQLite file caching chunk embeddings across rebuilds
+            embedding_cache_size: Maximum number of cached embeddings
+            embedding_api_base: Alternative OpenAI-compatible embeddings endpoint,
+                e.g. a local fake server
+            pipeline_options: EmbeddingPipeline settings (batch size, rate limits, ...)
+            embedding: Embedding model to use instead of OpenAI, e.g. a local fake
+            dedup_distance: SimHash bit distance under which a chunk counts as a
+                near duplicate of an earlier chunk of the same source and is not
+                embedded; None keeps every chunk
+        """
+        self.backend = (backend or os.getenv("RAG_VECTOR_BACKEND") or "chroma").lower()
+        if self.backend not in self.DEFAULT_DIRECTORIES:
+            raise ValueError(f"Unknown vector store backend: {self.backend}")
+        persist_directory = persist_directory or self.DEFAULT_DIRECTORIES[self.backend]
         self.persist_directory = persist_directory
         os.makedirs(persist_directory, exist_ok=True)
+        self.index_directory = self._live_index_directory()
         
-        # Initialize environment and create embeddings
-        init_environment()
-        self.embedding = OpenAIEmbeddings()
+        if embedding is None:
+            # Initialize environment and create embeddings
+            init_environment()
+            openai_kwargs = {"openai_api_base": embedding_api_base} if embedding_api_base else {}
+            embedding = OpenAIEmbeddings(**openai_kwargs)
+        self.embedding = CachedEmbeddings(
+            embedding,
+            cache_path=embedding_cache_path,
+            max_entries=embedding_cache_size
+        )
+        self.pipeline = EmbeddingPipeline(self.embedding, **(pipeline_options or {}))
         
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,
             chunk_overlap=150
         )
+        self.dedup_distance = dedup_distance
+        # Chunks kept and dropped by the last add_documents call
+        self.last_dedup_report: Dict = {}
+        # IDs of the chunks indexed by the last add_documents call
+        self.last_chunk_ids: List[str] = []
+        self.vectordb = None
+        
+        # Lexical index over the same chunks, persisted alongside the Chroma files
+        self.lexical_index = BM25Index(os.path.join(self.index_directory, "bm25_index.json"))
+        self._lexical_loaded = False
+        
+    def _live_index_directory(self) -> str:
+        """Directory of the generation named by the pointer file"""
+        pointer = os.path.join(self.persist_directory, self.POINTER_FILE)
+        if os.path.exists(pointer):
+            with open(pointer, 'r') as f:
+                directory = os.path.join(self.persist_directory, self.GENERATIONS_DIR, f.read().strip())
+            if os.path.isdir(directory):
+                return directory
+            logger.warning(f"Index generation {directory} is missing, using {self.persist_directory}")
+        # Indexes built before generations existed sit in the root directory
+        return self.persist_directory
+        
+    def shadow(self, empty: bool = False) -> "RAGVectorStore":
+        """
+        Copy the live index into a new generation
+        The copy can be updated while queries are still served from this
+        store, then made live with promote(). Callers hold the service's
+        index lock, so no writer touches this store during the copy.
+        Args:
+            empty: Start the new generation empty instead of copying
+        Returns:
+            RAGVectorStore over the new generation, sharing this store's
+            embedding model and pipeline
+        """
+        generations = os.path.join(self.persist_directory, self.GENERATIONS_DIR)
+        os.makedirs(generations, exist_ok=True)
+        numbers = [int(name) for name in os.listdir(generations) if name.isdigit()]
+        directory = os.path.join(generations, str(max(numbers, default=0) + 1))
+        
+        if empty:
+            os.makedirs(directory)
+        else:
+            self.flush()
+            shutil.copytree(self.index_directory, directory,
+                            ignore=shutil.ignore_patterns(self.GENERATIONS_DIR, self.POINTER_FILE),
+                            copy_function=_copy_index_file)
+        
+        shadow = copy.copy(self)
+        shadow.index_directory = directory
+        shadow.vectordb = None
+        shadow.lexical_index = BM25Index(os.path.join(directory, "bm25_index.json"))
+        shadow._lexical_loaded = False
+        return shadow
+        
+    def promote(self):
+        """Atomically make this store's generation the live index"""
+        self.flush()
+        pointer = os.path.join(self.persist_directory, self.POINTER_FILE)
+        tmp_path = f"{pointer}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(os.path.basename(os.path.normpath(self.index_directory)))
+        os.replace(tmp_path, pointer)
+        
+    def close(self):
+        """Release the open vector store"""
+        if self.vectordb is not None and self.backend == "chroma":
+            # Chroma keeps one system per directory alive for the whole process.
+            # There is no public way to stop a single one, so use the (pinned)
+            # client's registry and leave the system running if it ever moves.
+            systems = getattr(SharedSystemClient, "_identifer_to_system", None)
+            identifier = getattr(getattr(self.vectordb, "_client", None), "_identifier", None)
+            if systems is None or identifier is None:
+                logger.warning(f"Cannot release the Chroma system of {self.index_directory} "
+                               f"with this chromadb version")
+            else:
+                system = systems.pop(identifier, None)
+                if system is not None:
+                    system.stop()
+        self.vectordb = None
+        
+    def remove_index(self):
+        """Close this store and delete its generation from disk"""
+        self.close()
+        if os.path.normpath(self.index_directory) == os.path.normpath(self.persist_directory):
+            reserved = {self.GENERATIONS_DIR, self.POINTER_FILE}
+            paths = [os.path.join(self.persist_directory, name)
+                     for name in os.listdir(self.persist_directory) if name not in reserved]
+        else:
+            paths = [self.index_directory]
+        for path in paths:
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                os.remove(path)
         
-    def create_or_load(self, documents: Optional[List[Document]] = None) -> Optional[Chroma]:
+    def create_or_load(self, documents: Optional[List[Document]] = None):
         """
         Create new or load existing vector store
         Args:
             documents: Documents to process (optional)
         Returns:
-            Chroma: Vector store instance
+            Vector store instance (Chroma or NumpyVectorStore)
         """
         try:
             if documents:
-                # Split documents into chunks
-                splits = self.text_splitter.split_documents(documents)
+                # Split, embed and add documents to the persisted store
+                self.add_documents(documents)
+                self.flush()
+            return self.open()
+        except Exception as e:
+            logger.error(f"Error in vector store operation: {e}")
+            return None
+            
+    def open(self):
+        """Open the persisted vector store, reusing the open instance"""
+        if self.vectordb is None:
+            if self.backend == "numpy":
+                self.vectordb = NumpyVectorStore(self.index_directory, self.embedding)
+            else:
+                self.vectordb = MMRChroma(
+                    persist_directory=self.index_directory,
+                    embedding_function=self.embedding
+                )
+        return self.vectordb
+        
+    def add_documents(self, documents: Iterable[Document]) -> int:
+        """
+        Split documents and embed their chunks into the persisted vector store
+        Documents may be a generator: each one is split as it arrives and
+        its chunks flow straight into batched embedding, so a large PDF is
+        never held in memory whole and the first vectors are written while
+        later pages are still being parsed. Each batch is written as soon as
+        it is ready, so an interrupted run resumes where it stopped.
+        Exact and near-duplicate chunks, such as page headers and repeated
+        boilerplate, are dropped before embedding. Deduplication is scoped to
+        one call, i.e. one source, so deleting a source never removes text
+        another source still contains.
+        Args:
+            documents: Documents to add, e.g. pages streamed from a PDF
+        Returns:
+            int: Number of chunks indexed
+        """
+        lexical_index = self.open_lexical()
+        positions: Dict[str, int] = {}
+        self.last_chunk_ids = []
+        stats = {"documents": 0, "chunks": 0, "seconds": 0.0}
+        dedup = None
+        if self.dedup_distance is not None:
+            dedup = ChunkDeduplicator(self.dedup_distance, count_tokens=self.pipeline.count_tokens)
+        
+        def chunks():
+            for doc in documents:
+                started = time.perf_counter()
+                splits = self.text_splitter.split_documents([doc])
+                # IDs are assigned before dropping duplicates, so they stay stable
+                ids = self.chunk_ids(splits, positions)
+                if dedup:
+                    kept = [(chunk_id, split) for chunk_id, split in zip(ids, splits)
+                            if not dedup.is_duplicate(split.page_content)]
+                    ids, splits = [chunk_id for chunk_id, _ in kept], [split for _, split in kept]
+                # Also covers chunks persisted by an interrupted earlier run
+                lexical_index.add(ids, splits)
+                stats["documents"] += 1
+                stats["chunks"] += len(splits)
+                stats["seconds"] += time.perf_counter() - started
+                self.last_chunk_ids.extend(ids)
+                yield from zip(ids, splits)
                 
-                # Create new vector store
-                return Chroma.from_documents(
-                    documents=splits,
-                    embedding=self.embedding,
-                    persist_directory=self.persist_directory
+        self.pipeline.run_stream(chunks(), self._write_batch, existing_ids=self._existing_ids)
+        metrics.observe("rag_stage_seconds", stats["seconds"], stage="split")
+        metrics.increment("rag_chunks_total", stats["chunks"])
+        self.last_dedup_report = dedup.stats() if dedup else {}
+        if dedup:
+            dropped = dedup.exact_duplicates + dedup.near_duplicates
+            metrics.increment("rag_dedup_chunks_total", dedup.exact_duplicates, kind="exact")
+            metrics.increment("rag_dedup_chunks_total", dedup.near_duplicates, kind="near")
+            metrics.increment("rag_dedup_tokens_total", dedup.tokens_saved)
+            if dropped:
+                logger.info(f"Dropped {dropped} duplicate chunks ({dedup.exact_duplicates} exact, "
+                            f"{dedup.near_duplicates} near), saving {dedup.tokens_saved} tokens")
+        logger.debug(f"Split {stats['documents']} documents into {stats['chunks']} chunks; "
+                     f"embedding cache: {self.embedding.stats()}")
+        return stats["chunks"]
+        
+    @staticmethod
+    def chunk_ids(splits: List[Document], positions: Optional[Dict[str, int]] = None) -> List[str]:
+        """
+        Stable chunk IDs from source file, position within it and content
+        Args:
+            splits: Chunks in document order
+            positions: Next position per source, updated in place so IDs
+                continue across calls for a streamed source
+        """
+        ids = []
+        positions = {} if positions is None else positions
+        for doc in splits:
+            source = doc.metadata.get("source_file", doc.metadata.get("source", ""))
+            position = positions.get(source, 0)
+            positions[source] = position + 1
+            key = f"{source}|{position}|{doc.page_content}"
+            ids.append(hashlib.sha256(key.encode("utf-8")).hexdigest())
+        return ids
+        
+    def _write_batch(self, ids: List[str], chunks: List[Document], vectors: List[List[float]]):
+        """Persist one embedded batch"""
+        with metrics.span("persist", backend=self.backend) as span:
+            span["chunks"] = len(ids)
+            if self.backend == "numpy":
+                self.open().upsert(
+                    ids,
+                    vectors,
+                    [chunk.page_content for chunk in chunks],
+                    [chunk.metadata for chunk in chunks]
                 )
             else:
-                # Load existing vector store
-                return Chroma(
-                    persist_directory=self.persist_directory,
-                    embedding_function=self.embedding
+                self.open()._collection.upsert(
+                    ids=ids,
+                    embeddings=vectors,
+                    metadatas=[chunk.metadata for chunk in chunks],
+                    documents=[chunk.page_content for chunk in chunks]
                 )
-        except Exception as e:
-            print(f"Error in vector store operation: {e}")
-            return None 
\ No newline at end of file
+        
+    def _existing_ids(self, ids: List[str]) -> set:
+        """Chunk IDs already persisted"""
+        if self.backend == "numpy":
+            return self.open().get_ids(ids)
+        return set(self.open()._collection.get(ids=ids, include=[])["ids"])
+        
+    def get_records(self, include_vectors: bool = False) -> Dict:
+        """All stored chunks as {"ids", "documents", "metadatas"}, plus "embeddings" if requested"""
+        if self.backend == "numpy":
+            return self.open().get(include_vectors=include_vectors)
+        include = ["documents", "metadatas"] + (["embeddings"] if include_vectors else [])
+        return self.open()._collection.get(include=include)
+        
+    def delete_source(self, source_file: str, keep_ids: Optional[Iterable[str]] = None):
+        """
+        Delete the chunks that came from a source file
+        Args:
+            source_file: Source file path
+            keep_ids: Chunk IDs to keep, e.g. the ones just upserted for a
+                changed source, so only stale chunks are deleted
+        """
+        if keep_ids is None:
+            if self.backend == "numpy":
+                self.open().delete_where("source_file", source_file)
+            else:
+                self.open()._collection.delete(where={"source_file": source_file})
+            self.open_lexical().delete_where("source_file", source_file)
+            return
+            
+        keep_ids = set(keep_ids)
+        if self.backend == "numpy":
+            ids = self.open().ids_where("source_file", source_file)
+        else:
+            ids = self.open()._collection.get(where={"source_file": source_file}, include=[])["ids"]
+        stale = [chunk_id for chunk_id in ids if chunk_id not in keep_ids]
+        if stale:
+            if self.backend == "numpy":
+                self.open().delete(stale)
+            else:
+                self.open()._collection.delete(ids=stale)
+            self.open_lexical().delete(stale)
+            logger.info(f"Deleted {len(stale)} stale chunks of {source_file}")
+            
+    def size_bytes(self) -> int:
+        """Disk space taken by this store's generation"""
+        total = 0
+        for root, dirs, files in os.walk(self.index_directory):
+            if os.path.normpath(root) == os.path.normpath(self.persist_directory):
+                dirs[:] = [name for name in dirs if name != self.GENERATIONS_DIR]
+            total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+        return total
+        
+    def compacted(self, sources: Optional[Iterable[str]] = None,
+                  batch_size: int = 1000) -> Tuple["RAGVectorStore", Dict]:
+        """
+        Copy the live chunks into a new, densely packed generation
+        Deleted chunks leave tombstoned rows in the numpy store and
+        unreclaimed nodes in Chroma's HNSW index; rewriting only the live
+        chunks rebuilds both at their real size. Orphaned chunks, whose
+        source is not in sources, and repeated copies of the same text from
+        the same source, e.g. appended by old non-idempotent ingestion, are
+        left out.
+        Args:
+            sources: Source files whose chunks are kept, all if None
+            batch_size: Chunks written per batch
+        Returns:
+            (store over the new generation, not yet promoted, and a report
+            with chunk counts and sizes before and after)
+        """
+        records = self.get_records(include_vectors=True)
+        keep = set(sources) if sources is not None else None
+        seen = set()
+        rows = []
+        orphaned = duplicates = 0
+        for row, (text, metadata) in enumerate(zip(records["documents"], records["metadatas"])):
+            source = (metadata or {}).get("source_file")
+            if keep is not None and source not in keep:
+                orphaned += 1
+            elif (source, text) in seen:
+                duplicates += 1
+            else:
+                seen.add((source, text))
+                rows.append(row)
+                
+        compacted = self.shadow(empty=True)
+        try:
+            lexical_index = compacted.open_lexical()
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                ids = [records["ids"][row] for row in batch]
+                chunks = [Document(page_content=records["documents"][row], metadata=records["metadatas"][row] or {})
+                          for row in batch]
+                compacted._write_batch(ids, chunks, [list(records["embeddings"][row]) for row in batch])
+                lexical_index.add(ids, chunks)
+            compacted.flush()
+        except Exception:
+            compacted.remove_index()
+            raise
+            
+        report = {
+            "chunks_before": len(records["ids"]),
+            "chunks_after": len(rows),
+            "orphaned": orphaned,
+            "duplicates": duplicates,
+            "bytes_before": self.size_bytes(),
+            "bytes_after": compacted.size_bytes()
+        }
+        logger.info(f"Compacted {self.index_directory} into {compacted.index_directory}: {report}")
+        return compacted, report
+        
+    def reset(self):
+        """Drop every chunk from the persisted vector store"""
+        self.open().delete_collection()
+        self.vectordb = None
+        self.open_lexical().clear()
+        
+    def open_lexical(self) -> BM25Index:
+        """
+        Open the BM25 index, rebuilding it from the vector store when an
+        index was persisted before lexical search existed
+        """
+        if not self._lexical_loaded:
+            if self.lexical_index.exists():
+                self.lexical_index.load()
+            else:
+                records = self.get_records()
+                if records["ids"]:
+                    logger.info(f"Building BM25 index from {len(records['ids'])} stored chunks")
+                    self.lexical_index.add(records["ids"], [
+                        Document(page_content=text, metadata=metadata or {})
+                        for text, metadata in zip(records["documents"], records["metadatas"])
+                    ])
+                    self.lexical_index.save()
+            self._lexical_loaded = True
+        return self.lexical_index
+        
+    def flush(self):
+        """Persist indexes kept in memory"""
+        self.open_lexical().save()
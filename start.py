@@ -1,17 +1,21 @@
 #!/usr/bin/env python
 # coding: utf-8
 
-from utils.env_manager import init_environment
-from panel_app import main
+import time
 
 def start():
     """Start the application"""
+    started = time.perf_counter()
     try:
+        # Imported here so the reported time to ready includes loading the app
+        from utils.env_manager import init_environment
+        from panel_app import main
+        
         # Initialize environment
         init_environment()
         
         # Start Panel interface
-        main()
+        main(started=started)
     except Exception as e:
         print(f"Error starting application: {e}")
         return 1
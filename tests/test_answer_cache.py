@@ -0,0 +1,37 @@
+from benchmarks.fakes import HashingEmbeddings
+from rag.rag_answer_cache import SemanticAnswerCache
+
+
+def answer(text):
+    return {"answer": text, "source_documents": []}
+
+
+def test_answers_are_scoped():
+    cache = SemanticAnswerCache(HashingEmbeddings(size=64))
+    cache.store("what is rag", 1, answer("qa"), 1.0, scope="qa")
+
+    assert cache.lookup("what is rag", 1, scope="qa")["answer"] == "qa"
+    assert cache.lookup("what is rag", 1, scope="conversation") is None
+
+    cache.store("what is rag", 1, answer("conversation"), 1.0, scope="conversation")
+    assert cache.lookup("what is rag", 1, scope="conversation")["answer"] == "conversation"
+    assert cache.lookup("what is rag", 1, scope="qa")["answer"] == "qa"
+
+
+def test_newer_index_drops_answers():
+    cache = SemanticAnswerCache(HashingEmbeddings(size=64))
+    cache.store("what is rag", 1, answer("old"), 1.0)
+
+    assert cache.lookup("what is rag", 2) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_older_index_keeps_newer_answers():
+    cache = SemanticAnswerCache(HashingEmbeddings(size=64))
+    cache.store("what is rag", 2, answer("new"), 1.0)
+
+    # An answer that finished after the index was swapped is dropped
+    cache.store("what is bm25", 1, answer("stale"), 1.0)
+    assert cache.lookup("what is bm25", 2) is None
+    assert cache.lookup("what is rag", 1) is None
+    assert cache.lookup("what is rag", 2)["answer"] == "new"
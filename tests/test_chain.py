@@ -0,0 +1,69 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmarks.fakes import HashingEmbeddings, StubChatModel
+from rag.rag_chain import RAGChain, is_standalone
+from rag.rag_numpy_store import NumpyVectorStore
+
+
+def make_chain(tmp_path, **options):
+    store = NumpyVectorStore(str(tmp_path / "index"), HashingEmbeddings())
+    return RAGChain(store, llm=StubChatModel(first_token_latency=0, token_latency=0, prompt_token_latency=0),
+                    **options)
+
+
+def test_filtered_retriever_is_built_once_across_threads(tmp_path):
+    chain = make_chain(tmp_path, max_filtered_chains=2)
+    create_retriever = chain.create_retriever
+    built = []
+    lock = threading.Lock()
+
+    def slow_create(where=None):
+        with lock:
+            built.append(where["source_type"])
+        time.sleep(0.02)
+        return create_retriever(where)
+
+    chain.create_retriever = slow_create
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        retrievers = list(pool.map(chain.get_retriever, [{"source_type": "pdf"}] * 8))
+
+    assert built == ["pdf"]
+    assert all(retriever is retrievers[0] for retriever in retrievers)
+
+    # Least recently used filters are dropped
+    for source_type in ("url", "youtube", "pdf"):
+        chain.get_retriever({"source_type": source_type})
+    assert len(chain._filtered) == 2
+    assert built == ["pdf", "url", "youtube", "pdf"]
+
+
+@pytest.mark.parametrize("question, standalone", [
+    ("What is the tuition for the MBA program?", True),
+    ("How do I request an I-20 form?", True),
+    ("Which courses are required for the computer science degree?", True),
+    # Too short to stand on its own
+    ("And the deadline?", False),
+    ("Why?", False),
+    ("", False),
+    # Follow-up openings
+    ("And what about the deadline for spring?", False),
+    ("What about international students applying late?", False),
+    ("How about the refund policy for summer?", False),
+    ("But is the fee refundable after withdrawal?", False),
+    # Openings only count as whole words
+    ("Andrew Hall hosts which graduate programs?", True),
+    ("Sophomore students need how many units?", True),
+    ("Orientation for graduate students starts when?", True),
+    # Words that refer back, including contractions
+    ("Does that apply to international students?", False),
+    ("How much does it cost per unit?", False),
+    ("What are their admission requirements exactly?", False),
+    ("What's its application deadline this year?", False),
+    ("Is there another scholarship for graduate students?", False),
+])
+def test_is_standalone(question, standalone):
+    assert is_standalone(question) is standalone
@@ -0,0 +1,82 @@
+from langchain.schema import Document
+
+from rag.rag_context import ContextBuilder, _overlap
+
+WORDS = " ".join(f"word{n}" for n in range(60))
+
+
+def chunk(text, source="catalog.pdf", page=1):
+    return Document(page_content=text, metadata={"source_file": source, "page": page})
+
+
+def words(text):
+    return len(text.split())
+
+
+def test_overlap():
+    assert _overlap("alpha beta gamma delta epsilon zeta", "delta epsilon zeta eta theta", min_chars=10) == 18
+    assert _overlap("alpha beta gamma", "theta iota kappa lambda", min_chars=10) == 0
+    # Shorter than min_chars never counts as overlap
+    assert _overlap("alpha beta", "beta gamma", min_chars=20) == 0
+
+
+def test_adjacent_overlapping_chunks_are_merged():
+    first, second = WORDS[:200], WORDS[150:]
+    merged = ContextBuilder(count_tokens=words).merge([chunk(second), chunk(first)])
+
+    assert [doc.page_content for doc in merged] == [WORDS]
+    # Ranked and labelled by its best chunk
+    assert merged[0].metadata == {"source_file": "catalog.pdf", "page": 1}
+
+
+def test_bridging_chunk_merges_three_passages():
+    parts = [WORDS[:150], WORDS[120:300], WORDS[270:]]
+    merged = ContextBuilder(count_tokens=words).merge([chunk(parts[0]), chunk(parts[2]), chunk(parts[1])])
+
+    assert [doc.page_content for doc in merged] == [WORDS]
+
+
+def test_non_overlapping_chunks_stay_apart():
+    first, second = WORDS[:150], WORDS[200:]
+    builder = ContextBuilder(count_tokens=words)
+
+    merged = builder.merge([chunk(first), chunk(second)])
+    assert [doc.page_content for doc in merged] == [first, second]
+
+    # Overlapping text on different pages is not merged either
+    merged = builder.merge([chunk(WORDS[:200], page=1), chunk(WORDS[150:], page=2)])
+    assert len(merged) == 2
+
+
+def test_contained_and_repeated_chunks_are_dropped():
+    merged = ContextBuilder(count_tokens=words).merge([
+        chunk(WORDS), chunk(WORDS[100:200]), chunk("  " + WORDS.replace(" ", " \t  ") + "\n"), chunk(WORDS, page=2)
+    ])
+
+    assert [doc.page_content for doc in merged] == [WORDS]
+
+
+def test_truncates_to_budget():
+    passages = [chunk(" ".join(f"a{n}" for n in range(30)), page=1),
+                chunk(" ".join(f"b{n}" for n in range(100)), page=2),
+                chunk(" ".join(f"c{n}" for n in range(100)), page=3)]
+    context = ContextBuilder(max_tokens=60, min_tokens=10, count_tokens=words).build(passages)
+
+    assert context["candidate_tokens"] == 230
+    assert context["tokens"] <= 60
+    contents = [doc.page_content for doc in context["documents"]]
+    assert contents[0] == passages[0].page_content
+    # The second passage is cut at a word boundary; the third no longer fits
+    assert len(contents) == 2
+    assert passages[1].page_content.startswith(contents[1])
+    assert contents[1].split()[-1] in passages[1].page_content.split()
+
+
+def test_skips_passage_below_min_tokens():
+    passages = [chunk(" ".join(f"a{n}" for n in range(55)), page=1),
+                chunk(" ".join(f"b{n}" for n in range(100)), page=2),
+                chunk("short tail", page=3)]
+    context = ContextBuilder(max_tokens=60, min_tokens=10, count_tokens=words).build(passages)
+
+    assert [doc.metadata["page"] for doc in context["documents"]] == [1, 3]
+    assert context["tokens"] == 57
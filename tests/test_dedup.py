@@ -0,0 +1,71 @@
+import pytest
+
+from rag.rag_dedup import ChunkDeduplicator, normalize_url, simhash
+
+PARAGRAPH = " ".join(
+    f"Students in program {n} must submit the enrollment form and pay tuition before the term begins."
+    for n in range(12)
+)
+
+
+def distance(a, b):
+    return bin(simhash(" ".join(a.lower().split())) ^ simhash(" ".join(b.lower().split()))).count("1")
+
+
+def test_exact_duplicate_ignores_case_and_whitespace():
+    dedup = ChunkDeduplicator()
+    assert not dedup.is_duplicate(PARAGRAPH)
+    assert dedup.is_duplicate("  " + PARAGRAPH.upper().replace(" ", "\n  "))
+    assert dedup.stats()["exact_duplicates"] == 1
+    assert dedup.stats()["tokens_saved"] > 0
+
+
+def test_near_duplicate():
+    edited = PARAGRAPH.replace("program 7", "programme 7")
+    assert distance(PARAGRAPH, edited) <= 3
+
+    dedup = ChunkDeduplicator(max_distance=3)
+    assert not dedup.is_duplicate(PARAGRAPH)
+    assert dedup.is_duplicate(edited)
+    assert dedup.stats() == {"kept": 1, "exact_duplicates": 0, "near_duplicates": 1,
+                             "tokens_saved": dedup.count_tokens(edited)}
+
+
+def test_near_duplicate_boundary():
+    edited = PARAGRAPH.replace("enrollment form", "registration paperwork").replace("program 3", "track 3")
+    bits = distance(PARAGRAPH, edited)
+    assert bits > 0
+
+    at_limit = ChunkDeduplicator(max_distance=bits)
+    at_limit.is_duplicate(PARAGRAPH)
+    assert at_limit.is_duplicate(edited)
+
+    below_limit = ChunkDeduplicator(max_distance=bits - 1)
+    below_limit.is_duplicate(PARAGRAPH)
+    assert not below_limit.is_duplicate(edited)
+    assert below_limit.stats()["kept"] == 2
+
+
+def test_unrelated_text_is_kept():
+    dedup = ChunkDeduplicator()
+    assert not dedup.is_duplicate(PARAGRAPH)
+    assert not dedup.is_duplicate("The library opens at nine and closes at midnight during finals week.")
+    assert dedup.stats()["kept"] == 2
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("https://Example.com/catalog/", "https://example.com/catalog"),
+    ("https://example.com/catalog", "https://example.com/catalog"),
+    ("https://example.com/", "https://example.com/"),
+    ("https://example.com", "https://example.com/"),
+    ("https://example.com/search?b=2&a=1", "https://example.com/search?a=1&b=2"),
+    ("https://example.com/search?a=1&b=2", "https://example.com/search?a=1&b=2"),
+    ("https://example.com/page#section-2", "https://example.com/page"),
+    ("https://example.com/page?utm_source=mail&id=5#top", "https://example.com/page?id=5"),
+    ("HTTPS://example.com:443/page", "https://example.com/page"),
+    ("http://example.com:8080/page", "http://example.com:8080/page"),
+    ("example.com/page", "https://example.com/page"),
+    ("https://youtu.be/dQw4w9WgXcQ?t=42", "https://www.youtube.com/watch?v=dQw4w9WgXcQ"),
+])
+def test_normalize_url(url, expected):
+    assert normalize_url(url) == expected
@@ -0,0 +1,150 @@
+import base64
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+
+import numpy as np
+import openai
+import pytest
+from langchain.schema import Document
+from langchain.schema.embeddings import Embeddings
+
+from rag.rag_embedding_pipeline import EmbeddingPipeline
+
+
+class EmbeddingHandler(BaseHTTPRequestHandler):
+    """
+    OpenAI-compatible /v1/embeddings: the vector of "chunk <n>" is [n, 1]
+    Answers 429 while server.rate_limited is positive, counting it down.
+    """
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        self.server.requests.append(texts)
+        if self.server.rate_limited > 0:
+            self.server.rate_limited -= 1
+            self.reply(429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}})
+            return
+        data = []
+        for index, text in enumerate(texts):
+            vector = np.asarray([float(text.split()[-1]), 1.0], dtype=np.float32)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        self.reply(200, {"object": "list", "data": data, "model": body["model"],
+                         "usage": {"prompt_tokens": 0, "total_tokens": 0}})
+
+    def reply(self, status, payload):
+        encoded = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server(serve):
+    httpd = serve(EmbeddingHandler)
+    httpd.rate_limited = 0
+    return httpd
+
+
+class ServerEmbeddings(Embeddings):
+    """One embeddings request per batch through the OpenAI client; retries are left to the pipeline"""
+
+    def __init__(self, url):
+        self.client = openai.OpenAI(base_url=url + "/v1", api_key="sk-test", max_retries=0)
+
+    def embed_documents(self, texts):
+        response = self.client.embeddings.create(input=texts, model="text-embedding-ada-002")
+        return [item.embedding for item in response.data]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def make_embedding(server):
+    return ServerEmbeddings(server.url)
+
+
+def make_chunks(count):
+    chunks = [Document(page_content=f"{'words ' * (n % 7 + 1)}chunk {n}") for n in range(count)]
+    return chunks, [f"id-{n}" for n in range(count)]
+
+
+def run(pipeline, chunks, ids):
+    written = {}
+
+    def write_batch(batch_ids, batch_chunks, vectors):
+        written.update(zip(batch_ids, vectors))
+
+    embedded = pipeline.run(chunks, ids, write_batch)
+    return embedded, written
+
+
+def test_batches_within_token_and_size_limits(server):
+    pipeline = EmbeddingPipeline(make_embedding(server), batch_tokens=20, max_batch_size=3, max_workers=2)
+    chunks, ids = make_chunks(25)
+
+    embedded, written = run(pipeline, chunks, ids)
+
+    assert embedded == 25
+    assert len(server.requests) == len(pipeline.make_batches(chunks, ids))
+    for texts in server.requests:
+        assert len(texts) <= 3
+        assert len(texts) == 1 or sum(pipeline.count_tokens(text) for text in texts) <= 20
+    for n in range(25):
+        assert written[f"id-{n}"] == pytest.approx([n, 1.0])
+
+
+def test_retries_rate_limited_requests(server):
+    pipeline = EmbeddingPipeline(make_embedding(server), max_retries=3)
+    chunks, ids = make_chunks(4)
+    server.rate_limited = 2
+
+    embedded, written = run(pipeline, chunks, ids)
+
+    assert embedded == 4
+    assert len(server.requests) == 3
+    assert written["id-3"] == pytest.approx([3, 1.0])
+
+
+def test_gives_up_after_max_retries(server):
+    pipeline = EmbeddingPipeline(make_embedding(server), max_retries=2)
+    chunks, ids = make_chunks(2)
+    server.rate_limited = 5
+
+    with pytest.raises(openai.RateLimitError):
+        run(pipeline, chunks, ids)
+    assert len(server.requests) == 2
+
+
+def test_waits_for_request_rate_limit(server):
+    pipeline = EmbeddingPipeline(make_embedding(server), max_batch_size=1, max_workers=3,
+                                 requests_per_minute=2)
+    chunks, ids = make_chunks(3)
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(zip(("embedded", "written"), run(pipeline, chunks, ids))),
+                              daemon=True)
+    thread.start()
+
+    time.sleep(1.5)
+    assert len(server.requests) == 2
+    assert thread.is_alive()
+
+    # Let the one-minute window pass
+    with pipeline.limiter._lock:
+        pipeline.limiter._window = type(pipeline.limiter._window)(
+            (stamp - 60, tokens) for stamp, tokens in pipeline.limiter._window)
+    thread.join(timeout=10)
+    assert not thread.is_alive()
+    assert result["embedded"] == 3
+    assert len(server.requests) == 3
@@ -0,0 +1,129 @@
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from rag.rag_http import HTTPFetcher
+from rag.rag_loader import RAGLoader
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    """Serves server.pages by path, honouring conditional request headers"""
+
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+        body, etag, last_modified = self.server.pages[self.path]
+        if ((etag and self.headers.get("If-None-Match") == etag)
+                or (last_modified and self.headers.get("If-Modified-Since") == last_modified)):
+            self.send_response(304)
+            self.end_headers()
+            return
+        encoded = f"<html><head><title>Test</title></head><body>{body}</body></html>".encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(encoded)))
+        if etag:
+            self.send_header("ETag", etag)
+        if last_modified:
+            self.send_header("Last-Modified", last_modified)
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server(serve):
+    httpd = serve(PageHandler)
+    httpd.pages = {}
+    return httpd
+
+
+def test_etag_revalidation(server, tmp_path):
+    server.pages["/a"] = ("first", '"v1"', None)
+    fetcher = HTTPFetcher(cache_dir=str(tmp_path))
+
+    page = fetcher.fetch(server.url + "/a")
+    assert page["status"] == "fetched"
+    assert "first" in page["text"]
+
+    page = fetcher.fetch(server.url + "/a")
+    assert server.requests[-1][1].get("If-None-Match") == '"v1"'
+    assert page["status"] == "not_modified"
+    assert "first" in page["text"]
+
+    server.pages["/a"] = ("second", '"v2"', None)
+    page = fetcher.fetch(server.url + "/a")
+    assert page["status"] == "fetched"
+    assert "second" in page["text"]
+    assert fetcher.cached(server.url + "/a")["etag"] == '"v2"'
+
+
+def test_last_modified_revalidation(server, tmp_path):
+    stamp = "Wed, 01 Jan 2025 00:00:00 GMT"
+    server.pages["/b"] = ("text", None, stamp)
+    fetcher = HTTPFetcher(cache_dir=str(tmp_path))
+
+    fetcher.fetch(server.url + "/b")
+    page = fetcher.fetch(server.url + "/b")
+    headers = server.requests[-1][1]
+    assert headers.get("If-Modified-Since") == stamp
+    assert "If-None-Match" not in headers
+    assert page["status"] == "not_modified"
+    assert page["last_modified"] == stamp
+
+
+def test_unchanged_text_without_validators(server, tmp_path):
+    server.pages["/c"] = ("same", None, None)
+    fetcher = HTTPFetcher(cache_dir=str(tmp_path))
+
+    first = fetcher.fetch(server.url + "/c")
+    second = fetcher.fetch(server.url + "/c")
+    assert second["status"] == "unchanged"
+    assert second["content_sha256"] == first["content_sha256"]
+
+
+def test_transaction_holds_pages_back(server, tmp_path):
+    url = server.url + "/d"
+    server.pages["/d"] = ("old", '"v1"', None)
+    fetcher = HTTPFetcher(cache_dir=str(tmp_path))
+    fetcher.fetch(url)
+
+    server.pages["/d"] = ("new", '"v2"', None)
+    fetcher.begin()
+    page = fetcher.fetch(url)
+    assert "new" in page["text"]
+    assert "old" in fetcher.cached(url)["text"]
+
+    # Fetched again while held: served from memory, no request
+    requests = len(server.requests)
+    assert fetcher.fetch(url) is page
+    assert len(server.requests) == requests
+
+    fetcher.rollback()
+    assert "old" in fetcher.cached(url)["text"]
+
+    fetcher.begin()
+    fetcher.fetch(url)
+    fetcher.commit()
+    assert "new" in fetcher.cached(url)["text"]
+
+
+def test_stale_against_indexed_hash(server, tmp_path):
+    url = server.url + "/e"
+    server.pages["/e"] = ("indexed", '"v1"', None)
+    source_file = tmp_path / "URL-e.txt"
+    source_file.write_text(url)
+    loader = RAGLoader(source_dir=str(tmp_path / "sources"), temp_dir=str(tmp_path / "temp"),
+                       fetcher=HTTPFetcher(cache_dir=str(tmp_path / "cache")))
+    sources = [{"URL": str(source_file)}]
+
+    loader.fetcher.fetch(url)
+    indexed = {str(source_file): {"pages": loader.page_hashes(str(source_file))}}
+    assert loader.stale_url_sources(sources, indexed) == []
+
+    # A changed page cached by an earlier check whose index build failed
+    server.pages["/e"] = ("changed", '"v2"', None)
+    loader.fetcher.fetch(url)
+    assert loader.fetcher.fetch(url)["status"] == "not_modified"
+    assert loader.stale_url_sources(sources, indexed) == [str(source_file)]
@@ -0,0 +1,31 @@
+import time
+
+from rag.rag_ingestion import IngestionQueue
+
+
+def wait_idle(queue, timeout=10):
+    deadline = time.time() + timeout
+    while queue.pending() and time.time() < deadline:
+        time.sleep(0.05)
+
+
+def test_latest_job_per_file(tmp_path):
+    results = iter([{"fail": "No content"}, {}])
+
+    def ingest(jobs, progress):
+        errors = next(results)
+        return {job["id"]: errors["fail"] for job in jobs} if errors else {}
+
+    queue = IngestionQueue(ingest, path=str(tmp_path / "jobs.json"))
+    assert queue.latest("a.txt") is None
+
+    queue.submit("URL", "a.txt")
+    wait_idle(queue)
+    assert queue.latest("a.txt")["status"] == "failed"
+
+    # A failed source can be queued again; its newest job is reported
+    retry = queue.submit("URL", "a.txt")
+    wait_idle(queue)
+    latest = queue.latest("a.txt")
+    assert latest["id"] == retry
+    assert latest["status"] == "done"
@@ -0,0 +1,69 @@
+import threading
+import time
+
+from langchain.schema import Document
+
+from rag.rag_loader import RAGLoader
+
+
+class FakeLoader(RAGLoader):
+    """
+    Loads sources named "<delay>", "fail" or "hang" without touching files
+    A "<delay>" source sleeps that many seconds and returns two documents.
+    """
+
+    def __init__(self, tmp_path, **options):
+        super().__init__(source_dir=str(tmp_path / "sources"), temp_dir=str(tmp_path / "temp"), **options)
+        self.release = threading.Event()
+
+    def load_source(self, source):
+        source_type, name = next(iter(source.items()))
+        if name == "fail":
+            raise RuntimeError("cannot load")
+        if name == "hang":
+            self.release.wait(30)
+            return [Document(page_content="too late")]
+        time.sleep(float(name))
+        return [Document(page_content=f"{source_type} {name} part {n}") for n in range(2)]
+
+
+def test_results_in_source_order(tmp_path):
+    loader = FakeLoader(tmp_path)
+    # Earlier sources finish last, and types run in different pools
+    sources = [{"PDF": "0.3"}, {"URL": "0.2"}, {"YouTube": "0.1"}, {"PDF": "0.0"}, {"URL": "0.05"}]
+
+    documents = loader.load_concurrently(sources)
+
+    expected = [f"{source_type} {name} part {n}" for source in sources
+                for source_type, name in source.items() for n in range(2)]
+    assert [doc.page_content for doc in documents] == expected
+    assert [entry["source_file"] for entry in loader.last_load_report] == [list(s.values())[0] for s in sources]
+    assert {entry["status"] for entry in loader.last_load_report} == {"ok"}
+
+
+def test_failing_source_is_reported(tmp_path):
+    loader = FakeLoader(tmp_path)
+
+    documents = loader.load_concurrently([{"PDF": "0.1"}, {"PDF": "fail"}, {"URL": "0.0"}])
+
+    assert [doc.page_content for doc in documents] == ["PDF 0.1 part 0", "PDF 0.1 part 1",
+                                                       "URL 0.0 part 0", "URL 0.0 part 1"]
+    assert [entry["status"] for entry in loader.last_load_report] == ["ok", "error", "ok"]
+    assert loader.last_load_report[1]["documents"] == 0
+
+
+def test_timeout_is_reported_instead_of_hanging(tmp_path):
+    loader = FakeLoader(tmp_path, source_timeout=0.3)
+    started = time.perf_counter()
+    try:
+        documents = loader.load_concurrently([{"YouTube": "hang"}, {"PDF": "0.0"}])
+        elapsed = time.perf_counter() - started
+    finally:
+        loader.release.set()
+
+    assert elapsed < 5
+    assert [doc.page_content for doc in documents] == ["PDF 0.0 part 0", "PDF 0.0 part 1"]
+    timed_out = loader.last_load_report[0]
+    assert timed_out["status"] == "timeout"
+    assert timed_out["documents"] == 0
+    assert timed_out["seconds"] >= 0.3
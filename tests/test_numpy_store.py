@@ -0,0 +1,78 @@
+import json
+
+import numpy as np
+
+from benchmarks.fakes import HashingEmbeddings
+from rag.rag_numpy_store import NumpyVectorStore
+
+
+def make_store(path):
+    return NumpyVectorStore(str(path), HashingEmbeddings(size=3))
+
+
+def stored_vector(store, chunk_id):
+    return np.asarray(store.matrix()[store.row_of[chunk_id]])
+
+
+def test_resume_after_orphaned_vector(tmp_path):
+    store = make_store(tmp_path)
+    store.upsert(["a", "b"], [[1, 0, 0], [0, 0, 1]], ["a", "b"], [{}, {}])
+    # Crash after the vector write, before the sidecar record
+    with open(store.vectors_path, "ab") as f:
+        f.write(np.asarray([[0, 0, 1]], dtype=np.float32).tobytes())
+
+    store = make_store(tmp_path)
+    assert store.count() == 2
+    store.upsert(["c"], [[0, 1, 0]], ["c"], [{}])
+    np.testing.assert_allclose(stored_vector(store, "c"), [0, 1, 0])
+
+    reopened = make_store(tmp_path)
+    for chunk_id, vector in (("a", [1, 0, 0]), ("b", [0, 0, 1]), ("c", [0, 1, 0])):
+        np.testing.assert_allclose(stored_vector(reopened, chunk_id), vector)
+    assert reopened.search_by_vectors(np.asarray([[0, 1, 0]]), k=1)[0][0][0] == reopened.row_of["c"]
+
+
+def test_resume_after_torn_vector_write(tmp_path):
+    store = make_store(tmp_path)
+    store.upsert(["a"], [[1, 0, 0]], ["a"], [{}])
+    # Crash mid-way through a vector write whose sidecar record made it to disk
+    with open(store.vectors_path, "ab") as f:
+        f.write(np.asarray([0, 1], dtype=np.float32).tobytes())
+    with open(store.sidecar_path, "a") as f:
+        f.write(json.dumps({"op": "add", "id": "b", "text": "b", "metadata": {}}) + "\n")
+
+    store = make_store(tmp_path)
+    assert store.ids == ["a"]
+    assert store.search_by_vectors(np.asarray([[1, 0, 0]]), k=2)[0][0][0] == store.row_of["a"]
+    store.upsert(["b"], [[0, 1, 0]], ["b"], [{}])
+    np.testing.assert_allclose(stored_vector(make_store(tmp_path), "b"), [0, 1, 0])
+
+
+def test_resume_after_torn_sidecar_line(tmp_path):
+    store = make_store(tmp_path)
+    store.upsert(["a"], [[1, 0, 0]], ["a"], [{}])
+    with open(store.vectors_path, "ab") as f:
+        f.write(np.asarray([[0, 1, 0]], dtype=np.float32).tobytes())
+    with open(store.sidecar_path, "a") as f:
+        f.write(json.dumps({"op": "add", "id": "b", "text": "b", "metadata": {}})[:25])
+
+    store = make_store(tmp_path)
+    store.upsert(["c"], [[0, 0, 1]], ["c"], [{}])
+    reopened = make_store(tmp_path)
+    assert reopened.ids == ["a", "c"]
+    np.testing.assert_allclose(stored_vector(reopened, "c"), [0, 0, 1])
+
+
+def test_ids_where(tmp_path):
+    store = make_store(tmp_path)
+    store.upsert(["a", "b", "c"], [[1, 0, 0], [0, 1, 0], [0, 0, 1]], ["a", "b", "c"],
+                 [{"source_file": "x.pdf", "chunk": 1}, {"source_file": "y.pdf", "chunk": 1},
+                  {"source_file": "x.pdf", "chunk": 2}])
+    assert store.ids_where("source_file", "x.pdf") == ["a", "c"]
+    assert store.ids_where("chunk", 1) == ["a", "b"]
+
+    store.delete(["a"])
+    assert store.ids_where("source_file", "x.pdf") == ["c"]
+    store.delete_where("source_file", "x.pdf")
+    assert store.ids_where("source_file", "x.pdf") == []
+    assert store.count() == 1
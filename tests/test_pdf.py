@@ -0,0 +1,25 @@
+import os
+import sys
+
+from rag.rag_pdf import _process_context, iter_pdf_pages
+
+PDF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "sources", "uploaded.pdf")
+
+
+def test_process_pool_pages_match_serial():
+    serial = list(iter_pdf_pages(PDF, workers=1))
+    parallel = list(iter_pdf_pages(PDF, workers=2, pages_per_task=3, parallel_min_pages=1))
+
+    assert len(parallel) == len(serial) > 3
+    assert [doc.metadata for doc in parallel] == [doc.metadata for doc in serial]
+    assert [doc.page_content for doc in parallel] == [doc.page_content for doc in serial]
+
+
+def test_workers_do_not_import_the_rag_package():
+    context = _process_context()
+    with context.Pool(1) as pool:
+        modules = pool.apply(eval, ("sorted(__import__('sys').modules)",))
+
+    assert "pypdf" in modules or context.get_start_method() == "spawn"
+    assert not any(name == "rag" or name.startswith(("rag.", "chromadb", "langchain", "openai"))
+                   for name in modules)
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from benchmarks.fakes import HashingEmbeddings
+from rag.rag_numpy_store import NumpyVectorStore
+from rag.rag_search import mmr_select, search_settings
+
+QUERY = "graduate tuition deadline"
+# Three near copies of the best match, then distinct but still relevant texts
+TEXTS = [
+    "graduate tuition deadline is in march",
+    "graduate tuition deadline is in march each year",
+    "the graduate tuition deadline is in march",
+    "graduate housing applications open in june",
+    "tuition refunds follow the withdrawal deadline",
+    "undergraduate deadline for scholarships is january",
+]
+
+
+def test_search_settings_defaults_and_overrides():
+    assert search_settings("similarity") == {"k": 4}
+    assert search_settings("mmr", {"k": 6, "lambda_mult": 0.3}) == {"k": 6, "fetch_k": 20, "lambda_mult": 0.3}
+    assert search_settings("similarity_score_threshold", {"score_threshold": 0.7})["score_threshold"] == 0.7
+
+
+@pytest.mark.parametrize("search_type, search_kwargs", [
+    ("similarity", {"fetch_k": 40}),
+    ("similarity", {"score_threshold": 0.5}),
+    ("similarity_score_threshold", {"lambda_mult": 0.3}),
+    ("mmr", {"k": 4, "score_treshold": 0.5}),
+])
+def test_search_settings_rejects_unused_keys(search_type, search_kwargs):
+    with pytest.raises(ValueError, match=next(key for key in search_kwargs if key != "k")):
+        search_settings(search_type, search_kwargs)
+
+
+def test_search_settings_rejects_unknown_type():
+    with pytest.raises(ValueError, match="Unknown search type"):
+        search_settings("nearest")
+
+
+def embed():
+    embedding = HashingEmbeddings()
+    return np.asarray(embedding.embed_query(QUERY)), np.asarray(embedding.embed_documents(TEXTS))
+
+
+def test_mmr_with_full_relevance_ranks_by_similarity():
+    query, candidates = embed()
+    order = list(np.argsort(-(candidates @ query), kind="stable"))
+
+    assert mmr_select(query, candidates, k=len(TEXTS), lambda_mult=1.0) == order
+
+
+def test_mmr_trades_relevance_for_diversity():
+    query, candidates = embed()
+    relevant = mmr_select(query, candidates, k=3, lambda_mult=1.0)
+    diverse = mmr_select(query, candidates, k=3, lambda_mult=0.3)
+
+    # Both start from the best match
+    assert relevant[0] == diverse[0] == 0
+    assert set(relevant) == {0, 1, 2}
+    assert len(set(diverse) & {0, 1, 2}) == 1
+
+    def redundancy(selected):
+        vectors = candidates[selected]
+        return (vectors @ vectors.T)[np.triu_indices(len(selected), 1)].mean()
+
+    assert redundancy(diverse) < redundancy(relevant)
+
+
+def test_store_mmr_search_is_diverse(tmp_path):
+    store = NumpyVectorStore(str(tmp_path), HashingEmbeddings())
+    store.add_texts(TEXTS)
+
+    similar = [doc.page_content for doc in store.similarity_search(QUERY, k=3)]
+    diverse = [doc.page_content for doc in store.max_marginal_relevance_search(QUERY, k=3, fetch_k=6,
+                                                                               lambda_mult=0.3)]
+
+    assert set(similar) == set(TEXTS[:3])
+    assert diverse[0] == TEXTS[0]
+    assert len(set(diverse) & set(TEXTS[:3])) == 1
@@ -0,0 +1,112 @@
+import os
+
+import pytest
+
+from benchmarks.fakes import HashingEmbeddings, StubChatModel
+from rag import RAGLoader, RAGService, RAGVectorStore
+from rag.rag_transcript_cache import TranscriptCache
+
+
+def make_service(tmp_path, embedding=None, **vectorstore_options):
+    cache = TranscriptCache(cache_dir=str(tmp_path / "transcripts"))
+    loader = RAGLoader(source_dir=str(tmp_path / "sources"), temp_dir=str(tmp_path / "temp"),
+                       transcript_cache=cache)
+    vectorstore = RAGVectorStore(persist_directory=str(tmp_path / "index"), backend="numpy",
+                                 embedding_cache_path=str(tmp_path / "embeddings.sqlite3"),
+                                 embedding=embedding or HashingEmbeddings(), **vectorstore_options)
+    return RAGService(loader=loader, vectorstore=vectorstore, jobs_path=str(tmp_path / "jobs.json"),
+                      llm=StubChatModel(first_token_latency=0, token_latency=0, prompt_token_latency=0))
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    service = make_service(tmp_path)
+    add_video(service, 0)
+    assert service.initialize()
+    # Later generations live in their own directories
+    add_video(service, 1)
+    assert service.refresh()
+    return service
+
+
+def add_video(service, n, text=None):
+    """Source file of a video whose transcript is already cached, so nothing is downloaded"""
+    video_id = f"video{n:06d}"
+    url = f"https://www.youtube.com/watch?v={video_id}"
+    service.loader.transcript_cache.put(video_id, url, [
+        {"start": 0.0, "end": 30.0, "text": text or f"Video {n} explains admissions deadline number {n}."}
+    ])
+    path = os.path.join(service.loader.source_dir, f"youtube-{n}.txt")
+    with open(path, "w") as f:
+        f.write(url)
+    return path
+
+
+def test_running_query_keeps_its_generation(service):
+    vectorstore, chain, _ = service._acquire_generation()
+    pinned = vectorstore.index_directory
+
+    # Two swaps while the query runs
+    add_video(service, 2)
+    assert service.refresh()
+    add_video(service, 3)
+    assert service.refresh()
+
+    assert os.path.isdir(pinned)
+    assert chain.get_qa_chain()({"query": "admissions deadline"})["source_documents"]
+
+    service._release_generation(vectorstore)
+    assert not os.path.exists(pinned)
+    assert os.path.isdir(service.vectorstore.index_directory)
+
+
+def test_idle_generation_is_removed_on_swap(service):
+    previous = service.vectorstore.index_directory
+    add_video(service, 2)
+    assert service.refresh()
+    assert not os.path.exists(previous)
+    assert service.get_answer("admissions deadline", use_conversation=False)["source_documents"]
+
+
+class FailingEmbeddings(HashingEmbeddings):
+    """Fails on any batch containing the word poison"""
+
+    def embed_documents(self, texts):
+        if any("poison" in text for text in texts):
+            raise RuntimeError("embedding failed")
+        return super().embed_documents(texts)
+
+
+def test_embedding_failure_skips_only_that_source(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    service = make_service(tmp_path, FailingEmbeddings(), pipeline_options={"max_retries": 1})
+    good = add_video(service, 0)
+    bad = add_video(service, 1, text="This poison transcript cannot be embedded.")
+    other = add_video(service, 2)
+
+    assert service.initialize()
+    assert service.manifest.get(good) is not None
+    assert service.manifest.get(other) is not None
+    assert service.manifest.get(bad) is None
+    store = service.vectorstore.open()
+    assert store.ids_where("source_file", bad) == []
+    assert service.vectorstore.open_lexical().search("poison", k=5) == []
+
+
+def test_duplicate_url_sources_are_skipped(tmp_path):
+    service = make_service(tmp_path)
+    os.makedirs(service.loader.source_dir, exist_ok=True)
+    paths = []
+    for name, url in (("URL-a.txt", "https://Example.com/catalog/?b=2&a=1#fees"),
+                      ("URL-b.txt", "https://example.com/catalog?a=1&b=2"),
+                      ("URL-c.txt", "https://example.com/catalog?a=1")):
+        paths.append(os.path.join(service.loader.source_dir, name))
+        with open(paths[-1], "w") as f:
+            f.write(url)
+    sources = [{"URL": path} for path in paths]
+
+    distinct = service._distinct_sources(sources, service.manifest)
+
+    assert distinct == [sources[0], sources[2]]
+    assert service.duplicate_sources == {paths[1]: paths[0]}
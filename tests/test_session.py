@@ -0,0 +1,77 @@
+from langchain.schema import AIMessage, HumanMessage
+
+from rag.rag_context import token_count
+from rag.rag_session import RAGSession, SessionRegistry
+
+
+def turn(n, size=100):
+    return f"question {n} " + "q" * size, f"answer {n} " + "a" * size
+
+
+def test_history_window_keeps_latest_turns_within_budget():
+    session = RAGSession("s", max_history_tokens=200)
+    turns = [turn(n, size=40) for n in range(20)]
+    for question, answer in turns:
+        session.record(question, answer)
+
+    messages = session.history_messages()
+    kept = len(messages) // 2
+    assert 0 < kept < 20
+    assert session.history_tokens == sum(token_count(message.content) for message in messages) <= 200
+    # The oldest turns are dropped, the rest stay in order as question/answer pairs
+    assert [message.content for message in messages] == [text for pair in turns[-kept:] for text in pair]
+    assert all(isinstance(message, HumanMessage) for message in messages[::2])
+    assert all(isinstance(message, AIMessage) for message in messages[1::2])
+    # One more turn would not have fit
+    assert session.history_tokens + sum(token_count(text) for text in turns[-kept - 1]) > 200
+    # The display history keeps every turn
+    assert len(session.chat_history) == 20
+
+
+def test_turn_over_budget_is_not_remembered():
+    session = RAGSession("s", max_history_tokens=10)
+    session.record(*turn(0, size=400))
+
+    assert session.history_messages() == []
+    assert session.history_tokens == 0
+    assert len(session.chat_history) == 1
+
+
+def test_display_history_is_capped():
+    session = RAGSession("s", max_history_tokens=10 ** 9, max_display_bytes=1000)
+    for n in range(50):
+        session.record(*turn(n), sources=[f"source-{n}.pdf"])
+
+    assert 1 < len(session.chat_history) < 50
+    assert session.chat_history[-1][0].startswith("question 49 ")
+    assert session.display_bytes <= 1000
+    # Trimmed turns no longer count towards the session's size
+    window_bytes = sum(size for _, size, _, _ in session._window)
+    assert session.size_bytes == window_bytes + session.display_bytes
+
+
+def test_latest_turn_is_kept_when_over_budget():
+    session = RAGSession("s", max_display_bytes=10)
+    session.record(*turn(0))
+    session.record(*turn(1))
+
+    assert [question for question, _, _ in session.chat_history] == [turn(1)[0]]
+
+
+def test_active_session_stays_bounded():
+    registry = SessionRegistry(max_bytes=2000, max_display_bytes=1000, max_history_tokens=100)
+    for n in range(200):
+        registry.get("active").record(*turn(n))
+
+    session = registry.get("active")
+    assert session.size_bytes <= 1000 + 2 * len(" ".join(turn(199)).encode("utf-8"))
+    assert registry.stats()["sessions"] == 1
+
+
+def test_clear_resets_sizes():
+    session = RAGSession("s")
+    session.record(*turn(0), sources=["a.pdf"])
+    session.clear()
+
+    assert not session.chat_history
+    assert session.size_bytes == session.display_bytes == session.history_tokens == 0
@@ -0,0 +1,97 @@
+import re
+import threading
+import time
+import wave
+
+import numpy as np
+import pytest
+
+from rag.rag_transcription import SegmentedTranscriber, TranscriptionBackend, frame_energy, split_on_silence
+
+RATE = 8000
+
+
+def tone_with_gaps(seconds, gaps, rate=RATE):
+    """Loud tone with silent (start, end) gaps, as int16 samples"""
+    samples = (np.sin(np.arange(int(seconds * rate)) / 3) * 10000).astype(np.int16)
+    for start, end in gaps:
+        samples[int(start * rate):int(end * rate)] = 0
+    return samples
+
+
+def write_wav(path, samples, rate=RATE):
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(samples.astype("<i2").tobytes())
+
+
+class FakeBackend(TranscriptionBackend):
+    """Names each segment by its index; earlier segments finish last"""
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def transcribe(self, audio, filename):
+        index = int(re.search(r"segment_(\d+)", filename).group(1))
+        with self._lock:
+            self.calls.append(index)
+        time.sleep(0.05 * (5 - min(index, 5)))
+        return f" part {index} "
+
+
+def test_frame_energy_matches_full_computation():
+    samples = tone_with_gaps(3, [(1, 2)])
+    expected = np.square(samples[:len(samples) // 80 * 80].astype(np.float64)).reshape(-1, 80).mean(axis=1)
+    np.testing.assert_allclose(frame_energy(samples, 80, block_frames=7), expected, rtol=1e-5)
+
+
+def test_short_audio_is_one_segment():
+    assert split_on_silence(tone_with_gaps(5, []), RATE, max_segment_seconds=10) == [(0.0, 5.0)]
+
+
+def test_splits_at_silence_within_bounds():
+    samples = tone_with_gaps(60, [(14, 15), (31, 32), (47, 48)])
+    bounds = split_on_silence(samples, RATE, max_segment_seconds=20, min_segment_seconds=10)
+
+    assert bounds[0][0] == 0.0
+    assert bounds[-1][1] == pytest.approx(60.0)
+    for (_, end), (start, _) in zip(bounds, bounds[1:]):
+        assert end == start
+    for start, end in bounds:
+        assert end - start <= 20 + 1e-9
+    for start, end in bounds[:-1]:
+        assert end - start >= 10 - 1e-9
+    # Every cut falls inside a silent gap
+    for _, end in bounds[:-1]:
+        assert any(gap_start <= end <= gap_end for gap_start, gap_end in ((14, 15), (31, 32), (47, 48)))
+
+
+def test_transcribe_file_offsets_and_order(tmp_path):
+    path = tmp_path / "part.wav"
+    write_wav(path, tone_with_gaps(50, [(14, 15), (31, 32)]))
+    backend = FakeBackend()
+    transcriber = SegmentedTranscriber(backend, max_workers=4, max_segment_seconds=20,
+                                       min_segment_seconds=10, export_format="wav")
+
+    segments, duration = transcriber.transcribe_file(str(path), offset=100.0)
+
+    assert duration == pytest.approx(50.0)
+    assert sorted(backend.calls) == list(range(len(segments)))
+    assert [segment["text"] for segment in segments] == [f"part {n}" for n in range(len(segments))]
+    assert segments[0]["start"] == 100.0
+    assert segments[-1]["end"] == pytest.approx(150.0)
+    for previous, segment in zip(segments, segments[1:]):
+        assert previous["end"] == segment["start"]
+    for segment in segments:
+        assert segment["end"] - segment["start"] <= 20 + 1e-3
+
+
+def test_transcribe_without_offset(tmp_path):
+    path = tmp_path / "short.wav"
+    write_wav(path, tone_with_gaps(5, []))
+    transcriber = SegmentedTranscriber(FakeBackend(), export_format="wav")
+
+    assert transcriber.transcribe(str(path)) == [{"start": 0.0, "end": 5.0, "text": "part 0"}]
@@ -0,0 +1,27 @@
+from langchain.schema import Document
+
+from benchmarks.fakes import HashingEmbeddings
+from rag import RAGVectorStore
+
+
+def test_chroma_shadow_copies_open_index(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    store = RAGVectorStore(persist_directory=str(tmp_path / "index"), backend="chroma",
+                           embedding_cache_path=str(tmp_path / "embeddings.sqlite3"),
+                           embedding=HashingEmbeddings())
+    store.add_documents([Document(page_content="The admissions deadline is in March.",
+                                  metadata={"source_file": "a.txt"})])
+    assert store.open().similarity_search("admissions deadline", k=1)
+
+    # The live store stays open while its generation is copied
+    shadow = store.shadow()
+    shadow.add_documents([Document(page_content="Tuition is due in August.",
+                                   metadata={"source_file": "b.txt"})])
+    contents = [doc.page_content for doc in shadow.open().similarity_search("deadline tuition", k=4)]
+    assert "The admissions deadline is in March." in contents
+    assert "Tuition is due in August." in contents
+    assert len(store.open().similarity_search("deadline tuition", k=4)) == 1
+
+    shadow.close()
+    store.close()
+    assert store.vectordb is None
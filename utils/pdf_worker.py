@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Page extraction run in PDF worker processes
+
+Imports nothing but pypdf, so the fork server that starts the workers
+does not load the rag package and its dependencies.
+"""
+
+from typing import List, Tuple
+from pypdf import PdfReader
+
+def extract_pages(file_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """Text of pages [start, end) of a PDF"""
+    reader = PdfReader(file_path)
+    return [(number, reader.pages[number].extract_text()) for number in range(start, end)]